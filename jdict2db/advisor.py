@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Index advisor for the JMdict and KANJIDIC2 databases. It checks that the
+indexes declared in the schemas exist and runs EXPLAIN QUERY PLAN over the
+queries of the lookup module and of common searches, flagging the ones that
+scan a whole table. SQLite only.
+"""
+
+import re
+import sys
+import argparse
+from sqlalchemy import create_engine, inspect
+from . import jmdict
+from . import kanjidic
+from . import lookup
+
+#Searches that aren't part of the lookup module, by schema
+SEARCHES = {
+    'jmdict': [('gloss', 'SELECT entry_ent_seq FROM sense WHERE id IN '
+                         '(SELECT sense_id FROM gloss WHERE gloss = ?)')],
+    'kanjidic': [('reading', 'SELECT character_literal FROM reading '
+                             'WHERE reading = ?'),
+                 ('q_code', 'SELECT character_literal FROM query_code '
+                            'WHERE q_code = ?')],
+}
+
+#Older versions of SQLite say "SCAN TABLE gloss", newer ones "SCAN gloss"
+SCAN = re.compile(r'SCAN (?:TABLE )?(\w+)')
+
+
+def schemas(engine):
+    """The (name, metadata) of the schemas that engine's database holds."""
+    found = []
+    for name, module, table in (('jmdict', jmdict, 'entry'),
+                                ('kanjidic', kanjidic, 'character')):
+        if engine.dialect.has_table(engine, table):
+            found.append((name, module.metadata))
+    return found
+
+def missing_indexes(engine, metadata):
+    """The names of the indexes declared in metadata that engine lacks."""
+    inspector = inspect(engine)
+    missing = []
+    for table in metadata.sorted_tables:
+        existing = set(i['name'] for i in inspector.get_indexes(table.name))
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in existing:
+                missing.append(index.name)
+    return missing
+
+def query_suite(engine, schema):
+    """
+    A lookup for the schema, and the (name, sql, number of parameters) of
+    the queries to check, which are run through the lookup's connection.
+    """
+    queries = []
+    if schema == 'jmdict':
+        reader = lookup.Lookup(engine, use_docs=False)
+        reader.create_lookup_seq()
+        for name in sorted(reader.statements):
+            parents, children = reader.statements[name]
+            queries.append(('lookup %s parents' % name,) + parents)
+            queries.append(('lookup %s children' % name,) + children)
+        if reader.has_table(jmdict.entry_doc.name):
+            docs = lookup.Lookup(engine, use_docs=True)
+            for name in sorted(docs.statements):
+                queries.append(('lookup %s docs' % name,) +
+                               docs.statements[name])
+            docs.close()
+    else:
+        reader = lookup.KanjiLookup(engine)
+        queries.append(('lookup character', reader.character_sql, 1))
+        queries.append(('lookup character children', reader.children_sql,
+                        reader.n_children))
+    for name, sql in SEARCHES[schema]:
+        queries.append(('search %s' % name,) + reader.prepare(sql))
+    return reader, queries
+
+def explain(dbapi_conn, sql, n_params):
+    """The details of the query plan of sql."""
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * n_params)
+        #the detail is the last column whatever the version of SQLite
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def scans(details, metadata):
+    """The steps of a query plan that scan a whole table of metadata."""
+    found = []
+    for detail in details:
+        match = SCAN.match(detail)
+        if match and match.group(1) in metadata.tables:
+            found.append(detail)
+    return found
+
+def advise(db_path, verbose=False):
+    """
+    Check the database at db_path, printing a report. Returns a dict with
+    the 'missing' index names and the (query name, plan step) of the
+    'scans' found.
+    """
+    engine = create_engine(db_path, echo=False)
+    if engine.dialect.name != 'sqlite':
+        raise ValueError('The index advisor only supports SQLite')
+    report = {'missing': [], 'scans': []}
+    for schema, metadata in schemas(engine):
+        missing = missing_indexes(engine, metadata)
+        for name in missing:
+            print('Missing index %s' % name)
+        report['missing'] += missing
+
+        reader, queries = query_suite(engine, schema)
+        try:
+            for name, sql, n_params in queries:
+                found = scans(explain(reader.dbapi_conn, sql, n_params),
+                              metadata)
+                for detail in found:
+                    print('%s: %s' % (name, detail))
+                    report['scans'].append((name, detail))
+                if verbose and not found:
+                    print('%s: no scans' % name)
+        finally:
+            reader.close()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check the indexes of jmdict/kanjidic SQLite databases.')
+    parser.add_argument('db_urls', nargs='+', metavar='db_url',
+                        help='SQLAlchemy url of a database to check')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='also list the queries that are fine')
+    args = parser.parse_args()
+    problems = False
+    for db_url in args.db_urls:
+        print('Checking %s' % db_url)
+        report = advise(db_url, args.verbose)
+        problems = problems or report['missing'] or report['scans']
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+A prefix index of JMdict's headwords (kebs and rebs) for autocompletion,
+kept in a file of its own next to the database and read with mmap, so
+opening it costs nothing whatever its size.
+
+The file holds a sorted array of records (headword, priority score,
+ent_seq). The records starting with a prefix are a contiguous range of it,
+found by binary search. Ranges too large to rank on every keystroke have
+their best records precomputed, for every prefix that leads to one.
+
+All numbers are little-endian. The file is:
+
+  header    magic, version, number of records, of tops and of top ids
+  records   (key offset, key length, score, ent_seq) in key order
+  tops      (prefix offset, prefix length, first top id, number of top ids)
+            in prefix order, for the prefixes of more than DENSE records
+  top ids   indexes of records, best first
+  keys      the UTF-8 keys of the records, in order. Prefixes point into
+            the key of the first record they cover.
+
+Keys are compared as UTF-8 bytes, which sorts them by code point.
+"""
+
+import os
+import mmap
+import heapq
+import struct
+from collections import namedtuple
+from sqlalchemy.sql import select
+
+MAGIC = b'JDAC'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+RECORD = struct.Struct('<IIiI')
+TOP = struct.Struct('<IIII')
+TOP_ID = struct.Struct('<I')
+
+#Prefixes of more records than this get their best TOP_K precomputed
+DENSE = 128
+TOP_K = 20
+
+Completion = namedtuple('Completion', 'text ent_seq score')
+
+
+def rank(record):
+    """Sort key putting the best (text, score, ent_seq) records first."""
+    text, score, ent_seq = record
+    return (-score, len(text), text, ent_seq)
+
+
+class Collector(object):
+    """
+    Gathers the (text, score, ent_seq) records of the headwords as the
+    parser queues their rows.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def add_rows(self, k_ele_l, r_ele_l):
+        """
+        Add the records of rows queued by jmdict.Loader.parse_entry(), which
+        end with the priority score of their element.
+        """
+        for row in k_ele_l:
+            if row[1]:
+                self.records.append((row[1], row[-1], int(row[0])))
+        for row in r_ele_l:
+            if row[1]:
+                self.records.append((row[1], row[-1], int(row[0])))
+
+    def add_database(self, conn):
+        """Add the records of every headword in a JMdict database."""
+        from .jmdict import k_ele, r_ele
+        for table, text in ((k_ele, 'keb'), (r_ele, 'reb')):
+            for ent_seq, headword, score in conn.execute(select(
+                    [table.c.entry_ent_seq, table.c[text],
+                     table.c.priority])):
+                if headword:
+                    self.records.append((headword, score, ent_seq))
+
+
+def find_tops(keys, records, lo, hi, depth, tops):
+    """
+    Append to tops the (first record, prefix length in characters, top
+    record indexes) of the prefix of length depth shared by records lo to
+    hi, and of the longer prefixes within, as long as they cover more than
+    DENSE records.
+    """
+    if hi - lo <= DENSE:
+        return
+    best = heapq.nsmallest(TOP_K, range(lo, hi),
+                           key=lambda i: rank(records[i]))
+    tops.append((lo, depth, best))
+    start = lo
+    while start < hi:
+        if len(keys[start]) <= depth:
+            #the key that is the whole prefix sorts first and goes no deeper
+            start += 1
+            continue
+        prefix = keys[start][:depth + 1]
+        end = start + 1
+        while end < hi and keys[end][:depth + 1] == prefix:
+            end += 1
+        find_tops(keys, records, start, end, depth + 1, tops)
+        start = end
+
+def write_index(path, records):
+    """
+    Write the prefix index of the given (text, score, ent_seq) records to
+    path. The file is only replaced once complete.
+    """
+    records = sorted(set(records), key=lambda r: (r[0].encode('utf-8'),) +
+                     rank(r))
+    keys = [r[0] for r in records]
+    tops = []
+    find_tops(keys, records, 0, len(records), 0, tops)
+
+    encoded = [k.encode('utf-8') for k in keys]
+    offsets = []
+    offset = 0
+    for key in encoded:
+        offsets.append(offset)
+        offset += len(key)
+    n_top_ids = sum(len(best) for first, depth, best in tops)
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(tops),
+                            n_top_ids))
+        for (text, score, ent_seq), key, offset in zip(records, encoded,
+                                                       offsets):
+            f.write(RECORD.pack(offset, len(key), score, ent_seq))
+        first_id = 0
+        for first, depth, best in tops:
+            prefix = keys[first][:depth].encode('utf-8')
+            f.write(TOP.pack(offsets[first], len(prefix), first_id,
+                             len(best)))
+            first_id += len(best)
+        for first, depth, best in tops:
+            for i in best:
+                f.write(TOP_ID.pack(i))
+        for key in encoded:
+            f.write(key)
+    os.replace(path + '.tmp', path)
+
+
+class Completer(object):
+    """Completes prefixes with the headwords indexed by write_index()."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_records, self.n_tops, n_top_ids = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError('%s is not an autocomplete index' % path)
+        self.records_at = HEADER.size
+        self.tops_at = self.records_at + self.n_records * RECORD.size
+        self.top_ids_at = self.tops_at + self.n_tops * TOP.size
+        self.keys_at = self.top_ids_at + n_top_ids * TOP_ID.size
+
+    def close(self):
+        self.mm.close()
+
+    def key(self, i):
+        offset, length = RECORD.unpack_from(
+            self.mm, self.records_at + i * RECORD.size)[:2]
+        return self.mm[self.keys_at + offset:self.keys_at + offset + length]
+
+    def top_prefix(self, i):
+        offset, length, first, count = TOP.unpack_from(
+            self.mm, self.tops_at + i * TOP.size)
+        return self.mm[self.keys_at + offset:self.keys_at + offset + length]
+
+    def completion(self, i):
+        offset, length, score, ent_seq = RECORD.unpack_from(
+            self.mm, self.records_at + i * RECORD.size)
+        text = self.mm[self.keys_at + offset:
+                       self.keys_at + offset + length].decode('utf-8')
+        return Completion(text, ent_seq, score)
+
+    def bisect(self, key, n, item):
+        """The first index below n whose key(index) isn't below item."""
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(mid) < item:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def complete(self, prefix, k=10):
+        """
+        The best k completions of prefix, by priority score, then shortest
+        first. A headword of several entries is returned once for each.
+        """
+        encoded = prefix.encode('utf-8')
+        lo = self.bisect(self.key, self.n_records, encoded)
+        #0xff never appears in UTF-8, so this is past every key with prefix
+        hi = self.bisect(self.key, self.n_records, encoded + b'\xff')
+        if hi - lo > DENSE and k <= TOP_K:
+            top = self.bisect(self.top_prefix, self.n_tops, encoded)
+            if top < self.n_tops and self.top_prefix(top) == encoded:
+                offset, length, first, count = TOP.unpack_from(
+                    self.mm, self.tops_at + top * TOP.size)
+                ids = [TOP_ID.unpack_from(self.mm, self.top_ids_at +
+                                          j * TOP_ID.size)[0]
+                       for j in range(first, first + min(k, count))]
+                return [self.completion(i) for i in ids]
+        completions = [self.completion(i) for i in range(lo, hi)]
+        return heapq.nsmallest(k, completions,
+                               key=lambda c: rank((c.text, c.score,
+                                                   c.ent_seq)))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+A bitmap index of KANJIDIC2 characters for radical, stroke count and SKIP
+lookups. Each value of each attribute (ATTRIBUTES) has a bitset of the
+characters that have it, bit i standing for the i-th character in order of
+literal. A search for a combination of values is then a few bitwise ANDs
+and ORs of Python ints, however many tables the values come from.
+
+The bitsets are computed from the tables of a KANJIDIC2 database and can be
+stored in its kanji_bitmap table (kanjidic.fill_database(bitmaps=True)),
+deflated, so loading them is a single query. The literals themselves are
+stored in the row of the 'literal' attribute, as one string.
+"""
+
+import zlib
+from collections import defaultdict
+from sqlalchemy.sql import select, func
+from . import bulk
+from .kanjidic import character, stroke_count, rad_value, query_code, \
+                      kanji_bitmap, bitmap_metadata
+
+#The first stroke count of a character is the right one, the others are
+#common miscounts
+_first_stroke_count = select([func.min(stroke_count.c.id)]).group_by(
+    stroke_count.c.character_literal)
+
+#The (literal, value) query of each attribute
+ATTRIBUTES = {
+    'radical': select([rad_value.c.character_literal, rad_value.c.rad_value])
+               .where(rad_value.c.rad_type == 'classical'),
+    'nelson_radical': select([rad_value.c.character_literal,
+                              rad_value.c.rad_value])
+                      .where(rad_value.c.rad_type == 'nelson_c'),
+    'strokes': select([stroke_count.c.character_literal,
+                       stroke_count.c.stroke_count])
+               .where(stroke_count.c.id.in_(_first_stroke_count)),
+    'grade': select([character.c.literal, character.c.grade])
+             .where(character.c.grade != None),
+    'jlpt': select([character.c.literal, character.c.jlpt])
+            .where(character.c.jlpt != None),
+    #misclassified codes included, as people look characters up by them
+    'skip': select([query_code.c.character_literal, query_code.c.q_code])
+            .where(query_code.c.qc_type == 'skip'),
+}
+
+
+def compute(conn):
+    """
+    The literals of the characters in conn's database, in order, and the
+    bitsets of every (attribute, value), values being strings.
+    """
+    literals = [row[0] for row in conn.execute(
+        select([character.c.literal]).order_by(character.c.literal))]
+    positions = dict((literal, i) for i, literal in enumerate(literals))
+    bitsets = defaultdict(int)
+    for attribute, query in ATTRIBUTES.items():
+        for literal, value in conn.execute(query):
+            bitsets[attribute, str(value)] |= 1 << positions[literal]
+    return literals, dict(bitsets)
+
+def encode(bits):
+    return zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8,
+                                       'little'))
+
+def decode(blob):
+    return int.from_bytes(zlib.decompress(blob), 'little')
+
+def create_table(conn):
+    """Compute the bitsets of conn's database and store them."""
+    bulk.create_tables(conn, bitmap_metadata)
+    conn.execute(kanji_bitmap.delete())
+    literals, bitsets = compute(conn)
+    rows = [{'attribute': 'literal', 'value': '',
+             'bits': ''.join(literals).encode('utf-8')}]
+    for (attribute, value), bits in bitsets.items():
+        rows.append({'attribute': attribute, 'value': value,
+                     'bits': encode(bits)})
+    conn.execute(kanji_bitmap.insert(), rows)
+
+
+class KanjiIndex(object):
+    """
+    Searches the characters of a KANJIDIC2 database by ATTRIBUTES. The
+    bitsets are loaded from the kanji_bitmap table if there is one, and
+    computed from the other tables otherwise.
+    """
+
+    def __init__(self, conn):
+        if conn.dialect.has_table(conn, kanji_bitmap.name):
+            self.bitsets = {}
+            for attribute, value, blob in conn.execute(
+                    select([kanji_bitmap])):
+                if attribute == 'literal':
+                    self.literals = list(bytes(blob).decode('utf-8'))
+                else:
+                    self.bitsets[attribute, value] = decode(blob)
+        else:
+            self.literals, self.bitsets = compute(conn)
+        self.values = defaultdict(list)
+        for attribute, value in self.bitsets:
+            self.values[attribute].append(value)
+
+    def bits(self, attribute, values):
+        """
+        The bitset of the characters with the given value of attribute, or
+        with any of them if values is a list, tuple, set or range.
+        """
+        if attribute not in ATTRIBUTES:
+            raise ValueError('Unknown attribute %s' % attribute)
+        if not isinstance(values, (list, tuple, set, frozenset, range)):
+            values = [values]
+        bits = 0
+        for value in values:
+            bits |= self.bitsets.get((attribute, str(value)), 0)
+        return bits
+
+    def match(self, criteria):
+        """The bitset of the characters matching every one of criteria."""
+        bits = (1 << len(self.literals)) - 1
+        for attribute, values in criteria.items():
+            bits &= self.bits(attribute, values)
+        return bits
+
+    def search(self, **criteria):
+        """
+        The literals of the characters matching all the criteria, in order
+        of literal. Each criterion is an attribute and a value or a list of
+        values, any of which matches, e.g.
+        search(radical=85, strokes=range(7, 10), skip=['1-3-5', '1-3-6']).
+        """
+        #the positions of the 1s in the binary digits, last digit first
+        digits = bin(self.match(criteria))[:1:-1]
+        literals = []
+        i = digits.find('1')
+        while i != -1:
+            literals.append(self.literals[i])
+            i = digits.find('1', i + 1)
+        return literals
+
+    def count(self, **criteria):
+        """The number of characters search() would return."""
+        return bin(self.match(criteria)).count('1')
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Builds the JMdict and KANJIDIC2 databases together, each in a process of
+its own, so a build takes about as long as the JMdict one alone. The
+processes never write to the same database: SQLite only lets one writer in
+at a time, so with a single target KANJIDIC2 is built next to it and merged
+in once both are done. Optionally the kanji_entry table of crossref.py is
+built last. A report of the time each step took is printed at the end.
+"""
+
+import os
+import time
+import queue
+import argparse
+import traceback
+import multiprocessing
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.schema import CreateTable
+from . import bulk
+from . import fts
+from . import jmdict
+from . import kanjidic
+from . import crossref
+
+MODULES = {'jmdict': jmdict, 'kanjidic': kanjidic}
+
+#Seconds between checks that the build processes are still alive
+POLL_SECONDS = 1
+
+
+def sqlite_path(db_url):
+    """The file of an SQLite url, None for other databases."""
+    url = make_url(db_url)
+    if url.drivername.startswith('sqlite') and url.database:
+        return url.database
+    return None
+
+def _build(name, db_url, options, results):
+    """Fill a database in a worker process, reporting how it went."""
+    start = time.time()
+    try:
+        MODULES[name].fill_database(db_url, **options)
+        results.put((name, time.time() - start, None))
+    except BaseException:
+        results.put((name, time.time() - start, traceback.format_exc()))
+
+def build_parallel(builds):
+    """
+    Run the (name, database url, fill_database() options) builds at the
+    same time, one process each. Returns the seconds each one took, by name.
+    A build that fails, or whose process dies without reporting back (e.g.
+    killed for lack of memory), makes it raise RuntimeError once the others
+    are done.
+    """
+    results = multiprocessing.Queue()
+    processes = {}
+    for name, db_url, options in builds:
+        process = multiprocessing.Process(target=_build,
+                                          args=(name, db_url, options,
+                                                results))
+        process.start()
+        processes[name] = process
+    times = {}
+    errors = []
+    pending = set(processes)
+    while pending:
+        try:
+            name, seconds, error = results.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            dead = [n for n in sorted(pending)
+                    if processes[n].exitcode is not None]
+            if not dead:
+                continue
+            #a result put just before exiting may only be readable now
+            try:
+                name, seconds, error = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                for name in dead:
+                    errors.append('%s build exited with code %s without '
+                                  'reporting back' %
+                                  (name, processes[name].exitcode))
+                    pending.discard(name)
+                continue
+        pending.discard(name)
+        times[name] = seconds
+        if error is not None:
+            errors.append('%s build failed:\n%s' % (name, error))
+    for process in processes.values():
+        process.join()
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    return times
+
+def merge(db_url, source_path, full_text=False):
+    """
+    Copy the KANJIDIC2 tables of the SQLite database at source_path into
+    the one at db_url, which gets a new generation id. The FTS table of the
+    meanings is built again if full_text is set.
+    """
+    conn = create_engine(db_url, echo=False).connect()
+    try:
+        conn.execute(text("ATTACH DATABASE :path AS merged"),
+                     path=source_path)
+        with conn.begin():
+            new_tables = []
+            for table in (kanjidic.metadata.sorted_tables +
+                          kanjidic.bitmap_metadata.sorted_tables):
+                if table is kanjidic.build_info or not \
+                        conn.dialect.has_table(conn, table.name,
+                                               schema='merged'):
+                    continue
+                if not conn.dialect.has_table(conn, table.name):
+                    #indexes are built once the rows are in
+                    conn.execute(CreateTable(table))
+                    new_tables.append(table)
+                conn.execute(text('INSERT INTO main.%s SELECT * FROM '
+                                  'merged.%s' % (table.name, table.name)))
+            bulk.create_indexes(conn, new_tables)
+            bulk.new_generation(conn, jmdict.build_info)
+            if full_text:
+                fts.create_tables(conn, fts.KANJIDIC)
+        conn.execute(text('DETACH DATABASE merged'))
+    finally:
+        conn.close()
+
+def build(jmdict_db=None, kanjidic_db=None, single_db=None, link=False,
+          jmdict_options=None, kanjidic_options=None):
+    """
+    Build the JMdict database at jmdict_db and the KANJIDIC2 one at
+    kanjidic_db in parallel, or both into single_db, which has to be
+    SQLite. With link=True, the kanji_entry table of crossref.py is added
+    to the JMdict database. The options are the fill_database() arguments
+    of each dictionary, full_text applying to the merged KANJIDIC2 tables
+    too. Returns the seconds each step took, by name, and 'total'.
+    """
+    start = time.time()
+    jmdict_options = dict(jmdict_options or {})
+    kanjidic_options = dict(kanjidic_options or {})
+    merge_path = None
+    if single_db is not None:
+        path = sqlite_path(single_db)
+        if path is None:
+            raise ValueError('Building into one database needs SQLite')
+        merge_path = path + '.kanjidic'
+        if os.path.exists(merge_path):
+            os.remove(merge_path)
+        jmdict_db = single_db
+        kanjidic_db = 'sqlite:///' + merge_path
+        #the FTS table has to be made where the rows end up
+        full_text = kanjidic_options.pop('full_text', False)
+    times = build_parallel([('jmdict', jmdict_db, jmdict_options),
+                            ('kanjidic', kanjidic_db, kanjidic_options)])
+    if merge_path is not None:
+        step = time.time()
+        merge(single_db, merge_path, full_text)
+        os.remove(merge_path)
+        times['merge'] = time.time() - step
+    if link:
+        step = time.time()
+        crossref.link_databases(jmdict_db, None if merge_path else
+                                kanjidic_db)
+        times['link'] = time.time() - step
+    times['total'] = time.time() - start
+    report(times)
+    return times
+
+def report(times):
+    """Print the seconds each step took and how long it all took."""
+    print('Build times:')
+    steps = [n for n in ('jmdict', 'kanjidic', 'merge', 'link')
+             if n in times]
+    for name in steps:
+        print('  %-10s %8.2f s' % (name, times[name]))
+    print('  %-10s %8.2f s (the steps add up to %.2f s)' %
+          ('total', times['total'], sum(times[n] for n in steps)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the JMdict and KANJIDIC2 databases in parallel.')
+    parser.add_argument('--jmdict-url', default='sqlite:///jmdict.sqlite',
+                        help='SQLAlchemy url of the JMdict database '
+                             '(default: "jmdict.sqlite" here)')
+    parser.add_argument('--kanjidic-url', default='sqlite:///kanjidic.sqlite',
+                        help='SQLAlchemy url of the KANJIDIC2 database '
+                             '(default: "kanjidic.sqlite" here)')
+    parser.add_argument('--single', metavar='URL',
+                        help='build both into this SQLite database instead')
+    parser.add_argument('--link', action='store_true',
+                        help='also link the kanji to the words they appear '
+                             'in (see crossref.py)')
+    parser.add_argument('--durability', choices=sorted(bulk.DURABILITY_LEVELS),
+                        default=bulk.DEFAULT_DURABILITY,
+                        help='SQLite safety level used during the builds')
+    parser.add_argument('--raw-insert', action='store_true',
+                        help="insert rows with the database driver's "
+                             "executemany() instead of SQLAlchemy")
+    parser.add_argument('--processes', type=int, default=1, metavar='N',
+                        help='parse JMdict with N processes (a gzipped '
+                             'one is decompressed to a temporary file first)')
+    parser.add_argument('--fts', action='store_true',
+                        help='add SQLite FTS5 full-text indexes')
+    parser.add_argument('--jmdict', metavar='PATH',
+                        help='JMdict file to use (default: download it to '
+                             '%s)' % jmdict.JMDICT_PATH)
+    parser.add_argument('--kanjidic', metavar='PATH',
+                        help='KANJIDIC2 file to use (default: download it '
+                             'to %s)' % kanjidic.KANJIDIC2_PATH)
+    args = parser.parse_args()
+
+    if args.single:
+        targets = [args.single]
+    else:
+        targets = [args.jmdict_url, args.kanjidic_url]
+    for db_url in targets:
+        path = sqlite_path(db_url)
+        if path is not None and os.path.exists(path):
+            print('Overwriting existing database named %s' % path)
+            os.remove(path)
+    if args.jmdict is None:
+        jmdict.download_dictionary()
+    if args.kanjidic is None:
+        kanjidic.download_dictionary()
+    common = {'durability': args.durability, 'raw': args.raw_insert,
+              'full_text': args.fts}
+    jmdict_options = dict(common, processes=args.processes,
+                          source=args.jmdict)
+    kanjidic_options = dict(common, source=args.kanjidic)
+    build(args.jmdict_url, args.kanjidic_url, args.single, args.link,
+          jmdict_options, kanjidic_options)
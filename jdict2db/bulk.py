@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""Helpers shared by the dictionary loaders to speed up bulk insertion."""
+
+import time
+import uuid
+import queue
+import threading
+from sqlalchemy import create_engine, text, Table, Column, String
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.schema import CreateTable
+
+#SQLite settings used while a database is being built, by durability level.
+#'full' keeps SQLite's crash-safe defaults and only relies on batching the
+#inserts into transactions. 'off' is the fastest, but a crash during the
+#build can leave a corrupt file behind (which is rebuilt anyway).
+DURABILITY_LEVELS = {
+    'full': {},
+    'normal': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+    'off': {'journal_mode': 'OFF', 'synchronous': 'OFF'},
+}
+DEFAULT_DURABILITY = 'normal'
+
+#Parameter markers of the DB-API paramstyles the raw insert path supports.
+#'named' drivers need dicts, so they go through SQLAlchemy instead.
+PLACEHOLDERS = {
+    'qmark': lambda i: '?',
+    'format': lambda i: '%s',
+    'pyformat': lambda i: '%s',
+    'numeric': lambda i: ':%d' % (i + 1),
+}
+
+#Settings that don't affect durability, so they are used at every level.
+#A negative cache_size is in KiB, so this is a ~200MB page cache.
+BUILD_PRAGMAS = [('cache_size', -200000),
+                 ('temp_store', 'MEMORY')]
+
+
+def tune_sqlite(conn, durability=DEFAULT_DURABILITY):
+    """
+    Apply the build PRAGMAs for the given durability level to conn.
+    Returns the previous values so restore_sqlite() can put them back.
+    Does nothing for databases other than SQLite.
+    """
+    if conn.dialect.name != 'sqlite':
+        return []
+    pragmas = BUILD_PRAGMAS + sorted(DURABILITY_LEVELS[durability].items())
+    previous = []
+    for name, value in pragmas:
+        previous.append((name, conn.execute(text('PRAGMA %s' % name)).scalar()))
+        conn.execute(text('PRAGMA %s = %s' % (name, value)))
+    return previous
+
+def restore_sqlite(conn, previous):
+    """Undo tune_sqlite(). Must be called outside of a transaction."""
+    for name, value in reversed(previous):
+        conn.execute(text('PRAGMA %s = %s' % (name, value)))
+
+def engine_options(db_path, background=False):
+    """
+    Extra create_engine() arguments for a build. A background writer uses
+    the connection from another thread than the one that opened it, which
+    SQLite's driver refuses by default.
+    """
+    if background and make_url(db_path).drivername.startswith('sqlite'):
+        return {'connect_args': {'check_same_thread': False}}
+    return {}
+
+def create_tables(conn, metadata):
+    """
+    Create the tables of metadata that don't exist yet, but none of their
+    indexes: maintaining them during the load is much slower than building
+    them afterwards with create_indexes(). Returns the tables created.
+    """
+    created = []
+    for table in metadata.sorted_tables:
+        if not conn.dialect.has_table(conn, table.name):
+            conn.execute(CreateTable(table))
+            created.append(table)
+    return created
+
+def create_indexes(conn, tables):
+    """Build the indexes of the given tables, reporting the time of each."""
+    for table in tables:
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            start = time.time()
+            index.create(conn)
+            print('Created index %s in %.2f seconds' % (index.name,
+                                                        time.time() - start))
+
+def build_info_table(metadata):
+    """
+    Add to metadata the table holding facts about the build as name/value
+    pairs, like its generation id.
+    """
+    return Table('build_info', metadata,
+                 Column('name', String, primary_key=True),
+                 Column('value', String))
+
+def new_generation(conn, build_info):
+    """
+    Give the database a new generation id, recorded in the build_info
+    table. Readers compare it to the one they last saw to know that data
+    they cached is out of date. Returns the id.
+    """
+    generation = uuid.uuid4().hex
+    conn.execute(build_info.delete().where(build_info.c.name == 'generation'))
+    conn.execute(build_info.insert(), {'name': 'generation',
+                                       'value': generation})
+    return generation
+
+def insert_columns(table):
+    """
+    Columns that rows for table supply values for, in table order. The
+    autoincrementing 'id' primary key is left for the database to assign.
+    """
+    return [c.name for c in table.c if c.name != 'id']
+
+def raw_insert_sql(dialect, table):
+    """
+    Build a plain INSERT statement for table in the paramstyle of the
+    dialect's driver, or return None if it can't take positional parameters.
+    """
+    paramstyle = dialect.dbapi.paramstyle
+    if paramstyle not in PLACEHOLDERS:
+        return None
+    quote = dialect.identifier_preparer.quote
+    columns = insert_columns(table)
+    markers = [PLACEHOLDERS[paramstyle](i) for i in range(len(columns))]
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (quote(table.name),
+                                                ', '.join(map(quote, columns)),
+                                                ', '.join(markers))
+
+def save_all(conn, all_l, raw=False, statements=None):
+    """
+    Insert and empty each pending table_l list of all_l. Rows are tuples in
+    insert_columns() order. With raw=True they are sent straight to the
+    driver's cursor.executemany(), skipping SQLAlchemy's per-row statement
+    compilation and parameter processing. Otherwise they have to be turned
+    into dicts for insert().
+
+    statements is a dict kept by the caller to reuse the raw INSERT
+    statements from one call to the next, by dialect, paramstyle and table.
+    """
+    if statements is None:
+        statements = {}
+    cursor = None
+    for table_l, insert in all_l:
+        if len(table_l) == 0:
+            continue
+        sql = None
+        if raw:
+            key = (conn.dialect.name, conn.dialect.dbapi.paramstyle,
+                   insert.table.name)
+            if key not in statements:
+                statements[key] = raw_insert_sql(conn.dialect, insert.table)
+            sql = statements[key]
+        if sql is None:
+            columns = insert_columns(insert.table)
+            conn.execute(insert, [dict(zip(columns, row)) for row in table_l])
+        else:
+            if cursor is None:
+                cursor = conn.connection.cursor()
+            cursor.executemany(sql, table_l)
+        del table_l[:]  #empty the list after committing it
+    if cursor is not None:
+        cursor.close()
+
+
+class Checkpointer(object):
+    """
+    Wraps the inserts of a build in explicit transactions instead of letting
+    every flush autocommit. With every=0 the whole build is one transaction,
+    otherwise a commit is done once at least `every` entries were flushed.
+    """
+
+    def __init__(self, conn, every=0):
+        self.conn = conn
+        self.every = every
+        self.pending = 0
+        self.trans = conn.begin()
+
+    def flushed(self, n_entries):
+        """Record that n_entries were saved, committing if one is due."""
+        self.pending += n_entries
+        if self.every and self.pending >= self.every:
+            self.trans.commit()
+            self.trans = self.conn.begin()
+            self.pending = 0
+
+    def commit(self):
+        self.trans.commit()
+        self.trans = None
+
+    def rollback(self):
+        if self.trans is not None:
+            self.trans.rollback()
+            self.trans = None
+
+
+class Writer(object):
+    """
+    Saves the rows queued in all_l whenever the loader calls flush(), inside
+    the transactions of a Checkpointer.
+    """
+
+    def __init__(self, conn, all_l, raw=False, commit_every=0):
+        self.conn = conn
+        self.all_l = all_l
+        self.raw = raw
+        self.statements = {}
+        self.checkpoint = Checkpointer(conn, commit_every)
+
+    def flush(self, n_entries):
+        """Save the rows queued for the last n_entries entries."""
+        self.save(self.all_l, n_entries)
+
+    def save(self, all_l, n_entries):
+        save_all(self.conn, all_l, self.raw, self.statements)
+        self.checkpoint.flushed(n_entries)
+
+    def finish(self):
+        """Save the leftover rows and commit."""
+        self.flush(0)
+        self.checkpoint.commit()
+
+    def abort(self):
+        self.checkpoint.rollback()
+
+
+class BackgroundWriter(Writer):
+    """
+    A Writer that saves on its own thread, so the database I/O overlaps with
+    parsing. flush() hands the queued rows over and returns right away,
+    unless max_pending batches are already waiting, in which case it blocks
+    until the writer catches up.
+
+    An error on the writer thread is raised again by the next call to
+    flush() or finish(). Once one happened, the remaining batches are
+    dropped so that a blocked flush() can't wait forever.
+    """
+
+    def __init__(self, conn, all_l, raw=False, commit_every=0, max_pending=2):
+        Writer.__init__(self, conn, all_l, raw, commit_every)
+        self.inserts = [insert for table_l, insert in all_l]
+        self.batches = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            if self.error is not None:
+                continue
+            rows, n_entries = batch
+            try:
+                self.save(list(zip(rows, self.inserts)), n_entries)
+            except BaseException as e:
+                self.error = e
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def flush(self, n_entries):
+        self.check()
+        rows = []
+        for table_l, insert in self.all_l:
+            rows.append(table_l[:])
+            del table_l[:]
+        self.batches.put((rows, n_entries))
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.batches.put(None)
+            self.thread.join()
+
+    def finish(self):
+        self.flush(0)
+        self.stop()
+        self.check()
+        self.checkpoint.commit()
+
+    def abort(self):
+        self.stop()
+        Writer.abort(self)
+
+
+class Loader(object):
+    """
+    Base of the loaders of jmdict.py and kanjidic.py. A loader holds
+    everything a build needs: its connection, the rows pending for each
+    table, the batch size and the counts of what it loaded. Nothing is
+    shared between loaders, so several can run in one process, one after
+    the other or each on a thread of its own.
+
+    Subclasses list their tables in `tables` and their schema in
+    `metadata`. The rows pending for a table are kept in the attribute
+    named after it (k_ele_l for k_ele) and in all_l, a list of
+    [table_l, table.insert()] pairs in the order of tables, which is what
+    save_all() and the writers take. Rows are tuples holding a value for
+    each of insert_columns(table), which is far smaller than a dict per row.
+    """
+
+    tables = []
+    metadata = None
+    #Number of elements whose rows are queued before they are saved. Fewer
+    #commits with more data is much faster.
+    n_to_save = 5000
+
+    def __init__(self, raw=False, n_to_save=None):
+        self.raw = raw
+        if n_to_save is not None:
+            self.n_to_save = n_to_save
+        self.all_l = []
+        for table in self.tables:
+            table_l = []
+            setattr(self, table.name + '_l', table_l)
+            self.all_l.append([table_l, table.insert()])
+        self.conn = None
+        self.writer = None
+        self.exporter = None
+        self.previous_pragmas = []
+        #raw INSERT statements of save_all(), the writers keep their own
+        self.statements = {}
+        #elements parsed, rows written by table and seconds the builds took
+        self.metrics = {'elements': 0,
+                        'rows': dict((t.name, 0) for t in self.tables),
+                        'seconds': 0.0}
+
+    def connect(self, db_path, background=False):
+        """Open the connection to the database at db_path."""
+        engine = create_engine(db_path, echo=False,
+                               **engine_options(db_path, background))
+        self.conn = engine.connect()
+
+    def start(self, durability=DEFAULT_DURABILITY, background=False,
+              commit_every=0):
+        """
+        Get the database ready for the rows: tune it, create the missing
+        tables and the writer that saves the rows. Returns the tables created,
+        whose indexes are left to be built at the end.
+        """
+        self.previous_pragmas = tune_sqlite(self.conn, durability)
+        new_tables = create_tables(self.conn, self.metadata)
+        if background:
+            self.writer = BackgroundWriter(self.conn, self.all_l, self.raw,
+                                           commit_every)
+        else:
+            self.writer = Writer(self.conn, self.all_l, self.raw,
+                                 commit_every)
+        return new_tables
+
+    def save_all(self):
+        """Insert the queued rows right away, outside of the writer."""
+        save_all(self.conn, self.all_l, self.raw, self.statements)
+
+    def collect(self):
+        """
+        Called with the rows of each batch before they are saved, for what
+        else is built from them. They must be left in place.
+        """
+        if self.exporter is not None:
+            self.exporter.add()
+
+    def flush(self, n_elements):
+        """Hand the rows queued for the last n_elements to the writer."""
+        self.collect()
+        rows = self.metrics['rows']
+        for table_l, insert in self.all_l:
+            rows[insert.table.name] += len(table_l)
+        self.metrics['elements'] += n_elements
+        self.writer.flush(n_elements)
+
+    def finish_writing(self, n_elements=0):
+        """Save the rows of the last n_elements left over and commit."""
+        self.flush(n_elements)
+        self.writer.finish()
+
+    def abort(self):
+        """Roll back what the writer didn't commit and drop the exports."""
+        if self.writer is not None:
+            self.writer.abort()
+        if self.exporter is not None:
+            self.exporter.abort()
+
+    def close(self):
+        """
+        Restore the SQLite settings start() changed and disconnect. Rows
+        still queued after a failed build are dropped, so the loader can be
+        used again.
+        """
+        for table_l, insert in self.all_l:
+            del table_l[:]
+        if self.conn is None:
+            return
+        try:
+            restore_sqlite(self.conn, self.previous_pragmas)
+        finally:
+            self.conn.close()
+            self.conn = None
+            self.writer = None
+            self.exporter = None
+            self.previous_pragmas = []
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+An in-process LRU cache for the entries and characters assembled by the
+lookup module. Lookups are heavily skewed towards the common words, so a few
+thousand cached entries serve most requests.
+"""
+
+import sys
+from collections import OrderedDict
+
+
+def approximate_size(obj):
+    """
+    The approximate memory used by obj and everything it holds, in bytes.
+    Follows lists, tuples, dicts and the attributes of slot-based objects.
+    Strings shared between objects are counted once per reference.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, (list, tuple)):
+        return size + sum(approximate_size(o) for o in obj)
+    if isinstance(obj, dict):
+        return size + sum(approximate_size(k) + approximate_size(v)
+                          for k, v in obj.items())
+    for name in getattr(type(obj), '__slots__', ()):
+        size += approximate_size(getattr(obj, name, None))
+    return size
+
+
+class LRUCache(object):
+    """
+    Holds up to max_items values, and up to max_bytes of them as measured
+    by approximate_size() if that is set. Past either bound the least
+    recently used values are evicted.
+
+    Cached values are handed out as they are, so they must be treated as
+    read-only. The cache belongs to one build of the database: validate()
+    empties it when it sees another generation id (see
+    bulk.new_generation). Not thread safe.
+    """
+
+    def __init__(self, max_items=10000, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """The value cached for key, or default. Counts a hit or a miss."""
+        try:
+            value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self.items:
+            self.remove(key)
+        self.items[key] = value
+        if self.max_bytes is not None:
+            self.sizes[key] = approximate_size(value)
+            self.size += self.sizes[key]
+        while self.items and (
+                (self.max_items is not None and
+                 len(self.items) > self.max_items) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+            self.remove(next(iter(self.items)))
+            self.evictions += 1
+
+    def remove(self, key):
+        del self.items[key]
+        self.size -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        self.items.clear()
+        self.sizes.clear()
+        self.size = 0
+
+    def validate(self, generation):
+        """Empty the cache if it holds values of another generation."""
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+    def stats(self):
+        """The counters of the cache and its current size."""
+        lookups = self.hits + self.misses
+        return {'items': len(self.items),
+                'bytes': self.size if self.max_bytes is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0}
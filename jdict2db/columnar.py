@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Export of the JMdict and KANJIDIC2 tables to columnar files, one per table,
+for analysis tools that only read a few columns: Parquet, or Arrow IPC
+files that can be memory-mapped. Needs pyarrow.
+
+The rows are written in record batches as the parser queues them, alongside
+the database build. Each file has the columns of its table, including the
+'id' primary key, numbered the way the database numbers the rows of a new
+build, so the foreign keys between files hold. Columns with few distinct
+values (DICTIONARY_COLUMNS) are dictionary-encoded.
+"""
+
+import os
+from sqlalchemy import Integer, Boolean, LargeBinary
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+#Columns holding a small set of tags or codes, whatever their table
+DICTIONARY_COLUMNS = set(['ke_inf', 'ke_pri', 're_inf', 're_pri', 'pos',
+                          'field', 'misc', 'dial', 'lang', 'ls_type',
+                          'g_gend', 'var_type', 'dr_type', 'qc_type',
+                          'skip_misclass', 'cp_type', 'rad_type', 'r_type',
+                          'on_type', 'r_status', 'm_lang'])
+
+
+def available():
+    """Whether pyarrow can be imported."""
+    return pyarrow is not None
+
+def arrow_type(column):
+    """The Arrow type of the values of an SQLAlchemy column."""
+    if column.name in DICTIONARY_COLUMNS:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, LargeBinary):
+        return pyarrow.binary()
+    return pyarrow.string()
+
+
+class TableFile(object):
+    """The file a table is exported to, written one batch at a time."""
+
+    def __init__(self, path, table, format):
+        self.path = path
+        #the id comes first, so it goes in front of the values of a row
+        self.columns = list(table.c)
+        self.has_id = 'id' in table.c
+        self.next_id = 1
+        #every value seen so far in each dictionary-encoded column, so the
+        #dictionary of a batch only ever grows from that of the one before
+        self.dictionaries = {}
+        self.schema = pyarrow.schema([(c.name, arrow_type(c))
+                                      for c in self.columns])
+        if format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.path + '.tmp',
+                                                        self.schema)
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pyarrow.ipc.new_file(self.path + '.tmp',
+                                               self.schema, options=options)
+
+    def array(self, column, values):
+        if column.name in DICTIONARY_COLUMNS:
+            dictionary = self.dictionaries.setdefault(column.name, {})
+            indices = []
+            for value in values:
+                if value is None:
+                    indices.append(None)
+                else:
+                    indices.append(dictionary.setdefault(value,
+                                                         len(dictionary)))
+            return pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(indices, pyarrow.int32()),
+                pyarrow.array(list(dictionary), pyarrow.string()))
+        if isinstance(column.type, Integer):
+            #the parser leaves numbers as the text of the file
+            values = [None if v is None else int(v) for v in values]
+        return pyarrow.array(values, arrow_type(column))
+
+    def write(self, rows):
+        """Write rows, tuples in bulk.insert_columns() order, as a batch."""
+        if not rows:
+            return
+        values = [list(v) for v in zip(*rows)]
+        if self.has_id:
+            values.insert(0, range(self.next_id, self.next_id + len(rows)))
+            self.next_id += len(rows)
+        arrays = [self.array(c, v) for c, v in zip(self.columns, values)]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(
+            arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.path + '.tmp')
+
+
+class Exporter(object):
+    """
+    Writes the rows queued in all_l for the tables of metadata to files
+    named after the tables in directory. format is a key of FORMATS. The
+    files only replace earlier exports once complete.
+    """
+
+    def __init__(self, directory, all_l, metadata, format='parquet'):
+        if pyarrow is None:
+            raise ImportError('Exporting tables needs pyarrow')
+        if format not in FORMATS:
+            raise ValueError('Unknown export format %s' % format)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.all_l = all_l
+        self.files = []
+        try:
+            for table_l, insert in all_l:
+                table = insert.table
+                if table.name not in metadata.tables:
+                    self.files.append(None)
+                    continue
+                path = os.path.join(directory, table.name + FORMATS[format])
+                self.files.append(TableFile(path, table, format))
+        except:
+            self.abort()
+            raise
+
+    def add(self):
+        """
+        Write the rows queued in all_l, leaving them there for the
+        database writer.
+        """
+        for (table_l, insert), table_file in zip(self.all_l, self.files):
+            if table_file is not None:
+                table_file.write(table_l)
+
+    def finish(self):
+        for table_file in self.files:
+            if table_file is not None:
+                table_file.close()
+
+    def abort(self):
+        for table_file in self.files:
+            if table_file is not None:
+                table_file.abort()
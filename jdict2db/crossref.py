@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+The kanji_entry table, linking the KANJIDIC2 characters to the JMdict
+entries whose kebs they appear in, so that finding the words written with a
+kanji doesn't need a LIKE scan over every keb.
+
+It is built once both dictionaries are loaded, in the JMdict database, by a
+single pass over the kebs. The characters can come from the same database
+(both dictionaries merged into one), from a schema of it (KANJIDIC2
+attached), or from a database of their own. Updating the JMdict database
+leaves the table as it was: build it again afterwards.
+"""
+
+import time
+import argparse
+from sqlalchemy import create_engine, text, Table, Column, Integer, Unicode, \
+                       Index, MetaData
+from sqlalchemy.sql import select
+from . import bulk
+from . import jmdict
+from . import kanjidic
+
+metadata = MetaData()
+
+#One row per occurrence of a kanji in a keb, position being its index there
+kanji_entry = Table('kanji_entry', metadata,
+                    Column('id', Integer, primary_key=True),
+                    Column('character_literal', Unicode),
+                    Column('ent_seq', Integer),
+                    Column('k_ele_id', Integer),
+                    Column('position', Integer))
+Index('ix_kanji_entry_character_literal', kanji_entry.c.character_literal,
+      kanji_entry.c.ent_seq)
+Index('ix_kanji_entry_ent_seq', kanji_entry.c.ent_seq,
+      kanji_entry.c.character_literal)
+
+#Rows inserted at a time
+n_to_save = 10000
+
+#Schema a KANJIDIC2 database is attached as by link_databases(), if none is
+#given
+ATTACH_SCHEMA = 'kanjidic'
+
+
+def character_literals(conn, schema=None):
+    """The literals of the KANJIDIC2 characters in conn's database."""
+    character = kanjidic.character.tometadata(MetaData(), schema=schema)
+    return set(row[0] for row in conn.execute(select([character.c.literal])))
+
+def create_table(conn, literals):
+    """
+    Create the kanji_entry table in conn's JMdict database, or fill it
+    again, with the occurrences of the given literals in the kebs. Returns
+    the number of rows.
+    """
+    if conn.dialect.has_table(conn, kanji_entry.name):
+        conn.execute(kanji_entry.delete())
+        new_tables = []
+    else:
+        new_tables = bulk.create_tables(conn, metadata)
+    rows = []
+    pending = [[rows, kanji_entry.insert()]]
+    statements = {}
+    n_rows = 0
+    k_ele = jmdict.k_ele
+    #in id order, so the rows of each entry are numbered in keb order
+    result = conn.execute(select([k_ele.c.id, k_ele.c.entry_ent_seq,
+                                  k_ele.c.keb]).order_by(k_ele.c.id))
+    for k_ele_id, ent_seq, keb in result:
+        for position, c in enumerate(keb or ''):
+            if c in literals:
+                rows.append((c, ent_seq, k_ele_id, position))
+        if len(rows) >= n_to_save:
+            n_rows += len(rows)
+            bulk.save_all(conn, pending, True, statements)
+    n_rows += len(rows)
+    bulk.save_all(conn, pending, True, statements)
+    bulk.create_indexes(conn, new_tables)
+    return n_rows
+
+def link_databases(jmdict_db, kanjidic_db=None, schema=None, attach=None):
+    """
+    Build the kanji_entry table of the JMdict database at the url
+    jmdict_db. The KANJIDIC2 characters are read from the database at the
+    url kanjidic_db, or from jmdict_db itself if there is none, in schema
+    if that is given. With SQLite, attach is instead the path of a
+    KANJIDIC2 database to attach to the JMdict one as schema (ATTACH_SCHEMA
+    by default) while the table is built.
+    """
+    if attach is not None and kanjidic_db is not None:
+        raise ValueError('Give either a KANJIDIC2 url or a database to '
+                         'attach, not both')
+    start = time.time()
+    if kanjidic_db is None:
+        kanjidic_conn = None
+    else:
+        kanjidic_conn = create_engine(kanjidic_db, echo=False).connect()
+    conn = create_engine(jmdict_db, echo=False).connect()
+    try:
+        if attach is not None:
+            schema = schema or ATTACH_SCHEMA
+            conn.execute(text('ATTACH DATABASE :path AS %s' %
+                              conn.dialect.identifier_preparer.quote(schema)),
+                         path=attach)
+        literals = character_literals(kanjidic_conn or conn, schema)
+        with conn.begin():
+            n_rows = create_table(conn, literals)
+    finally:
+        conn.close()
+        if kanjidic_conn is not None:
+            kanjidic_conn.close()
+    print('Linked %d characters to the words they appear in with %d rows '
+          'in %.2f seconds' % (len(literals), n_rows, time.time() - start))
+
+def words_with(conn, literal, limit=50):
+    """
+    The ent_seqs of the entries with a keb containing literal, the ones
+    whose best such keb has the highest priority score first.
+    """
+    sql = ('SELECT x.ent_seq FROM kanji_entry x '
+           'JOIN k_ele k ON k.id = x.k_ele_id '
+           'WHERE x.character_literal = :literal GROUP BY x.ent_seq '
+           'ORDER BY max(k.priority) DESC, x.ent_seq LIMIT :limit')
+    return [row[0] for row in conn.execute(text(sql), literal=literal,
+                                           limit=limit)]
+
+def kanji_in(conn, ent_seq):
+    """The literals of the kanji in the kebs of an entry, in order."""
+    sql = ('SELECT character_literal FROM kanji_entry WHERE ent_seq = '
+           ':ent_seq GROUP BY character_literal ORDER BY min(id)')
+    return [row[0] for row in conn.execute(text(sql), ent_seq=ent_seq)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Link the kanji of a KANJIDIC2 database to the words of '
+                    'a JMdict database.')
+    parser.add_argument('jmdict_url',
+                        help='SQLAlchemy url of the JMdict database')
+    parser.add_argument('kanjidic_url', nargs='?',
+                        help='SQLAlchemy url of the KANJIDIC2 database '
+                             '(default: the JMdict one)')
+    parser.add_argument('--schema',
+                        help='schema the KANJIDIC2 tables are in (with '
+                             '--attach, the name to attach it as; default: '
+                             '%s)' % ATTACH_SCHEMA)
+    parser.add_argument('--attach', metavar='PATH',
+                        help='attach the SQLite KANJIDIC2 database at PATH '
+                             'to the JMdict one and read the characters from '
+                             'there')
+    args = parser.parse_args()
+    link_databases(args.jmdict_url, args.kanjidic_url, args.schema,
+                   args.attach)
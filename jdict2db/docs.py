@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Whole JMdict entries serialized into one compressed blob each, for the
+optional entry_doc table (see jmdict.fill_database). Reading an entry from
+it is a single primary key lookup and a decode instead of a query over
+every table.
+
+A document is the JSON of the rows queued for an entry, nested like the
+lookup module's objects:
+
+  {"ent_seq": 1000220, "priority": 30,
+   "k_ele": [{"keb": "明白", "priority": 30, "ke_pri": ["ichi1"]}],
+   "sense": [{"pos": ["noun"], "gloss": [["obvious", "eng", null]]}], ...}
+
+Sub-element tables with one value column hold a list of values, the others
+a list of lists of values in column order. Empty lists are left out. The
+JSON is deflated with a preset dictionary of the strings most documents
+share, which matters for documents this small.
+"""
+
+import zlib
+import json
+
+#Version of the blob format, stored as its first byte
+FORMAT = 1
+
+#Strings most documents share, most common last
+ZDICT = ''.join([
+    '"links":[["', '"bibl":[["', '"etym":["', '"audit":[["', '"info":[{',
+    '"stagk":["', '"stagr":["', '"xref":["', '"ant":["', '"field":["',
+    '"dial":["', '"example":["', '"s_inf":["', '"lsource":[["',
+    '"re_restr":["', '"ke_inf":["', '"re_inf":["', '"re_nokanji":true',
+    'word usually written using kana alone', '"misc":["',
+    'Godan verb with ', 'Ichidan verb', 'transitive verb',
+    'intransitive verb', 'expressions (phrases, clauses, etc.)',
+    'adjectival nouns or quasi-adjectives (keyword)', 'adverb (fukushi)',
+    'noun (common) (futsuumeishi)', '"spec1"', '"gai1"', '"ichi1"',
+    '"news2"', '"news1"', '"nf', '"ke_pri":["', '"re_pri":["',
+    '"k_ele":[{"keb":"', '"priority":0', '"priority":',
+    '"r_ele":[{"reb":"', '"re_nokanji":false,',
+    '"sense":[{"pos":["', '"gloss":[["', '","eng",null]', '"ent_seq":',
+]).encode('utf-8')
+
+
+def build(rows, first_pks):
+    """
+    The document of an entry from the rows queued for it. rows is a list
+    of (table, table rows) in the order they are saved, the rows being
+    tuples in bulk.insert_columns() order. first_pks holds the pk of the
+    first row of the tables that sub-elements point to.
+    """
+    doc = {}
+    parents = {}
+    for table, table_rows in rows:
+        if not table_rows:
+            continue
+        columns = [c.name for c in table.c if c.name != 'id']
+        fks = list(table.foreign_keys)
+        if not fks:
+            #the entry itself
+            row = dict(zip(columns, table_rows[0]))
+            doc['ent_seq'] = int(row['ent_seq'])
+            doc['priority'] = row['priority']
+            continue
+        fk = fks[0]
+        fk_index = columns.index(fk.parent.name)
+        values = [c for c in columns if c != fk.parent.name]
+        if fk.column.table.name == 'entry':
+            objs = doc.setdefault(table.name, [])
+            for i, row in enumerate(table_rows):
+                obj = dict((c, row[columns.index(c)]) for c in values)
+                objs.append(obj)
+                parents[table.name, first_pks[table.name] + i] = obj
+        else:
+            for row in table_rows:
+                value = [v for i, v in enumerate(row) if i != fk_index]
+                if len(value) == 1:
+                    value = value[0]
+                parent = parents[fk.column.table.name, row[fk_index]]
+                parent.setdefault(table.name, []).append(value)
+    return doc
+
+def encode(doc):
+    """The compressed blob of a document."""
+    data = json.dumps(doc, ensure_ascii=False, separators=(',', ':'))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=ZDICT)
+    return (bytes([FORMAT]) + compressor.compress(data.encode('utf-8')) +
+            compressor.flush())
+
+def decode(blob):
+    """The document of a blob made by encode()."""
+    if blob[0] != FORMAT:
+        raise ValueError('Unknown entry_doc format %d' % blob[0])
+    decompressor = zlib.decompressobj(-15, zdict=ZDICT)
+    data = decompressor.decompress(blob[1:]) + decompressor.flush()
+    return json.loads(data.decode('utf-8'))
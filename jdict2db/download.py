@@ -2,82 +2,125 @@
 #Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
 #License: GPLv3; http://www.gnu.org/licenses/gpl.txt
 
-from urllib.request import urlopen
+from urllib.request import urlopen, Request
 from urllib.error import HTTPError
+from http.client import HTTPException, IncompleteRead
 import os
-import gzip
+import json
+import shutil
 
 JMDICT_URL = 'http://ftp.monash.edu.au/pub/nihongo/JMdict.gz'
 KANJIDIC2_URL = 'http://ftp.monash.edu.au/pub/nihongo/kanjidic2.xml.gz'
 
-def download_jmdict():
-    """Download and extract JMdict from the Monash FTP server."""
+#Size of the pieces responses are written to disk in
+CHUNK_SIZE = 64 * 1024
+
 
+def load_validators(path):
+    """The ETag and Last-Modified headers saved for path, if any."""
     try:
-        if not os.path.exists('../data/'):
-            os.makedirs('../data/')
-    
-        #Download and save the compressed file
-        print("Downloading JMdict.gz...", end=" ")
-        url = urlopen(JMDICT_URL)
-        dic_gz = open('../data/JMdict.gz', 'wb')
-        dic_gz.write(url.read())
-        dic_gz.close()
-        print("Done")
-        
-        #uncompress the file
-        print("Extracting...", end=" ")
-        dic_gz = gzip.GzipFile('../data/JMdict.gz')
-        dic = open('../data/JMdict', 'wb')
-        dic.write(dic_gz.read())
-        dic_gz.close()
-        dic.close()
-        print("Done.")
-        
-        #delete unneeded compressed file
-        print("Removing compressed file JMdict.gz...", end=" ")
-        os.remove('../data/JMdict.gz')
-        print("Done")
+        with open(path + '.meta') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_validators(path, response):
+    validators = {}
+    for header in ('ETag', 'Last-Modified'):
+        if response.headers.get(header):
+            validators[header] = response.headers[header]
+    with open(path + '.meta', 'w') as f:
+        json.dump(validators, f)
+
+def fetch(url, path):
+    """
+    Download url to path, streaming the response to disk in chunks.
+    Returns False if the copy already at path is up to date, True otherwise.
+
+    The ETag and Last-Modified headers of the response are kept in
+    path.meta and sent back as If-None-Match/If-Modified-Since, so an
+    unchanged file only costs one request. The data is written to path.part
+    and only moved to path once it is complete. If the transfer is
+    interrupted, the next call resumes it with a Range request, guarded by
+    If-Range so that a file that changed in between is downloaded whole.
+    """
+    part = path + '.part'
+    request = Request(url)
+    validators = load_validators(part)
+    validator = validators.get('ETag') or validators.get('Last-Modified')
+    if os.path.exists(part) and validator:
+        request.add_header('Range', 'bytes=%d-' % os.path.getsize(part))
+        request.add_header('If-Range', validator)
+    elif os.path.exists(path):
+        validators = load_validators(path)
+        if 'ETag' in validators:
+            request.add_header('If-None-Match', validators['ETag'])
+        if 'Last-Modified' in validators:
+            request.add_header('If-Modified-Since', validators['Last-Modified'])
+
+    try:
+        response = urlopen(request)
     except HTTPError as e:
-        print("Failed to download JMdict.gz: ", e)
-    except IOError as e:
-        print("Failed to save or extract JMdict.gz: ", e)
+        if e.code == 304:
+            return False
+        if e.code == 416:
+            #the partial file is no good, start over
+            os.remove(part)
+            return fetch(url, path)
+        raise
 
-    
-def download_kanjidic2():
-    """Download and extract KANJIDIC2 from the Monash FTP server."""
-    
-    if not os.path.exists('../data/'):
-        os.makedirs('../data/')
+    try:
+        if response.getcode() == 206:
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            save_validators(part, response)
+        with open(part, mode) as f:
+            start = f.tell()
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+            length = response.headers.get('Content-Length')
+            if length is not None and f.tell() - start < int(length):
+                raise IncompleteRead(b'', int(length) - (f.tell() - start))
+    finally:
+        response.close()
+    os.replace(part, path)
+    os.replace(part + '.meta', path + '.meta')
+    return True
+
+def download(url, name):
+    """Download url to ../data/name unless that copy is up to date."""
 
     try:
-        #Download and save the compressed file
-        print("Downloading kanjidic2.xml.gz...", end=" ")
-        url = urlopen(KANJIDIC2_URL)
-        dic_gz = open('../data/kanjidic2.xml.gz', 'wb')
-        dic_gz.write(url.read())
-        dic_gz.close()
-        print("Done")
-        
-        #uncompress the file
-        print("Extracting...", end=" ")
-        dic_gz = gzip.GzipFile('../data/kanjidic2.xml.gz')
-        dic = open('../data/kanjidic2.xml', 'wb')
-        dic.write(dic_gz.read())
-        dic_gz.close()
-        dic.close()
-        print("Done.")
-        
-        #delete unneeded compressed file
-        print("Removing compressed file kanjidic2.xml.gz...", end=" ")
-        os.remove('../data/kanjidic2.xml.gz')
-        print("Done")
+        if not os.path.exists('../data/'):
+            os.makedirs('../data/')
+
+        print("Downloading %s..." % name, end=" ")
+        if fetch(url, os.path.join('../data/', name)):
+            print("Done")
+        else:
+            print("Already up to date")
     except HTTPError as e:
-        print("Failed to download kanjidic2.xml.gz: ", e)
+        print("Failed to download %s: " % name, e)
+    except HTTPException as e:
+        print("Download of %s interrupted, run again to resume: " % name, e)
     except IOError as e:
-        print("Failed to save or extract kanjidic2.xml.gz: ", e)
+        print("Failed to save %s: " % name, e)
+
+def download_jmdict():
+    """
+    Download JMdict from the Monash FTP server. It is kept compressed, the
+    loader decompresses it while parsing.
+    """
+    download(JMDICT_URL, 'JMdict.gz')
+
+def download_kanjidic2():
+    """
+    Download KANJIDIC2 from the Monash FTP server. It is kept compressed,
+    the loader decompresses it while parsing.
+    """
+    download(KANJIDIC2_URL, 'kanjidic2.xml.gz')
 
 
-if __name__ == '__main__':    
+if __name__ == '__main__':
     download_kanjidic2()
-    download_jmdict()
\ No newline at end of file
+    download_jmdict()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Optional SQLite FTS5 full-text indexes over the glosses, readings and kanji
+of JMdict and the meanings of KANJIDIC2.
+
+The FTS tables are external content tables: they only hold the index, and
+their rowid is the id of the row they index (e.g. gloss_fts.rowid is
+gloss.id), which links every match back to its entry or character. English
+text is tokenized into stemmed words, with prefix indexes for searches as
+you type. Japanese text is tokenized into trigrams, so any substring of at
+least three characters can be searched for.
+"""
+
+import re
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import select, literal, table, column
+
+WORDS = "tokenize='porter unicode61', prefix='2 3'"
+TRIGRAM = "tokenize='trigram'"
+
+#(FTS table, indexed table, indexed column, options), by schema
+JMDICT = [('gloss_fts', 'gloss', 'gloss', WORDS),
+          ('reb_fts', 'r_ele', 'reb', TRIGRAM),
+          ('keb_fts', 'k_ele', 'keb', TRIGRAM)]
+KANJIDIC = [('meaning_fts', 'meaning', 'meaning', WORDS)]
+
+#How the matches of each FTS table lead back to what they are a match for:
+#the key selected, the priority score to rank them by and the joins needed
+#to reach both
+LINKS = {'gloss_fts': ('s.entry_ent_seq', 'e.priority',
+                       'JOIN gloss g ON g.id = m.rowid '
+                       'JOIN sense s ON s.id = g.sense_id '
+                       'JOIN entry e ON e.ent_seq = s.entry_ent_seq'),
+         'reb_fts': ('r.entry_ent_seq', 'r.priority',
+                     'JOIN r_ele r ON r.id = m.rowid'),
+         'keb_fts': ('k.entry_ent_seq', 'k.priority',
+                     'JOIN k_ele k ON k.id = m.rowid'),
+         'meaning_fts': ('c.character_literal', '0',
+                         'JOIN meaning c ON c.id = m.rowid')}
+
+#Trigram indexes can't match anything shorter
+MIN_TRIGRAM = 3
+
+
+def available(conn):
+    """Whether the database is SQLite with FTS5 and its trigram tokenizer."""
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE temp.fts_check USING "
+                          "fts5(a, tokenize='trigram')"))
+    except DBAPIError:
+        return False
+    conn.execute(text('DROP TABLE temp.fts_check'))
+    return True
+
+def existing(conn, specs):
+    """The specs of the FTS tables that exist in conn's database."""
+    return [s for s in specs if conn.dialect.has_table(conn, s[0])]
+
+def create_tables(conn, specs):
+    """
+    Create and fill the FTS tables of specs that don't exist yet, reporting
+    the time each took. Their tables must already hold all of their rows.
+    """
+    for name, source, column_name, options in specs:
+        if conn.dialect.has_table(conn, name):
+            continue
+        start = time.time()
+        conn.execute(text("CREATE VIRTUAL TABLE %s USING fts5(%s, "
+                          "content='%s', content_rowid='id', %s)" %
+                          (name, column_name, source, options)))
+        conn.execute(text("INSERT INTO %s(%s) VALUES('rebuild')" %
+                          (name, name)))
+        print('Created full-text index %s in %.2f seconds' %
+              (name, time.time() - start))
+
+def change(conn, metadata, specs, where, command):
+    """
+    Add the rows selected by where(table) to the FTS tables of specs, or
+    take them out if command is 'delete'. Rows must be taken out before
+    they are deleted, as their values are needed to find them in the index.
+    """
+    for name, source, column_name, options in specs:
+        indexed = metadata.tables[source]
+        columns = [indexed.c.id, indexed.c[column_name]]
+        targets = ['rowid', column_name]
+        if command == 'delete':
+            columns.insert(0, literal('delete'))
+            targets.insert(0, name)
+        fts_table = table(name, *[column(c) for c in targets])
+        conn.execute(fts_table.insert().from_select(
+            targets, select(columns).where(where(indexed))))
+
+def match_words(words, prefix=False):
+    """
+    An FTS query matching all the words in words. With prefix=True, the
+    last one may also just be the start of a word.
+    """
+    words = re.findall(r'\w+', words)
+    if not words:
+        return None
+    query = ' '.join('"%s"' % w for w in words)
+    return query + '*' if prefix else query
+
+def match_text(s):
+    """An FTS query matching s anywhere, as a trigram index reads it."""
+    return '"%s"' % s.replace('"', '""')
+
+def search(conn, fts_name, query, limit):
+    """
+    The keys of the matches of query in an FTS table, the ones with the
+    highest priority score first, then the best matches. A key that has
+    several matches is ranked by its best one.
+    """
+    key, score, joins = LINKS[fts_name]
+    #matches are ranked in a subquery that can't be flattened, as the
+    #ranking function is only available in the query of the FTS table
+    sql = ('SELECT %s, max(%s), min(m.rank) FROM (SELECT rowid, rank '
+           'FROM %s WHERE %s MATCH :query ORDER BY rank LIMIT -1) m %s '
+           'GROUP BY 1 ORDER BY 2 DESC, 3, 1 LIMIT :limit' %
+           (key, score, fts_name, fts_name, joins))
+    return [row[0] for row in conn.execute(text(sql), query=query,
+                                           limit=limit)]
+
+def search_like(conn, table_name, column_name, key, s, limit):
+    """
+    The keys of the rows whose column contains s, the ones with the highest
+    priority score first, then the shortest. Scans the whole table, for
+    strings too short for a trigram index.
+    """
+    pattern = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', s)
+    sql = ("SELECT %s FROM %s WHERE %s LIKE :pattern ESCAPE '\\' "
+           "GROUP BY 1 ORDER BY max(priority) DESC, min(length(%s)), 1 "
+           "LIMIT :limit" % (key, table_name, column_name, column_name))
+    return [row[0] for row in conn.execute(text(sql), pattern=pattern,
+                                           limit=limit)]
+
+def search_prefix(conn, table_name, column_name, key, prefix, limit):
+    """
+    The keys of the rows whose column starts with prefix, the ones with the
+    highest priority score first, then the shortest. A range on the index
+    of the column, so no FTS table is needed.
+    """
+    sql = ('SELECT %s FROM %s WHERE %s >= :start AND %s < :end '
+           'GROUP BY 1 ORDER BY max(priority) DESC, min(length(%s)), 1 '
+           'LIMIT :limit' % (key, table_name, column_name, column_name,
+                             column_name))
+    return [row[0] for row in conn.execute(text(sql), start=prefix,
+                                           end=prefix + '\U0010ffff',
+                                           limit=limit)]
+
+def search_glosses(conn, words, limit=50, prefix=False):
+    """
+    The ent_seqs of the entries with glosses matching all the words in
+    words, most common first (see search()). Words are stemmed, so 'hiding'
+    finds 'to hide'. With prefix=True the last word may be incomplete.
+    """
+    query = match_words(words, prefix)
+    return search(conn, 'gloss_fts', query, limit) if query else []
+
+def search_meanings(conn, words, limit=50, prefix=False):
+    """Like search_glosses(), for the literals of KANJIDIC2 characters."""
+    query = match_words(words, prefix)
+    return search(conn, 'meaning_fts', query, limit) if query else []
+
+def search_readings(conn, s, limit=50):
+    """The ent_seqs of the entries with a reading containing s."""
+    if len(s) < MIN_TRIGRAM:
+        return search_like(conn, 'r_ele', 'reb', 'entry_ent_seq', s, limit)
+    return search(conn, 'reb_fts', match_text(s), limit)
+
+def search_kanji(conn, s, limit=50):
+    """The ent_seqs of the entries with a kanji element containing s."""
+    if len(s) < MIN_TRIGRAM:
+        return search_like(conn, 'k_ele', 'keb', 'entry_ent_seq', s, limit)
+    return search(conn, 'keb_fts', match_text(s), limit)
+
+def prefix_readings(conn, prefix, limit=50):
+    """The ent_seqs of the entries with a reading starting with prefix."""
+    return search_prefix(conn, 'r_ele', 'reb', 'entry_ent_seq', prefix,
+                         limit)
+
+def prefix_kanji(conn, prefix, limit=50):
+    """The ent_seqs of the entries with a keb starting with prefix."""
+    return search_prefix(conn, 'k_ele', 'keb', 'entry_ent_seq', prefix,
+                         limit)
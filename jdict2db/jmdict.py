@@ -3,449 +3,887 @@
 #License: GPLv3; http://www.gnu.org/licenses/gpl.txt
 
 import os
-import sys
 import time
-from xml.etree.cElementTree import iterparse
-from sqlalchemy import create_engine, Table, Column, Integer, String, Unicode,\
-                       Boolean, ForeignKey, MetaData
+import argparse
+import io
+import copy
+import mmap
+import hashlib
+import collections
+import multiprocessing
+from sqlalchemy import Table, Column, Integer, String, Unicode, Boolean, \
+                       LargeBinary, ForeignKey, MetaData
+from sqlalchemy.sql import select, func
 from . import download
+from . import bulk
+from . import stream
+from . import fts
+from . import autocomplete
+from . import priority
+from . import docs
+from . import columnar
 
-JMDICT_PATH = '../data/JMdict'
+JMDICT_PATH = '../data/JMdict.gz'
 
 metadata = MetaData()
-engine = None
-conn = None
+#The tables rows are queued for by Loader, in the order of its all_l. Each
+#has a list of pending rows in the Loader attribute named after it (see
+#bulk.Loader).
+tables = []
 
-#All table_l variables are both global and are referenced inside all_l.
-#table_l values are lists of pending row insertions. They are global as
-#they need to be conveniently accessed to insert data into them. all_l will be
-#a list of lists. Each sub-list = [table_l, table.insert()]
-#table.insert() is a re-usable insert statement for that table (it's identical
-#each time, so no need to keep requesting it)
-all_l = []
 
-#value to use as number of rows needed in a table_l list before we save it
-#(large performance improvement by having fewer commits with more data)
-n_to_commit = 10000
-
-
-#Set up database tables and required lists.
+#Set up database tables. Every foreign key is indexed.
+#Indexes declared here are only built once all the data is loaded (see
+#bulk.create_indexes).
 entry = Table('entry', metadata,
-                    Column('ent_seq', Integer, primary_key=True))
-entry_l = []
-all_l.append([entry_l, entry.insert()])
+                    Column('ent_seq', Integer, primary_key=True),
+                    Column('content_hash', String, index=True),
+                    Column('priority', Integer, index=True))
+tables.append(entry)
 
 k_ele = Table('k_ele', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq')),
-                    Column('keb', Unicode, index=True))
-k_ele_l = []
-all_l.append([k_ele_l, k_ele.insert()])
+                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq'), index=True),
+                    Column('keb', Unicode, index=True),
+                    Column('priority', Integer, index=True))
+tables.append(k_ele)
                   
 ke_inf = Table('ke_inf', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('k_ele_id', Integer, ForeignKey('k_ele.id')),
+                    Column('k_ele_id', Integer, ForeignKey('k_ele.id'), index=True),
                     Column('ke_inf', String))
-ke_inf_l = []
-all_l.append([ke_inf_l, ke_inf.insert()])
+tables.append(ke_inf)
 
 ke_pri = Table('ke_pri', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('k_ele_id', Integer, ForeignKey('k_ele.id')),
+                    Column('k_ele_id', Integer, ForeignKey('k_ele.id'), index=True),
                     Column('ke_pri', String))
-ke_pri_l = []
-all_l.append([ke_pri_l, ke_pri.insert()])
+tables.append(ke_pri)
 
 r_ele = Table('r_ele', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq'), index=True),
                     Column('reb', Unicode, index=True),
-                    Column('re_nokanji', Boolean))
-r_ele_l = []
-all_l.append([r_ele_l, r_ele.insert()])
+                    Column('re_nokanji', Boolean),
+                    Column('priority', Integer, index=True))
+tables.append(r_ele)
 
 re_restr = Table('re_restr', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('r_ele_id', Integer, ForeignKey('r_ele.id'), index=True),
                     Column('keb', Unicode))
-re_restr_l = []
-all_l.append([re_restr_l, re_restr.insert()])
+tables.append(re_restr)
 
 re_inf = Table('re_inf', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('r_ele_id', Integer, ForeignKey('r_ele.id')),
+                    Column('r_ele_id', Integer, ForeignKey('r_ele.id'), index=True),
                     Column('re_inf', Unicode))
-re_inf_l = []
-all_l.append([re_inf_l, re_inf.insert()])
+tables.append(re_inf)
 
 re_pri = Table('re_pri', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('r_ele_id', Integer, ForeignKey('r_ele.id')),
+                    Column('r_ele_id', Integer, ForeignKey('r_ele.id'), index=True),
                     Column('re_pri', String))
-re_pri_l = []
-all_l.append([re_pri_l, re_pri.insert()])
+tables.append(re_pri)
 
 info = Table('info', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq')))
-info_l = []
-all_l.append([info_l, info.insert()])
+                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq'), index=True))
+tables.append(info)
 
 links = Table('links', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('info_id', Integer, ForeignKey('info.id')),
+                    Column('info_id', Integer, ForeignKey('info.id'), index=True),
                     Column('linkag', String),
                     Column('link_desc', String),
                     Column('link_uri', String))
-links_l = []
-all_l.append([links_l, links.insert()])
+tables.append(links)
 
 bibl = Table('bibl', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('info_id', Integer, ForeignKey('info.id')),
+                    Column('info_id', Integer, ForeignKey('info.id'), index=True),
                     Column('bibag', String),
                     Column('bibxt', String))
-bibl_l = []
-all_l.append([bibl_l, bibl.insert()])
+tables.append(bibl)
 
 etym = Table('etym', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('info_id', Integer, ForeignKey('info.id')),
+                    Column('info_id', Integer, ForeignKey('info.id'), index=True),
                     Column('etym', String))
-etym_l = []
-all_l.append([etym_l, etym.insert()])
+tables.append(etym)
 
 audit = Table('audit', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('info_id', Integer, ForeignKey('info.id')),
+                    Column('info_id', Integer, ForeignKey('info.id'), index=True),
                     Column('upd_date', String),
                     Column('upd_detl', String))
-audit_l = []
-all_l.append([audit_l, audit.insert()])
+tables.append(audit)
 
 sense = Table('sense', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq')))
-sense_l = []
-all_l.append([sense_l, sense.insert()])
+                    Column('entry_ent_seq', Integer, ForeignKey('entry.ent_seq'), index=True))
+tables.append(sense)
 
 stagk = Table('stagk', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('stagk', Unicode))
-stagk_l = []
-all_l.append([stagk_l, stagk.insert()])
+tables.append(stagk)
 
 stagr = Table('stagr', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('stagr', Unicode))
-stagr_l = []
-all_l.append([stagr_l, stagr.insert()])
+tables.append(stagr)
  
 pos = Table('pos', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('pos', String))
-pos_l = []
-all_l.append([pos_l, pos.insert()])
+tables.append(pos)
 
 xref = Table('xref', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('xref', Unicode))
-xref_l = []
-all_l.append([xref_l, xref.insert()])
+tables.append(xref)
 
 ant = Table('ant', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('ant', Unicode))
-ant_l = []
-all_l.append([ant_l, ant.insert()])
+tables.append(ant)
 
 field = Table('field', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('field', String))
-field_l = []
-all_l.append([field_l, field.insert()])
+tables.append(field)
 
 misc = Table('misc', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('misc', String))
-misc_l = []
-all_l.append([misc_l, misc.insert()])
+tables.append(misc)
 
 s_inf = Table('s_inf', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('s_inf', Unicode))
-s_inf_l = []
-all_l.append([s_inf_l, s_inf.insert()])
+tables.append(s_inf)
 
 lsource = Table('lsource', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('lsource', Unicode),
                     Column('lang', String),
                     Column('ls_type', String),
                     Column('ls_wasei', Boolean))
-lsource_l = []
-all_l.append([lsource_l, lsource.insert()])
+tables.append(lsource)
 
 dial = Table('dial', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('dial', String))
-dial_l = []
-all_l.append([dial_l, dial.insert()])
+tables.append(dial)
 
 gloss = Table('gloss', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
-                    Column('gloss', Unicode),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
+                    Column('gloss', Unicode, index=True),
                     Column('lang', String),
                     Column('g_gend', String))
-gloss_l = []
-all_l.append([gloss_l, gloss.insert()])
+tables.append(gloss)
 
 example = Table('example', metadata,
                     Column('id', Integer, primary_key=True),
-                    Column('sense_id', Integer, ForeignKey('sense.id')),
+                    Column('sense_id', Integer, ForeignKey('sense.id'), index=True),
                     Column('example', Unicode))
-example_l = []
-all_l.append([example_l, example.insert()])
+tables.append(example)
+
+#One compressed document per entry holding all of its rows (see docs.py).
+#It is optional, so it's kept out of metadata and only created when asked for.
+doc_metadata = MetaData()
+entry_doc = Table('entry_doc', doc_metadata,
+                    Column('ent_seq', Integer, primary_key=True),
+                    Column('doc', LargeBinary))
+tables.append(entry_doc)
 
-def save_all():
+build_info = bulk.build_info_table(metadata)
+
+def entry_hash(elem):
     """
-    Commit data held in each table_l list.
-    Avoid trying to commit an empty list.
+    A digest of the content of an <entry> element, used to find the entries
+    that changed between two versions of the dictionary. Only tags,
+    attributes and text count, not the formatting of the file.
+
+    This runs for every entry, so it sticks to one pass over the already
+    parsed elements and one hash update. The digest of a whole build costs
+    less than the row construction in Loader.parse_entry().
     """
-    for list in all_l:
-        table_l = list[0]
-        insert = list[1]
-        
-        if len(table_l) > 0:
-            conn.execute(insert, table_l)
-            del table_l[:]  #empty the list after committing it
-            
-def parse_k_ele(ent_seq, k_ele_pk, node):
-    keb = None
-    for k in node:
-        if k.tag == "keb": 
-            keb = k.text
-        elif k.tag == "ke_inf":
-            ke_inf_l.append({'k_ele_id':k_ele_pk,
-                             'ke_inf':k.text})
-        elif k.tag == "ke_pri":
-            ke_pri_l.append({'k_ele_id':k_ele_pk,
-                             'ke_pri':k.text})
-    k_ele_l.append({'entry_ent_seq':ent_seq,
-                    'keb':keb})
-
-def parse_r_ele(ent_seq, r_ele_pk, node):
-    reb = None
-    re_nokanji = False
-    for r in node:
-        if r.tag == "reb":
-            reb = str(r.text)
-        elif r.tag == "re_nokanji":
-            re_nokanji = True
-        elif r.tag == "re_restr":
-            re_restr_l.append({'r_ele_id':r_ele_pk,
-                               'keb':str(r.text)})
-        elif r.tag == "re_inf":
-            re_inf_l.append({'r_ele_id':r_ele_pk,
-                             're_inf':str(r.text)})
-        elif r.tag == "re_pri":
-            re_pri_l.append({'r_ele_id':r_ele_pk,
-                             're_pri':r.text})
-
-    r_ele_l.append({'entry_ent_seq':ent_seq,
-                    'reb':reb,
-                    're_nokanji':re_nokanji})
-
-def parse_info(ent_seq, info_pk, node):
-    for i in node:
-        if i.tag == "links":
-            link_tag = None
-            link_desc = None
-            link_uri = None
-            for l in i:
-                if l.tag == "link_tag":
-                    link_tag = l.text
-                elif l.tag == "link_desc":
-                    link_desc = l.text
-                elif l.tag == "link_uri":
-                    link_uri = l.text
-            links_l.append({'info_id':info_pk,
-                            'link_tag':link_tag,
-                            'link_desc':link_desc,
-                            'link_uri':link_uri})
-        elif i.tag == "bibl":
-            for b in i:
-                #FIXME: pretty sure this is a bug, but we have no bib info anyway
-                bib_tag = None
-                bib_txt = None
-                if b.tag == "bib_tag":
-                    bib_tag = b.text
-                elif b.tag == "bib_txt":
-                    bib_txt = b.text
-            bibl_l.append({'info_id':info_pk,
-                           'bib_tag':bib_tag,
-                           'bib_txt':bib_txt})
-        elif i.tag == "etym":
-            etym_l.append({'info_id':info_pk,
-                           'etym':i.text})
-        elif i.tag == "audit":
-            upd_date = None
-            upd_detl = None
-            for a in i:
-                if a.tag == "upd_date":
-                    upd_date = a.text
-                elif a.tag == "upd_detl":
-                    upd_detl = a.text
-            audit_l.append({'info_id':info_pk,
-                            'upd_date':upd_date,
-                            'upd_detl':upd_detl})
-    info_l.append({'entry_ent_seq':ent_seq})
+    parts = []
+    append = parts.append
+    for e in elem.iter():
+        append(e.tag)
+        if e.attrib:
+            append(repr(sorted(e.attrib.items())))
+        if e.text is not None:
+            append(e.text.strip())
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def new_pks():
+    return {'k_ele': 0, 'r_ele': 0, 'info': 0, 'sense': 0}
+
+
+class Loader(bulk.Loader):
+    """
+    Loads JMdict into a database, queueing the rows of each entry in its own
+    lists (see bulk.Loader). fill() builds a new database and update()
+    brings one up to date.
+    """
+
+    tables = tables
+    metadata = metadata
+    #Save the queued rows after n_to_save elements. This shaves off a few
+    #seconds.
+    n_to_save = 15000
+
+    def __init__(self, raw=False, docs=False, n_to_save=None):
+        """
+        With raw=True rows are inserted through the driver directly (see
+        bulk.save_all). With docs=True a compressed document of each entry
+        is queued for the entry_doc table as well (see docs.py).
+        """
+        bulk.Loader.__init__(self, raw, n_to_save)
+        self.entry_docs = docs
+        self.headwords = None
+
+    def parse_k_ele(self, ent_seq, k_ele_pk, node):
+        """Queue the rows of a <k_ele> element and return its priority."""
+        keb = None
+        ke_pri = []
+        for k in node:
+            if k.tag == "keb": 
+                keb = k.text
+            elif k.tag == "ke_inf":
+                self.ke_inf_l.append((k_ele_pk, k.text))
+            elif k.tag == "ke_pri":
+                self.ke_pri_l.append((k_ele_pk, k.text))
+                ke_pri.append(k.text)
+        score = priority.score(ke_pri)
+        self.k_ele_l.append((ent_seq, keb, score))
+        return score
+
+    def parse_r_ele(self, ent_seq, r_ele_pk, node):
+        """Queue the rows of an <r_ele> element and return its priority."""
+        reb = None
+        re_nokanji = False
+        re_pri = []
+        for r in node:
+            if r.tag == "reb":
+                reb = str(r.text)
+            elif r.tag == "re_nokanji":
+                re_nokanji = True
+            elif r.tag == "re_restr":
+                self.re_restr_l.append((r_ele_pk, str(r.text)))
+            elif r.tag == "re_inf":
+                self.re_inf_l.append((r_ele_pk, str(r.text)))
+            elif r.tag == "re_pri":
+                self.re_pri_l.append((r_ele_pk, r.text))
+                re_pri.append(r.text)
+
+        score = priority.score(re_pri)
+        self.r_ele_l.append((ent_seq,
+                             reb,
+                             re_nokanji,
+                             score))
+        return score
+
+    def parse_info(self, ent_seq, info_pk, node):
+        for i in node:
+            if i.tag == "links":
+                link_tag = None
+                link_desc = None
+                link_uri = None
+                for l in i:
+                    if l.tag == "link_tag":
+                        link_tag = l.text
+                    elif l.tag == "link_desc":
+                        link_desc = l.text
+                    elif l.tag == "link_uri":
+                        link_uri = l.text
+                self.links_l.append((info_pk,
+                                     link_tag,
+                                     link_desc,
+                                     link_uri))
+            elif i.tag == "bibl":
+                for b in i:
+                    #FIXME: pretty sure this is a bug, but we have no bib
+                    #info anyway
+                    bib_tag = None
+                    bib_txt = None
+                    if b.tag == "bib_tag":
+                        bib_tag = b.text
+                    elif b.tag == "bib_txt":
+                        bib_txt = b.text
+                self.bibl_l.append((info_pk,
+                                    bib_tag,
+                                    bib_txt))
+            elif i.tag == "etym":
+                self.etym_l.append((info_pk, i.text))
+            elif i.tag == "audit":
+                upd_date = None
+                upd_detl = None
+                for a in i:
+                    if a.tag == "upd_date":
+                        upd_date = a.text
+                    elif a.tag == "upd_detl":
+                        upd_detl = a.text
+                self.audit_l.append((info_pk,
+                                     upd_date,
+                                     upd_detl))
+        self.info_l.append((ent_seq,))
         
-def parse_sense(ent_seq, sense_pk, node):   
-    for s in node:
-        if s.tag == "stagk":
-            stagk_l.append({'sense_id':sense_pk,
-                            'stagk':str(s.text)})
-        elif s.tag == "stagr":
-            stagr_l.append({'sense_id':sense_pk,
-                            'stagr':str(s.text)})
-        elif s.tag == "pos":
-            pos_l.append({'sense_id':sense_pk,
-                          'pos':s.text})
-        elif s.tag == "xref":
-            xref_l.append({'sense_id':sense_pk,
-                           'xref':str(s.text)})
-        elif s.tag == "ant":
-            ant_l.append({'sense_id':sense_pk,
-                          'ant':str(s.text)})
-        elif s.tag == "field":
-            field_l.append({'sense_id':sense_pk,
-                            'field':s.text})
-        elif s.tag == "misc":
-            misc_l.append({'sense_id':sense_pk,
-                           'misc':s.text})
-        elif s.tag == "s_inf":
-            s_inf_l.append({'sense_id':sense_pk,
-                            's_inf':str(s.text)})
-        elif s.tag == "lsource":
-            ls_type = s.get("ls_type", 'full')
-            ls_wasei = s.get("ls_wasei", False)
-            
-            #ls_wasei only contains the value 'y' if it exists.
-            #but we need boolean values, so set to True
-            if ls_wasei is not False:
-                ls_wasei = True
+    def parse_sense(self, ent_seq, sense_pk, node):   
+        for s in node:
+            if s.tag == "stagk":
+                self.stagk_l.append((sense_pk, str(s.text)))
+            elif s.tag == "stagr":
+                self.stagr_l.append((sense_pk, str(s.text)))
+            elif s.tag == "pos":
+                self.pos_l.append((sense_pk, s.text))
+            elif s.tag == "xref":
+                self.xref_l.append((sense_pk, str(s.text)))
+            elif s.tag == "ant":
+                self.ant_l.append((sense_pk, str(s.text)))
+            elif s.tag == "field":
+                self.field_l.append((sense_pk, s.text))
+            elif s.tag == "misc":
+                self.misc_l.append((sense_pk, s.text))
+            elif s.tag == "s_inf":
+                self.s_inf_l.append((sense_pk, str(s.text)))
+            elif s.tag == "lsource":
+                ls_type = s.get("ls_type", 'full')
+                ls_wasei = s.get("ls_wasei", False)
                 
-            #xml:lang expands to that
-            lang = s.get("{http://www.w3.org/XML/1998/namespace}lang", 'eng')
-            lsource = s.text
-            
-            #this is necessary because doing unicode(None)
-            #returns something that isn't None
-            if lsource is not None: 
-                lsource = str(lsource)
-            lsource_l.append({'sense_id':sense_pk,
-                              'lsource':lsource,
-                              'lang':lang,
-                              'ls_type':ls_type,
-                              'ls_wasei':ls_wasei})
-        elif s.tag == "dial":
-            dial_l.append({'sense_id':sense_pk,
-                           'dial':s.text})
-        elif s.tag == "gloss":
-            lang = s.get("{http://www.w3.org/XML/1998/namespace}lang", 'eng')
-            g_gend = s.get("g_gend", None)  
-            gloss_l.append({'sense_id':sense_pk,
-                            'gloss':str(s.text),
-                            'lang':lang,
-                            'g_gend':g_gend})
-        elif s.tag == "example":
-            example_l.append({'sense_id':sense_pk,
-                              'example':str(s.text)})
-    sense_l.append({'entry_ent_seq': ent_seq})
-    
-    
-def fill_database(db_path):
-    """Fill the supplied database with jmdict data."""
+                #ls_wasei only contains the value 'y' if it exists.
+                #but we need boolean values, so set to True
+                if ls_wasei is not False:
+                    ls_wasei = True
+                    
+                #xml:lang expands to that
+                lang = s.get("{http://www.w3.org/XML/1998/namespace}lang",
+                             'eng')
+                lsource = s.text
+                
+                #this is necessary because doing unicode(None)
+                #returns something that isn't None
+                if lsource is not None: 
+                    lsource = str(lsource)
+                self.lsource_l.append((sense_pk,
+                                       lsource,
+                                       lang,
+                                       ls_type,
+                                       ls_wasei))
+            elif s.tag == "dial":
+                self.dial_l.append((sense_pk, s.text))
+            elif s.tag == "gloss":
+                lang = s.get("{http://www.w3.org/XML/1998/namespace}lang",
+                             'eng')
+                g_gend = s.get("g_gend", None)  
+                self.gloss_l.append((sense_pk,
+                                     str(s.text),
+                                     lang,
+                                     g_gend))
+            elif s.tag == "example":
+                self.example_l.append((sense_pk, str(s.text)))
+        self.sense_l.append((ent_seq,))
+
+    def parse_entry(self, elem, pks):
+        """
+        Queue the rows of one <entry> element.
+
+        pks holds the last primary keys used for the k_ele, r_ele, info and
+        sense tables, which are used as foreign keys by sub-element tables,
+        and is updated in place. The xml file is parsed in document order,
+        so we can be sure the pk matches the sub elements.
+
+        The priority score of the entry is the best one of its elements. If
+        entry_docs is set, the rows queued for the entry are also made into
+        its entry_doc row.
+        """
+        if self.entry_docs:
+            starts = [len(table_l) for table_l, insert in self.all_l]
+            first_pks = dict((name, pk + 1) for name, pk in pks.items())
+        ent_seq = None
+        best = 0
+        for e in elem:
+            if e.tag == "ent_seq":
+                ent_seq = e.text
+            elif e.tag == "k_ele":
+                pks['k_ele'] += 1
+                best = max(best, self.parse_k_ele(ent_seq, pks['k_ele'], e))
+            elif e.tag == "r_ele":
+                pks['r_ele'] += 1
+                best = max(best, self.parse_r_ele(ent_seq, pks['r_ele'], e))
+            elif e.tag == "info":
+                pks['info'] += 1
+                self.parse_info(ent_seq, pks['info'], e)
+            elif e.tag == "sense":
+                pks['sense'] += 1
+                self.parse_sense(ent_seq, pks['sense'], e)
+        self.entry_l.append((ent_seq, entry_hash(elem), best))
+        if self.entry_docs:
+            rows = [(insert.table, table_l[start:])
+                    for (table_l, insert), start in zip(self.all_l, starts)]
+            self.entry_doc_l.append((int(ent_seq),
+                                     docs.encode(docs.build(rows,
+                                                            first_pks))))
+
+    def parse_parallel(self, path, processes):
+        """
+        Parse the JMdict file at path with a pool of processes, queueing the
+        rows of each chunk in document order. A generator that yields the
+        number of entries queued after each chunk so the caller can save
+        them.
+
+        Only a few chunks are handed out ahead of the one being saved, so
+        finished chunks don't pile up in memory when writing is the
+        bottleneck. Rows are queued in the same order as a single process
+        would, so the autoincremented ids match the pks the chunks were
+        parsed with.
+        """
+        prolog, chunks = split_chunks(path, processes * 8)
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunks = iter(chunks)
+            pending = collections.deque()
+            def submit():
+                for start, end, n_entries, pks in chunks:
+                    args = (path, prolog, start, end, pks, self.entry_docs)
+                    pending.append((n_entries,
+                                    pool.apply_async(_parse_chunk, (args,))))
+                    return
+            for i in range(processes * 2):
+                submit()
+            while pending:
+                n_entries, result = pending.popleft()
+                rows = result.get()
+                submit()
+                for (table_l, insert), chunk_rows in zip(self.all_l, rows):
+                    table_l.extend(chunk_rows)
+                yield n_entries
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def collect(self):
+        #The headwords are collected for the autocomplete index, and the
+        #rows exported, before they are handed to the writer
+        if self.headwords is not None:
+            self.headwords.add_rows(self.k_ele_l, self.r_ele_l)
+        bulk.Loader.collect(self)
+
+    def fill(self, db_path, durability=bulk.DEFAULT_DURABILITY,
+             commit_every=0, processes=1, background=False, source=None,
+             full_text=False, autocomplete_path=None, export_dir=None,
+             export_format='parquet'):
+        """
+        Fill the supplied database with jmdict data.
+
+        source is the path of the dictionary (JMDICT_PATH by default) or a
+        file object to read it from, gzipped or not (see stream.open_source).
+
+        The inserts are done in one transaction, or in one per commit_every
+        entries if it is set. durability is a key of bulk.DURABILITY_LEVELS
+        and picks the SQLite settings used during the build. With more than
+        one process, the file is parsed in parallel (see parse_parallel)
+        while this process does all the writing; a gzipped file or a file
+        object is decompressed to a temporary file for that first (see
+        stream.uncompressed_file). With background=True, the rows are
+        written on a separate thread while parsing goes on (see
+        bulk.BackgroundWriter). With full_text=True, FTS5 indexes of the
+        glosses, readings and kanji are added once the data is loaded (see
+        fts.py); this needs SQLite with the FTS5 trigram tokenizer. With an
+        autocomplete_path, a prefix index of the headwords is written there
+        from the parsed rows (see autocomplete.py). If entry_docs is set,
+        the entry_doc table is filled in the same pass with a compressed
+        document of each entry, which lookup.Lookup then reads entries from.
+        With an export_dir, every table is also written there as it is
+        parsed, to a Parquet or Arrow file depending on export_format (see
+        columnar.py).
+        """
+        if source is None:
+            source = JMDICT_PATH
+
+        self.connect(db_path, background)
+        if full_text and not fts.available(self.conn):
+            self.close()
+            raise ValueError('Full-text indexes need SQLite with FTS5 and '
+                             'its trigram tokenizer')
+        new_tables = self.start(durability, background, commit_every)
+        if self.entry_docs:
+            bulk.create_tables(self.conn, doc_metadata)
+
+        print("Filling database with JMdict data. This takes a while...")
+        start = time.time()
+
+        if autocomplete_path:
+            self.headwords = autocomplete.Collector()
+        else:
+            self.headwords = None
+        save_now = 0
+        try:
+            if export_dir:
+                self.exporter = columnar.Exporter(export_dir, self.all_l,
+                                                  metadata, export_format)
+            if processes > 1:
+                #the chunks are read straight from a plain file
+                with stream.uncompressed_file(source) as path:
+                    for n_entries in self.parse_parallel(path, processes):
+                        self.flush(n_entries)
+            else:
+                pks = new_pks()
+                with stream.open_source(source) as f:
+                    for elem in stream.iter_elements(f, "entry"):
+                        self.parse_entry(elem, pks)
+                        save_now += 1
+                        if save_now > self.n_to_save:
+                            self.flush(save_now)
+                            save_now = 0
+
+            #ensure the leftover rows are saved
+            self.finish_writing(save_now)
+            bulk.new_generation(self.conn, build_info)
+            bulk.create_indexes(self.conn, new_tables)
+            if full_text:
+                with self.conn.begin():
+                    fts.create_tables(self.conn, fts.JMDICT)
+            if self.headwords is not None:
+                autocomplete.write_index(autocomplete_path,
+                                         self.headwords.records)
+            if self.exporter is not None:
+                self.exporter.finish()
+        except:
+            self.abort()
+            raise
+        finally:
+            self.headwords = None
+            self.close()
+
+        seconds = time.time() - start
+        self.metrics['seconds'] += seconds
+        print('Filling database with JMdict data took %s seconds' % seconds)
+        print("Done.")
+
+    def update(self, db_path, durability=bulk.DEFAULT_DURABILITY,
+               source=None, autocomplete_path=None):
+        """
+        Bring a database made by fill() up to date with a new version of
+        JMdict, only touching the entries that were added, changed or
+        removed.
+
+        Entries are compared by ent_seq and the content hash stored with
+        them. A changed entry has all of its rows deleted and inserted again.
+        The whole update is done in one transaction. Full-text indexes made
+        with fill(full_text=True) are kept in step, and so is the entry_doc
+        table, whether or not entry_docs was set. If an autocomplete_path is
+        given, the prefix index there is rewritten from the updated
+        database. Returns a dict with the sorted ent_seqs that were 'added',
+        'modified' and 'removed'.
+        """
+        if source is None:
+            source = JMDICT_PATH
+
+        self.connect(db_path)
+        new_tables = self.start(durability)
+        conn = self.conn
+        self.entry_docs = conn.dialect.has_table(conn, entry_doc.name)
+        update_seq.create(conn)
+        fts_specs = fts.existing(conn, fts.JMDICT)
+
+        print("Updating database with JMdict data...")
+        start = time.time()
+
+        old = {}
+        for ent_seq, content_hash in conn.execute(select(
+                [entry.c.ent_seq, entry.c.content_hash])):
+            old[ent_seq] = content_hash
+        changes = {'added': [], 'modified': [], 'removed': []}
+
+        #Changed entries are copied (the parser clears them) and saved in
+        #batches: their old rows are deleted first, so the numbering of the
+        #new rows can continue from the pks that are left.
+        batch = []
+        def save_batch():
+            ent_seqs = [int(e.findtext("ent_seq")) for e in batch]
+            delete_entries(conn, ent_seqs, fts_specs, self.entry_docs)
+            pks = last_pks(conn)
+            for e in batch:
+                self.parse_entry(e, pks)
+            self.flush(len(batch))
+            index_entries(conn, ent_seqs, fts_specs)
+            del batch[:]
+
+        try:
+            with stream.open_source(source) as f:
+                for elem in stream.iter_elements(f, "entry"):
+                    ent_seq = int(elem.findtext("ent_seq"))
+                    old_hash = old.pop(ent_seq, None)
+                    if old_hash is None:
+                        changes['added'].append(ent_seq)
+                    elif old_hash != entry_hash(elem):
+                        changes['modified'].append(ent_seq)
+                    else:
+                        continue
+                    batch.append(copy.deepcopy(elem))
+                    if len(batch) >= self.n_to_save:
+                        save_batch()
+            save_batch()
+
+            #whatever wasn't seen in the new file was removed from it
+            changes['removed'] = list(old)
+            delete_entries(conn, changes['removed'], fts_specs,
+                           self.entry_docs)
+            if any(changes.values()):
+                bulk.new_generation(conn, build_info)
+            self.finish_writing()
+            bulk.create_indexes(conn, new_tables)
+            if autocomplete_path:
+                headwords = autocomplete.Collector()
+                headwords.add_database(conn)
+                autocomplete.write_index(autocomplete_path, headwords.records)
+        except:
+            self.abort()
+            raise
+        finally:
+            update_seq.drop(conn)
+            self.close()
+
+        for ent_seqs in changes.values():
+            ent_seqs.sort()
+        seconds = time.time() - start
+        self.metrics['seconds'] += seconds
+        print('Added %d, modified %d and removed %d entries in %s seconds' %
+              (len(changes['added']), len(changes['modified']),
+               len(changes['removed']), seconds))
+        return changes
+
+
+def split_chunks(path, n_chunks):
+    """
+    Split the JMdict file at path into about n_chunks byte ranges that each
+    hold whole <entry> elements.
+
+    Returns the prolog (everything before the first entry, which holds the
+    entity declarations every chunk needs to be parsed) and a list of
+    (start, end, n_entries, pks) tuples. pks are the primary keys used
+    before the chunk, counted from the tags in the earlier chunks, so each
+    chunk can be parsed on its own. Raises ValueError if the file has no
+    <JMdict> element or no entries.
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            #skip the DTD, if there is one, whose comments might mention
+            #entries
+            root = 0
+            doctype = data.find(b'<!DOCTYPE')
+            if doctype != -1:
+                root = max(data.find(b']>', doctype), doctype)
+            root = data.find(b'<JMdict>', root)
+            last = data.rfind(b'</JMdict>')
+            if root == -1 or last < root:
+                raise ValueError('%s has no <JMdict> element' % path)
+            first = data.find(b'<entry>', root, last)
+            if first == -1:
+                raise ValueError('%s has no entries' % path)
+            prolog = data[:first]
+            size = max((last - first) // n_chunks, 1)
+            pks = new_pks()
+            chunks = []
+            start = first
+            while start < last:
+                end = data.find(b'<entry>', start + size, last)
+                if end == -1:
+                    end = last
+                chunk = data[start:end]
+                chunks.append((start, end, chunk.count(b'<entry>'), dict(pks)))
+                for table in pks:
+                    pks[table] += chunk.count(('<%s>' % table).encode('ascii'))
+                start = end
+        finally:
+            data.close()
+    return prolog, chunks
+
+def parse_chunk(path, prolog, start, end, pks, make_docs=False):
+    """
+    Parse the entries between byte offsets start and end of the JMdict file
+    at path with a Loader of its own, with entry_docs set to make_docs.
+    Returns the queued rows of each table, in all_l order.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        document = prolog + f.read(end - start) + b'</JMdict>'
+    loader = Loader(docs=make_docs)
+    pks = dict(pks)
+    for elem in stream.iter_elements(io.BytesIO(document), "entry"):
+        loader.parse_entry(elem, pks)
+    return [table_l for table_l, insert in loader.all_l]
+
+def _parse_chunk(args):
+    return parse_chunk(*args)
+
+def fill_database(db_path, durability=bulk.DEFAULT_DURABILITY, commit_every=0,
+                  raw=False, processes=1, background=False, source=None,
+                  full_text=False, autocomplete_path=None, docs=False,
+                  export_dir=None, export_format='parquet'):
+    """
+    Fill the supplied database with jmdict data, using a Loader of its own
+    made with raw and docs. The other arguments are those of Loader.fill().
+    Returns the metrics of the loader.
+    """
+    loader = Loader(raw, docs)
+    loader.fill(db_path, durability, commit_every, processes, background,
+                source, full_text, autocomplete_path, export_dir,
+                export_format)
+    return loader.metrics
     
-    global conn
 
-    engine = create_engine(db_path, echo=False)
-    f = open(JMDICT_PATH)
-    metadata.create_all(engine)
-    conn = engine.connect()
-    
-    print("Filling database with JMdict data. This takes a while...")
-    start = time.time()
-    
-    #Primary keys of tables that are used as foreign keys by sub-element
-    #tables. The xml file is parsed in document order, so we can be sure
-    #the pk matches the sub elements.
-    k_ele_pk = 0
-    r_ele_pk = 0
-    info_pk = 0
-    sense_pk = 0
-    
-    #Call save_all() after n_to_save elements. This shaves off a few seconds.
-    n_to_save = 15000
-    save_now = 0
-    for event, elem in iterparse(f):
-        if elem.tag == "entry":
-            ent_seq = None
-            for e in elem:
-                if e.tag == "ent_seq":
-                    ent_seq = e.text
-                    entry_l.append({'ent_seq':ent_seq})
-                elif e.tag == "k_ele":
-                    k_ele_pk += 1
-                    parse_k_ele(ent_seq, k_ele_pk, e)
-                elif e.tag == "r_ele":
-                    r_ele_pk += 1
-                    parse_r_ele(ent_seq, r_ele_pk, e)
-                elif e.tag == "info":
-                    info_pk += 1
-                    parse_info(ent_seq, info_pk, e)
-                elif e.tag == "sense":
-                    sense_pk += 1
-                    parse_sense(ent_seq, sense_pk, e)
-            save_now += 1
-            if save_now > n_to_save:
-                save_all()
-                save_now = 0
-
-            elem.clear() #free memory of no longer needed nodes
-    
-    #ensure the leftover rows are saved
-    global n_to_commit
-    n_to_commit = 0
-    save_all()
-    
-    print('Filling database with JMdict data took '
-          '%s seconds', (time.time() - start))
-    print("Done.")
-    f.close()
-    conn.close()
-    
+def entry_filter(table, ent_seqs):
+    """
+    A where clause selecting the rows of table that belong to the entries
+    selected by ent_seqs, following the foreign keys up to the entry table.
+    None if table isn't linked to entries.
+    """
+    if table is entry:
+        return entry.c.ent_seq.in_(ent_seqs)
+    for fk in table.foreign_keys:
+        if fk.column.table is entry:
+            return fk.parent.in_(ent_seqs)
+        parent_filter = entry_filter(fk.column.table, ent_seqs)
+        if parent_filter is not None:
+            return fk.parent.in_(select([fk.column], parent_filter))
+    return None
+
+#Holds the ent_seqs of the entries being replaced by update_database()
+update_seq = Table('update_seq', MetaData(),
+                    Column('ent_seq', Integer, primary_key=True),
+                    prefixes=['TEMPORARY'])
+
+def delete_entries(conn, ent_seqs, fts_specs=(), docs=False):
+    """
+    Delete the given entries and every row that belongs to them, taking
+    them out of the full-text indexes of fts_specs first. Their entry_doc
+    rows go too if docs is set.
+    """
+    ent_seqs = list(ent_seqs)
+    if not ent_seqs:
+        return
+    conn.execute(update_seq.insert(), [{'ent_seq':s} for s in ent_seqs])
+    selected = select([update_seq.c.ent_seq])
+    fts.change(conn, metadata, fts_specs,
+               lambda table: entry_filter(table, selected), 'delete')
+    for table in reversed(metadata.sorted_tables):
+        where = entry_filter(table, selected)
+        if where is not None:
+            conn.execute(table.delete().where(where))
+    if docs:
+        conn.execute(entry_doc.delete().where(entry_doc.c.ent_seq.in_(
+            selected)))
+    conn.execute(update_seq.delete())
+
+def index_entries(conn, ent_seqs, fts_specs):
+    """Add the rows of the given entries to the full-text indexes."""
+    ent_seqs = list(ent_seqs)
+    if not ent_seqs or not fts_specs:
+        return
+    conn.execute(update_seq.insert(), [{'ent_seq':s} for s in ent_seqs])
+    selected = select([update_seq.c.ent_seq])
+    fts.change(conn, metadata, fts_specs,
+               lambda table: entry_filter(table, selected), 'insert')
+    conn.execute(update_seq.delete())
+
+def last_pks(conn):
+    """The pks to continue numbering k_ele, r_ele, info and sense rows from."""
+    pks = new_pks()
+    for name in pks:
+        table = metadata.tables[name]
+        pks[name] = conn.execute(select([func.max(table.c.id)])).scalar() or 0
+    return pks
+
+def update_database(db_path, durability=bulk.DEFAULT_DURABILITY, raw=False,
+                    source=None, autocomplete_path=None):
+    """
+    Bring a database made by fill_database() up to date with a new version
+    of JMdict, using a Loader of its own made with raw (see Loader.update).
+    Returns a dict with the sorted ent_seqs that were 'added', 'modified'
+    and 'removed'.
+    """
+    return Loader(raw).update(db_path, durability, source, autocomplete_path)
+
 
 def download_dictionary():
+    """
+    Download the dictionary, or check for a newer one if we already have a
+    copy. That check is a single conditional request if nothing changed.
+    """
     if not os.path.exists(JMDICT_PATH):
-        print("JMdict not found. Downloading...")
-        download.download_jmdict()
+        print("JMdict.gz not found. Downloading...")
+    download.download_jmdict()
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        db_url = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Create a JMdict database.')
+    parser.add_argument('db_url', nargs='?',
+                        help='SQLAlchemy database url (default: a new SQLite '
+                             'database, "jmdict.sqlite", here)')
+    parser.add_argument('--durability', choices=sorted(bulk.DURABILITY_LEVELS),
+                        default=bulk.DEFAULT_DURABILITY,
+                        help='SQLite safety level used during the build')
+    parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+                        help='commit after every N entries instead of once')
+    parser.add_argument('--raw-insert', action='store_true',
+                        help="insert rows with the database driver's "
+                             "executemany() instead of SQLAlchemy")
+    parser.add_argument('--background-writer', action='store_true',
+                        help='write to the database on a separate thread '
+                             'while parsing continues')
+    parser.add_argument('--processes', type=int, default=1, metavar='N',
+                        help='parse the dictionary with N processes (a '
+                             'gzipped one is decompressed to a temporary '
+                             'file first)')
+    parser.add_argument('--fts', action='store_true',
+                        help='add SQLite FTS5 full-text indexes of the '
+                             'glosses, readings and kanji')
+    parser.add_argument('--autocomplete', metavar='PATH',
+                        help='also write a prefix index of the headwords '
+                             'for autocompletion to PATH')
+    parser.add_argument('--docs', action='store_true',
+                        help='also store a compressed document of each entry '
+                             'for fast lookups')
+    parser.add_argument('--export', metavar='DIR',
+                        help='also write every table to a file in DIR')
+    parser.add_argument('--export-format', choices=sorted(columnar.FORMATS),
+                        default='parquet',
+                        help='format of the --export files (needs pyarrow)')
+    parser.add_argument('--update', action='store_true',
+                        help='only apply the entries that changed to an '
+                             'existing database')
+    parser.add_argument('--manifest', metavar='PATH',
+                        help='with --update, write the ent_seqs that changed '
+                             'to this file as JSON (see manifest.py)')
+    parser.add_argument('--dictionary', metavar='PATH',
+                        help='JMdict file to use, gzipped or not (default: '
+                             'download it to %s)' % JMDICT_PATH)
+    args = parser.parse_args()
+
+    if args.db_url:
+        db_url = args.db_url
+    elif args.update:
+        db_url = 'sqlite:///jmdict.sqlite'
+
+        print('Database url not specified. Updating the SQLite database'
+              ', "jmdict.sqlite", here.')
     else:
         db_url = 'sqlite:///jmdict.sqlite'
         
@@ -455,5 +893,17 @@ if __name__ == '__main__':
         if os.path.exists('jmdict.sqlite'):
             print('Overwriting existing database named jmdict.sqlite')
             os.remove('jmdict.sqlite')
-    download_dictionary()
-    fill_database(db_url)
\ No newline at end of file
+    if args.dictionary is None:
+        download_dictionary()
+    if args.update:
+        changes = update_database(db_url, args.durability, args.raw_insert,
+                                  args.dictionary, args.autocomplete)
+        if args.manifest:
+            from . import manifest
+            with open(args.manifest, 'w') as f:
+                manifest.write_manifest(changes, f)
+    else:
+        fill_database(db_url, args.durability, args.commit_every,
+                      args.raw_insert, args.processes, args.background_writer,
+                      args.dictionary, args.fts, args.autocomplete, args.docs,
+                      args.export, args.export_format)
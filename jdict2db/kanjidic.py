@@ -4,294 +4,401 @@
 
 import os
 import time
-import sys
-from xml.etree.cElementTree import iterparse
-from sqlalchemy import create_engine, Table, Column, Integer, String, Unicode,\
+import argparse
+from sqlalchemy import Table, Column, Integer, String, Unicode, LargeBinary, \
                        ForeignKey, MetaData
 from . import download
+from . import bulk
+from . import stream
+from . import fts
+from . import columnar
 
 
-KANJIDIC2_PATH = '../data/kanjidic2.xml'
+KANJIDIC2_PATH = '../data/kanjidic2.xml.gz'
 
 metadata = MetaData()
-engine = None
-conn = None
-
-#All table_l variables are both global and are referenced inside all_l.
-#table_l values are lists of pending row insertions. They are global as
-#they need to be conveniently accessed to insert data into them. all_l will be
-#a list of lists. Each sub-list = [table_l, table.insert()]
-#table.insert() is a re-usable insert statement for that table (it's identical
-#each time, so no need to keep requesting it)
-all_l = []
-
-#value to use as number of rows needed in a table_l list before we save it
-#(large performance improvement by having fewer commits with more data)
-n_to_commit = 10000
-
-#Set up database tables
+#The tables rows are queued for by Loader, in the order of its all_l. Each
+#has a list of pending rows in the Loader attribute named after it (see
+#bulk.Loader).
+tables = []
+
+#Set up database tables. Every foreign key is indexed; like the other indexes
+#declared here, they are only built once all the data is loaded (see
+#bulk.create_indexes).
 character = Table('character', metadata,
                     Column('literal', Unicode, primary_key=True),
                     Column('grade', Integer),
                     Column('freq', Integer),
                     Column('jlpt', Integer),
                   )
-character_l = []
-all_l.append([character_l, character.insert()])
+tables.append(character)
 
 stroke_count = Table('stroke_count', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('stroke_count', Integer, nullable=False),
                   )
-stroke_count_l = []
-all_l.append([stroke_count_l, stroke_count.insert()])
+tables.append(stroke_count)
 
 variant = Table('variant', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('variant', String, nullable=False),
                     Column('var_type', String, nullable=False),
                   )
-variant_l = []
-all_l.append([variant_l, variant.insert()])
+tables.append(variant)
 
 rad_name = Table('rad_name', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('rad_name', Unicode, nullable=False),
                   )
-rad_name_l = []
-all_l.append([rad_name_l, rad_name.insert()])
+tables.append(rad_name)
    
 dic_ref = Table('dic_ref', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('dic_ref', String, nullable=False),
                     Column('dr_type', String, nullable=False),
                     Column('m_vol', String, nullable=True),
                     Column('m_page', String, nullable=True),
                   )
-dic_ref_l = []
-all_l.append([dic_ref_l, dic_ref.insert()])
+tables.append(dic_ref)
 
 query_code = Table('query_code', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
-                    Column('q_code', Unicode, nullable=False),
+                           ForeignKey('character.literal'), index=True),
+                    Column('q_code', Unicode, nullable=False, index=True),
                     Column('qc_type', String, nullable=False),
                     Column('skip_misclass', String, nullable=True),
                   )
-query_code_l = []
-all_l.append([query_code_l, query_code.insert()])
+tables.append(query_code)
 
 codepoint = Table('codepoint', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('cp_value', String, nullable=False),
                     Column('cp_type', String, nullable=False)
                   )
-codepoint_l = []
-all_l.append([codepoint_l, codepoint.insert()])
+tables.append(codepoint)
 
 rad_value = Table('rad_value', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('rad_value', Integer, nullable=False),
                     Column('rad_type', String, nullable=False)
                     )
-rad_value_l = []
-all_l.append([rad_value_l, rad_value.insert()])
+tables.append(rad_value)
 
 reading = Table('reading', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
-                    Column('reading', Unicode, nullable=False),
+                           ForeignKey('character.literal'), index=True),
+                    Column('reading', Unicode, nullable=False, index=True),
                     Column('r_type', String, nullable=False),
                     Column('on_type', String, nullable=True),
                     Column('r_status', String, nullable=True)
                   )
-reading_l = []
-all_l.append([reading_l, reading.insert()])
+tables.append(reading)
 
 meaning = Table('meaning', metadata,
                     Column('id', Integer, primary_key=True),
                     Column('character_literal', Unicode,
-                           ForeignKey('character.literal')),
+                           ForeignKey('character.literal'), index=True),
                     Column('meaning', Unicode, nullable=False),
                     Column('m_lang', String, nullable=False)
                   )
-meaning_l = []
-all_l.append([meaning_l, meaning.insert()])
+tables.append(meaning)
 
 nanori = Table('nanori', metadata,
                  Column('id', Integer, primary_key=True),
                  Column('character_literal', Unicode,
-                        ForeignKey('character.literal')),
+                        ForeignKey('character.literal'), index=True),
                  Column('nanori', Unicode, nullable=False)
                  )
-nanori_l = []
-all_l.append([nanori_l, nanori.insert()])
+tables.append(nanori)
+
+build_info = bulk.build_info_table(metadata)
 
+#The bitsets of the optional search index of bitmap.py, one per value of each
+#attribute. Kept out of metadata so it is only created when asked for.
+bitmap_metadata = MetaData()
+kanji_bitmap = Table('kanji_bitmap', bitmap_metadata,
+                    Column('attribute', String, primary_key=True),
+                    Column('value', Unicode, primary_key=True),
+                    Column('bits', LargeBinary))
 
 
-def save_all():
+class Loader(bulk.Loader):
     """
-    Commit data held in each table_l list.
-    Avoid trying to commit an empty list.
+    Loads KANJIDIC2 into a database, queueing the rows of each character in
+    its own lists (see bulk.Loader).
     """
-    for list in all_l:
-        table_l = list[0]
-        insert = list[1]
+
+    tables = tables
+    metadata = metadata
+    #Save the queued rows after n_to_save elements. Slight speedup
+    n_to_save = 5000
+
+    def __init__(self, raw=False, n_to_save=None):
+        """
+        With raw=True rows are inserted through the driver directly (see
+        bulk.save_all).
+        """
+        bulk.Loader.__init__(self, raw, n_to_save)
+        self.characters = None
+
+    def parse_misc(self, literal, node):
+        grade = None
+        freq = None
+        jlpt = None
+        for m in node:
+            if m.tag == "grade":
+                grade = m.text
+            elif m.tag == "stroke_count":
+                self.stroke_count_l.append((literal, m.text))
+            elif m.tag == "variant":
+                self.variant_l.append((literal,
+                                       m.text,
+                                       m.get("var_type")))
+            elif m.tag == "freq":
+                freq = m.text
+            elif m.tag == "rad_name":
+                self.rad_name_l.append((literal, str(m.text)))
+            elif m.tag == "jlpt":
+                jlpt = m.text
         
-        if len(table_l) > 0:
-            conn.execute(insert, table_l)
-            del table_l[:]  #empty the list after committing it   
-
-def parse_misc(literal, node):
-    grade = None
-    freq = None
-    jlpt = None
-    for m in node:
-        if m.tag == "grade":
-            grade = m.text
-        elif m.tag == "stroke_count":
-            stroke_count_l.append({'character_literal':literal,
-                                   'stroke_count':m.text})
-        elif m.tag == "variant":
-            variant_l.append({'character_literal':literal,
-                              'variant':m.text,
-                              'var_type':m.get("var_type")})
-        elif m.tag == "freq":
-            freq = m.text
-        elif m.tag == "rad_name":
-            rad_name_l.append({'character_literal':literal,
-                               'rad_name':str(m.text)})
-        elif m.tag == "jlpt":
-            jlpt = m.text
-    
-    character_l.append({'literal':literal, 
-                        'grade':grade,
-                        'freq':freq,
-                        'jlpt':jlpt})
+        self.character_l.append((literal,
+                                 grade,
+                                 freq,
+                                 jlpt))
         
-def parse_dic_number(literal, node):
-    for d in node:
-        dic_ref_l.append({'character_literal':literal,
-                          'dic_ref':d.text,
-                          'dr_type':d.get("dr_type"),
-                          'm_vol':d.get("m_vol"),
-                          'm_page':d.get("m_page")})
-
-def parse_query_code(literal, node):
-    for q in node:
-        query_code_l.append({'character_literal':literal,
-                             'q_code':q.text,
-                             'qc_type':q.get("qc_type"),
-                             'skip_misclass':q.get("skip_misclass")})
+    def parse_dic_number(self, literal, node):
+        for d in node:
+            self.dic_ref_l.append((literal,
+                                   d.text,
+                                   d.get("dr_type"),
+                                   d.get("m_vol"),
+                                   d.get("m_page")))
+
+    def parse_query_code(self, literal, node):
+        for q in node:
+            self.query_code_l.append((literal,
+                                      q.text,
+                                      q.get("qc_type"),
+                                      q.get("skip_misclass")))
         
-def parse_reading_meaning(literal, node):
-    for rm in node:
-        if rm.tag == "rmgroup":
-            for rmg in rm:
-                if rmg.tag == "reading":
-                    reading_l.append({'character_literal':literal,
-                                      'reading':str(rmg.text),
-                                      'r_type':rmg.get("r_type"),
-                                      'on_type':rmg.get("on_type"),
-                                      'r_status':rmg.get("r_status")})
-                elif rmg.tag == "meaning":
-                    m_lang = rmg.get("m_lang")
-                    if m_lang is None:
-                        m_lang = "en"
-                    meaning_l.append({'character_literal':literal,
-                                      'meaning':str(rmg.text),
-                                      'm_lang':m_lang}) 
-        elif rm.tag == "nanori":
-            nanori_l.append({'character_literal':literal,
-                             'nanori':str(rm.text)})
-
-def parse_radical(literal, node):
-    for r in node:
-        rad_value_l.append({'character_literal':literal,
-                            'rad_value':r.text,
-                            'rad_type':r.get("rad_type")})
-
-def parse_codepoint(literal, node):
-    for c in node:
-        codepoint_l.append({'character_literal':literal,
-                            'cp_value':c.text,
-                            'cp_type':c.get("cp_type")})
-
-def fill_database(db_path=None):
-    """Fill the supplied database with kanjidic data."""
-    
-    global conn
-                
-    engine = create_engine(db_path, echo=False)
-    f = open(KANJIDIC2_PATH)    
-    metadata.create_all(engine)
-    conn = engine.connect()
-    
-    print("Filling database with KANJIDIC2 data. This takes a while...")
-    start = time.time()
-    
-    #Call save_all() after n_to_save elements. Slight speedup
-    n_to_save = 5000
-    save_now = 0
-    for event, elem in iterparse(f):
+    def parse_reading_meaning(self, literal, node):
+        for rm in node:
+            if rm.tag == "rmgroup":
+                for rmg in rm:
+                    if rmg.tag == "reading":
+                        self.reading_l.append((literal,
+                                               str(rmg.text),
+                                               rmg.get("r_type"),
+                                               rmg.get("on_type"),
+                                               rmg.get("r_status")))
+                    elif rmg.tag == "meaning":
+                        m_lang = rmg.get("m_lang")
+                        if m_lang is None:
+                            m_lang = "en"
+                        self.meaning_l.append((literal,
+                                               str(rmg.text),
+                                               m_lang)) 
+            elif rm.tag == "nanori":
+                self.nanori_l.append((literal, str(rm.text)))
+
+    def parse_radical(self, literal, node):
+        for r in node:
+            self.rad_value_l.append((literal,
+                                     r.text,
+                                     r.get("rad_type")))
+
+    def parse_codepoint(self, literal, node):
+        for c in node:
+            self.codepoint_l.append((literal,
+                                     c.text,
+                                     c.get("cp_type")))
+
+    def parse_character(self, elem):
+        """Queue the rows of one <character> element."""
         literal = None
-        if elem.tag == "character":
-            for e in elem:
-                if e.tag == "literal":
-                    literal = e.text
-                elif e.tag == "codepoint":
-                    parse_codepoint(literal, e)
-                elif e.tag == "radical":
-                    parse_radical(literal, e)
-                elif e.tag == "misc":
-                    parse_misc(literal, e)
-                elif e.tag == "dic_number": 
-                    parse_dic_number(literal, e)
-                elif e.tag == "query_code":
-                    parse_query_code(literal, e)
-                elif e.tag == "reading_meaning":
-                    parse_reading_meaning(literal, e)
-
-            save_now += 1
-            if save_now > n_to_save:
-                save_all()
-                save_now = 0
+        for e in elem:
+            if e.tag == "literal":
+                literal = e.text
+            elif e.tag == "codepoint":
+                self.parse_codepoint(literal, e)
+            elif e.tag == "radical":
+                self.parse_radical(literal, e)
+            elif e.tag == "misc":
+                self.parse_misc(literal, e)
+            elif e.tag == "dic_number": 
+                self.parse_dic_number(literal, e)
+            elif e.tag == "query_code":
+                self.parse_query_code(literal, e)
+            elif e.tag == "reading_meaning":
+                self.parse_reading_meaning(literal, e)
+
+    def collect(self):
+        #The rows are exported and gathered for the snapshot before they are
+        #handed to the writer
+        bulk.Loader.collect(self)
+        if self.characters is not None:
+            self.characters.add_rows(self.all_l)
+
+    def fill(self, db_path, durability=bulk.DEFAULT_DURABILITY,
+             commit_every=0, background=False, source=None, full_text=False,
+             export_dir=None, export_format='parquet', snapshot_path=None,
+             bitmaps=False):
+        """
+        Fill the supplied database with kanjidic data.
+
+        source is the path of the dictionary (KANJIDIC2_PATH by default) or
+        a file object to read it from, gzipped or not (see
+        stream.open_source).
+
+        The inserts are done in one transaction, or in one per commit_every
+        characters if it is set. durability is a key of
+        bulk.DURABILITY_LEVELS and picks the SQLite settings used during the
+        build. With background=True, the rows are written on a separate
+        thread while parsing goes on (see bulk.BackgroundWriter). With
+        full_text=True, an FTS5 index of the meanings is added once the data
+        is loaded (see fts.py). With an export_dir, every table is also
+        written there as it is parsed, to a Parquet or Arrow file depending
+        on export_format (see columnar.py). With a snapshot_path, a
+        read-only snapshot of the characters for lookups without a database
+        is written there (see snapshot.py). With bitmaps=True, the bitsets
+        of the radical, stroke count and SKIP search index of bitmap.py are
+        stored in the kanji_bitmap table.
+        """
+        if source is None:
+            source = KANJIDIC2_PATH
                 
-            elem.clear() #free memory of no longer needed nodes
-    
-    #ensure the leftover rows are saved
-    save_all()
+        self.connect(db_path, background)
+        if full_text and not fts.available(self.conn):
+            self.close()
+            raise ValueError('Full-text indexes need SQLite with FTS5 and '
+                             'its trigram tokenizer')
+        new_tables = self.start(durability, background, commit_every)
+        
+        print("Filling database with KANJIDIC2 data. This takes a while...")
+        start = time.time()
+        
+        save_now = 0
+        if snapshot_path:
+            from . import snapshot
+            self.characters = snapshot.Collector()
+        else:
+            self.characters = None
+        try:
+            if export_dir:
+                self.exporter = columnar.Exporter(export_dir, self.all_l,
+                                                  metadata, export_format)
+            with stream.open_source(source) as f:
+                for elem in stream.iter_elements(f, "character"):
+                    self.parse_character(elem)
+                    save_now += 1
+                    if save_now > self.n_to_save:
+                        self.flush(save_now)
+                        save_now = 0
+            
+            #ensure the leftover rows are saved
+            self.finish_writing(save_now)
+            bulk.new_generation(self.conn, build_info)
+            bulk.create_indexes(self.conn, new_tables)
+            if full_text:
+                with self.conn.begin():
+                    fts.create_tables(self.conn, fts.KANJIDIC)
+            if bitmaps:
+                from . import bitmap
+                with self.conn.begin():
+                    bitmap.create_table(self.conn)
+            if self.exporter is not None:
+                self.exporter.finish()
+            if self.characters is not None:
+                snapshot.write_snapshot(snapshot_path, self.characters)
+        except:
+            self.abort()
+            raise
+        finally:
+            self.characters = None
+            self.close()
+
+        seconds = time.time() - start
+        self.metrics['seconds'] += seconds
+        print(('Filling database with KANJIDIC2 data took '
+              ' %s seconds' % seconds))
+        print("Done.")
 
-    print(('Filling database with KANJIDIC2 data took '
-          ' %s seconds' % (time.time() - start)))
-    print("Done.")
 
-    f.close()
-    conn.close()
+def fill_database(db_path=None, durability=bulk.DEFAULT_DURABILITY,
+                  commit_every=0, raw=False, background=False, source=None,
+                  full_text=False, export_dir=None, export_format='parquet',
+                  snapshot_path=None, bitmaps=False):
+    """
+    Fill the supplied database with kanjidic data, using a Loader of its own
+    made with raw. The other arguments are those of Loader.fill(). Returns
+    the metrics of the loader.
+    """
+    loader = Loader(raw)
+    loader.fill(db_path, durability, commit_every, background, source,
+                full_text, export_dir, export_format, snapshot_path, bitmaps)
+    return loader.metrics
     
 
 def download_dictionary():
+    """
+    Download the dictionary, or check for a newer one if we already have a
+    copy. That check is a single conditional request if nothing changed.
+    """
     if not os.path.exists(KANJIDIC2_PATH):
-        print("kanjidic2.xml not found. Downloading...")
-        download.download_kanjidic2()
+        print("kanjidic2.xml.gz not found. Downloading...")
+    download.download_kanjidic2()
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        db_url = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Create a KANJIDIC2 database.')
+    parser.add_argument('db_url', nargs='?',
+                        help='SQLAlchemy database url (default: a new SQLite '
+                             'database, "kanjidic.sqlite", here)')
+    parser.add_argument('--durability', choices=sorted(bulk.DURABILITY_LEVELS),
+                        default=bulk.DEFAULT_DURABILITY,
+                        help='SQLite safety level used during the build')
+    parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+                        help='commit after every N characters instead of once')
+    parser.add_argument('--raw-insert', action='store_true',
+                        help="insert rows with the database driver's "
+                             "executemany() instead of SQLAlchemy")
+    parser.add_argument('--background-writer', action='store_true',
+                        help='write to the database on a separate thread '
+                             'while parsing continues')
+    parser.add_argument('--fts', action='store_true',
+                        help='add an SQLite FTS5 full-text index of the '
+                             'meanings')
+    parser.add_argument('--export', metavar='DIR',
+                        help='also write every table to a file in DIR')
+    parser.add_argument('--export-format', choices=sorted(columnar.FORMATS),
+                        default='parquet',
+                        help='format of the --export files (needs pyarrow)')
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help='also write a read-only snapshot of the '
+                             'characters for lookups to PATH')
+    parser.add_argument('--bitmaps', action='store_true',
+                        help='store a bitmap index for radical, stroke count '
+                             'and SKIP searches')
+    parser.add_argument('--dictionary', metavar='PATH',
+                        help='KANJIDIC2 file to use, gzipped or not (default: '
+                             'download it to %s)' % KANJIDIC2_PATH)
+    args = parser.parse_args()
+
+    if args.db_url:
+        db_url = args.db_url
     else:
         db_url = 'sqlite:///kanjidic.sqlite'
         
@@ -301,5 +408,9 @@ if __name__ == '__main__':
         if os.path.exists('kanjidic.sqlite'):
             print('Overwriting existing database named kanjidic.sqlite')
             os.remove('kanjidic.sqlite')
-    download_dictionary()
-    fill_database(db_url)
\ No newline at end of file
+    if args.dictionary is None:
+        download_dictionary()
+    fill_database(db_url, args.durability, args.commit_every, args.raw_insert,
+                  args.background_writer, args.dictionary, args.fts,
+                  args.export, args.export_format, args.snapshot,
+                  args.bitmaps)
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Reading whole JMdict entries and KANJIDIC2 characters back out of the
+databases made by jmdict.py and kanjidic.py.
+
+An entry is assembled with two set-based queries whatever its size: one for
+its k_ele, r_ele, info and sense rows and one, a UNION ALL over every
+sub-element table, for all the rows below those. The statements are built
+once per Lookup and only their parameters change between calls, so drivers
+with a statement cache (like sqlite3) only compile them once.
+
+Many entries at once (e.g. the hits of a search) are fetched the same way by
+get_many(): their ent_seqs go in a temporary table that the two statements
+select from, so a thousand entries still take two queries instead of
+thousands.
+
+A database built with an entry_doc table (jmdict.fill_database(docs=True))
+holds every entry as a single compressed document. Lookups use it when it is
+there: each entry is then one primary key read and a decode.
+
+Both kinds of lookups can keep what they assembled in a cache.LRUCache.
+"""
+
+import time
+from collections import namedtuple
+from sqlalchemy import create_engine
+from . import bulk
+from . import docs
+from . import jmdict
+from . import kanjidic
+
+Gloss = namedtuple('Gloss', 'gloss lang g_gend')
+LSource = namedtuple('LSource', 'lsource lang ls_type ls_wasei')
+Link = namedtuple('Link', 'link_tag link_desc link_uri')
+Bibl = namedtuple('Bibl', 'bib_tag bib_txt')
+Audit = namedtuple('Audit', 'upd_date upd_detl')
+
+Variant = namedtuple('Variant', 'variant var_type')
+DicRef = namedtuple('DicRef', 'dic_ref dr_type m_vol m_page')
+QueryCode = namedtuple('QueryCode', 'q_code qc_type skip_misclass')
+Codepoint = namedtuple('Codepoint', 'cp_value cp_type')
+RadValue = namedtuple('RadValue', 'rad_value rad_type')
+Reading = namedtuple('Reading', 'reading r_type on_type r_status')
+Meaning = namedtuple('Meaning', 'meaning m_lang')
+
+
+class Entry(object):
+    __slots__ = ('ent_seq', 'priority', 'k_ele', 'r_ele', 'info', 'sense')
+
+    def __init__(self, ent_seq, priority):
+        self.ent_seq = ent_seq
+        self.priority = priority
+        self.k_ele = []
+        self.r_ele = []
+        self.info = []
+        self.sense = []
+
+    def __repr__(self):
+        return '<Entry %s %s>' % (self.ent_seq,
+                                  '/'.join([k.keb for k in self.k_ele] +
+                                           [r.reb for r in self.r_ele]))
+
+class KEle(object):
+    __slots__ = ('keb', 'priority', 'ke_inf', 'ke_pri')
+
+    def __init__(self, keb, priority):
+        self.keb = keb
+        self.priority = priority
+        self.ke_inf = []
+        self.ke_pri = []
+
+class REle(object):
+    __slots__ = ('reb', 're_nokanji', 'priority', 're_restr', 're_inf',
+                 're_pri')
+
+    def __init__(self, reb, re_nokanji, priority):
+        self.reb = reb
+        self.re_nokanji = bool(re_nokanji)
+        self.priority = priority
+        self.re_restr = []
+        self.re_inf = []
+        self.re_pri = []
+
+class Info(object):
+    __slots__ = ('links', 'bibl', 'etym', 'audit')
+
+    def __init__(self):
+        self.links = []
+        self.bibl = []
+        self.etym = []
+        self.audit = []
+
+class Sense(object):
+    __slots__ = ('stagk', 'stagr', 'pos', 'xref', 'ant', 'field', 'misc',
+                 's_inf', 'lsource', 'dial', 'gloss', 'example')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, [])
+
+class Character(object):
+    __slots__ = ('literal', 'grade', 'freq', 'jlpt', 'stroke_count',
+                 'variant', 'rad_name', 'dic_ref', 'query_code', 'codepoint',
+                 'rad_value', 'reading', 'meaning', 'nanori')
+
+    def __init__(self, literal, grade, freq, jlpt):
+        self.literal = literal
+        self.grade = grade
+        self.freq = freq
+        self.jlpt = jlpt
+        for name in self.__slots__[4:]:
+            setattr(self, name, [])
+
+    def __repr__(self):
+        return '<Character %s>' % self.literal
+
+
+#How to build the objects for the rows of each table below entry, from the
+#values of their columns. Rows of the tables below those become a record if
+#there is one for their table, or just their value otherwise. Either way they
+#are added to the attribute of their parent that is named after the table.
+PARENTS = {'k_ele': lambda v: KEle(v[0], v[1]),
+           'r_ele': lambda v: REle(v[0], v[1], v[2]),
+           'info': lambda v: Info(),
+           'sense': lambda v: Sense()}
+RECORDS = {'lsource': lambda v: LSource(v[0], v[1], v[2], bool(v[3])),
+           'gloss': lambda v: Gloss(*v[:3]),
+           'links': lambda v: Link(*v[:3]),
+           'bibl': lambda v: Bibl(*v[:2]),
+           'audit': lambda v: Audit(*v[:2])}
+KANJI_RECORDS = {'variant': Variant,
+                 'dic_ref': DicRef,
+                 'query_code': QueryCode,
+                 'codepoint': Codepoint,
+                 'rad_value': RadValue,
+                 'reading': Reading,
+                 'meaning': Meaning}
+
+#Seconds between checks of the generation of the database, when cached
+#values could be out of date
+CHECK_EVERY = 1.0
+
+
+class BaseLookup(object):
+    """
+    The connection, statement building and caching shared by the lookups.
+    db is an SQLAlchemy url or engine. cache is an optional cache.LRUCache;
+    every check_every seconds the build generation of the database is read
+    again and the cache emptied if it changed. Not thread safe: use one
+    lookup per thread.
+    """
+
+    def __init__(self, db, cache=None, check_every=CHECK_EVERY):
+        if not hasattr(db, 'raw_connection'):
+            db = create_engine(db, echo=False)
+        self.dbapi_conn = db.raw_connection()
+        self.dbapi = db.dialect.dbapi
+        self.paramstyle = db.dialect.dbapi.paramstyle
+        self.quote = db.dialect.identifier_preparer.quote
+        self.cache = cache
+        self.check_every = check_every
+        self.checked = None
+        self.generation_sql = self.prepare(
+            'SELECT value FROM build_info WHERE name = ?')[0]
+
+    def close(self):
+        self.dbapi_conn.close()
+
+    def prepare(self, sql):
+        """Put the driver's parameter markers in sql, counting them."""
+        parts = sql.split('?')
+        marker = bulk.PLACEHOLDERS[self.paramstyle]
+        prepared = parts[0]
+        for i, part in enumerate(parts[1:]):
+            prepared += marker(i) + part
+        return prepared, len(parts) - 1
+
+    def generation(self):
+        """
+        The generation id of the database (see bulk.new_generation), or None
+        for a database built before they were recorded.
+        """
+        cursor = self.dbapi_conn.cursor()
+        try:
+            cursor.execute(self.generation_sql, ('generation',))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except self.dbapi.Error:
+            return None
+        finally:
+            cursor.close()
+            self.dbapi_conn.rollback()
+
+    def check_cache(self):
+        """Empty the cache if the database was rebuilt since it was filled."""
+        now = time.time()
+        if self.checked is None or now - self.checked >= self.check_every:
+            self.cache.validate(self.generation())
+            self.checked = now
+
+    def cached(self, keys, fetch):
+        """
+        The values for keys, from the cache when it holds them and from
+        fetch(missing keys), a list of (key, value), otherwise. Keys with no
+        value are left out.
+        """
+        if self.cache is None:
+            return dict(fetch(keys))
+        self.check_cache()
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            for key, value in fetch(missing):
+                self.cache.put(key, value)
+                values[key] = value
+        return values
+
+
+class Lookup(BaseLookup):
+    """
+    Fetches entries from a JMdict database. With use_docs=None, entries are
+    read from the entry_doc table if the database has one; True or False
+    forces the choice.
+    """
+
+    def __init__(self, db, cache=None, check_every=CHECK_EVERY,
+                 use_docs=None):
+        BaseLookup.__init__(self, db, cache, check_every)
+        if use_docs is None:
+            use_docs = self.has_table(jmdict.entry_doc.name)
+        self.use_docs = use_docs
+
+        #(table, value columns) of the tables right below entry, and
+        #(table, foreign key, value columns) of the tables below those
+        self.parents = []
+        self.children = []
+        for table in jmdict.metadata.sorted_tables:
+            for fk in table.foreign_keys:
+                columns = [c for c in bulk.insert_columns(table)
+                           if c != fk.parent.name]
+                if fk.column.table is jmdict.entry:
+                    self.parents.append((table, columns))
+                elif fk.column.table.name in PARENTS:
+                    self.children.append((table, fk, columns))
+        self.parent_width = max(len(c) for t, c in self.parents)
+        self.child_width = max(len(c) for t, fk, c in self.children)
+        self.parent_columns = dict((t.name, c) for t, c in self.parents)
+        self.records = {}
+        for table, fk, columns in self.children:
+            self.records[table.name] = (fk.column.table.name,
+                                        RECORDS.get(table.name))
+
+        #the statements of each way of looking entries up
+        self.statements = {}
+        for name, where in (
+                ('ent_seq', '%s = ?'),
+                ('keb', '%s IN (SELECT entry_ent_seq FROM k_ele '
+                        'WHERE keb = ?)'),
+                ('reb', '%s IN (SELECT entry_ent_seq FROM r_ele '
+                        'WHERE reb = ?)'),
+                ('many', '%s IN (SELECT ent_seq FROM lookup_seq)')):
+            if use_docs:
+                self.statements[name] = self.prepare(
+                    'SELECT doc FROM entry_doc WHERE %s' % (where % 'ent_seq'))
+            else:
+                self.statements[name] = self.build(where)
+        self.has_lookup_seq = False
+
+    def has_table(self, name):
+        """Whether the database has a table called name."""
+        cursor = self.dbapi_conn.cursor()
+        try:
+            cursor.execute('SELECT 1 FROM %s WHERE 0 = 1' % self.quote(name))
+            return True
+        except self.dbapi.Error:
+            return False
+        finally:
+            cursor.close()
+            self.dbapi_conn.rollback()
+
+    def build(self, where):
+        """
+        The two statements fetching the entries selected by where, a
+        condition on an ent_seq column with a %s for the column name and ?
+        for its parameter. Each comes with the number of ? it holds.
+        """
+        q = self.quote
+        parents = ["SELECT 'entry', ent_seq, ent_seq, priority%s FROM entry "
+                   "WHERE %s" % (', NULL' * (self.parent_width - 1),
+                                 where % 'ent_seq')]
+        for table, columns in self.parents:
+            values = ([q(c) for c in columns] +
+                      ['NULL'] * (self.parent_width - len(columns)))
+            parents.append("SELECT '%s', id, entry_ent_seq, %s FROM %s "
+                           "WHERE %s" % (table.name, ', '.join(values),
+                                         q(table.name),
+                                         where % 'entry_ent_seq'))
+        children = []
+        for table, fk, columns in self.children:
+            values = ([q(c) for c in columns] +
+                      ['NULL'] * (self.child_width - len(columns)))
+            children.append("SELECT '%s', %s, id, %s FROM %s WHERE %s IN "
+                            "(SELECT id FROM %s WHERE %s)" %
+                            (table.name, q(fk.parent.name), ', '.join(values),
+                             q(table.name), q(fk.parent.name),
+                             q(fk.column.table.name),
+                             where % 'entry_ent_seq'))
+        return (self.prepare(' UNION ALL '.join(parents) + ' ORDER BY 1, 2'),
+                self.prepare(' UNION ALL '.join(children) + ' ORDER BY 1, 3'))
+
+    def fetch(self, name, params=()):
+        """
+        Run the statements of a way of looking entries up and assemble the
+        entries they select, the ones with the highest priority score first.
+        """
+        if self.use_docs:
+            entries = self.fetch_docs(self.statements[name], params)
+        else:
+            entries = self.fetch_rows(self.statements[name], params)
+        return sorted(entries, key=lambda e: (-(e.priority or 0), e.ent_seq))
+
+    def fetch_docs(self, statement, params):
+        """The entries of the entry_doc rows selected by a statement."""
+        sql, n = statement
+        cursor = self.dbapi_conn.cursor()
+        try:
+            cursor.execute(sql, tuple(params) * n)
+            return [self.from_doc(docs.decode(row[0]))
+                    for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def from_doc(self, doc):
+        """The entry a document made by docs.build() holds."""
+        entry = Entry(doc['ent_seq'], doc['priority'])
+        for kind, columns in self.parent_columns.items():
+            objs = getattr(entry, kind)
+            for values in doc.get(kind, ()):
+                obj = PARENTS[kind]([values.get(c) for c in columns])
+                for child, child_values in values.items():
+                    if child in self.records:
+                        record = self.records[child][1]
+                        getattr(obj, child).extend(
+                            [record(v) for v in child_values] if record
+                            else child_values)
+                objs.append(obj)
+        return entry
+
+    def fetch_rows(self, statements, params):
+        """The entries selected by a pair of statements made by build()."""
+        (parent_sql, n_parent), (child_sql, n_child) = statements
+        cursor = self.dbapi_conn.cursor()
+        try:
+            entries = {}
+            parents = {}
+            #'entry' rows sort first
+            cursor.execute(parent_sql, tuple(params) * n_parent)
+            for row in cursor.fetchall():
+                kind, id, ent_seq = row[:3]
+                if kind == 'entry':
+                    entries[ent_seq] = Entry(ent_seq, row[3])
+                else:
+                    obj = PARENTS[kind](row[3:])
+                    getattr(entries[ent_seq], kind).append(obj)
+                    parents[kind, id] = obj
+            if not entries:
+                return []
+
+            cursor.execute(child_sql, tuple(params) * n_child)
+            for row in cursor.fetchall():
+                parent_kind, record = self.records[row[0]]
+                value = record(row[3:]) if record else row[3]
+                getattr(parents[parent_kind, row[1]], row[0]).append(value)
+            return list(entries.values())
+        finally:
+            cursor.close()
+
+    def create_lookup_seq(self):
+        """Create the temporary table of the ent_seqs get_many() fetches."""
+        if self.has_lookup_seq:
+            return
+        cursor = self.dbapi_conn.cursor()
+        try:
+            cursor.execute('CREATE TEMPORARY TABLE lookup_seq '
+                           '(ent_seq INTEGER PRIMARY KEY)')
+            self.dbapi_conn.commit()
+            self.has_lookup_seq = True
+        finally:
+            cursor.close()
+
+    def load(self, ent_seqs):
+        """The (ent_seq, entry) pairs of the given ent_seqs that exist."""
+        ent_seqs = list(ent_seqs)
+        if not ent_seqs:
+            return []
+        if len(ent_seqs) == 1:
+            entries = self.fetch('ent_seq', ent_seqs)
+            return [(e.ent_seq, e) for e in entries]
+        self.create_lookup_seq()
+        cursor = self.dbapi_conn.cursor()
+        try:
+            insert, n = self.prepare('INSERT INTO lookup_seq VALUES (?)')
+            cursor.executemany(insert, [(s,) for s in set(ent_seqs)])
+            entries = self.fetch('many')
+        finally:
+            cursor.close()
+            #drops the rows inserted above
+            self.dbapi_conn.rollback()
+        return [(e.ent_seq, e) for e in entries]
+
+    def get(self, ent_seq):
+        """The entry with the given ent_seq, or None."""
+        return self.cached([ent_seq], self.load).get(ent_seq)
+
+    def get_many(self, ent_seqs):
+        """
+        The entries with the given ent_seqs, in the same order. Unknown
+        ent_seqs are left out.
+        """
+        ent_seqs = list(ent_seqs)
+        entries = self.cached(ent_seqs, self.load)
+        return [entries[s] for s in ent_seqs if s in entries]
+
+    def by_keb(self, keb):
+        """The entries with a k_ele spelled keb, most common first."""
+        return self.fetch('keb', (keb,))
+
+    def by_reb(self, reb):
+        """The entries with an r_ele spelled reb, most common first."""
+        return self.fetch('reb', (reb,))
+
+
+class KanjiLookup(BaseLookup):
+    """Fetches characters from a KANJIDIC2 database."""
+
+    def __init__(self, db, cache=None, check_every=CHECK_EVERY):
+        BaseLookup.__init__(self, db, cache, check_every)
+        q = self.quote
+        self.character_sql = self.prepare(
+            'SELECT literal, grade, freq, jlpt FROM %s WHERE literal = ?' %
+            q('character'))[0]
+        tables = [t for t in kanjidic.metadata.sorted_tables
+                  if 'character_literal' in t.c]
+        width = max(len(bulk.insert_columns(t)) - 1 for t in tables)
+        children = []
+        for table in tables:
+            columns = [q(c) for c in bulk.insert_columns(table)
+                       if c != 'character_literal']
+            children.append("SELECT '%s', id, %s FROM %s "
+                            "WHERE character_literal = ?" %
+                            (table.name,
+                             ', '.join(columns + ['NULL'] *
+                                       (width - len(columns))),
+                             q(table.name)))
+        self.children_sql, self.n_children = self.prepare(
+            ' UNION ALL '.join(children) + ' ORDER BY 1, 2')
+
+    def load(self, literals):
+        """The (literal, character) pairs of the given literals that exist."""
+        characters = []
+        cursor = self.dbapi_conn.cursor()
+        try:
+            for literal in literals:
+                cursor.execute(self.character_sql, (literal,))
+                row = cursor.fetchone()
+                if row is None:
+                    continue
+                character = Character(*row)
+                cursor.execute(self.children_sql, (literal,) * self.n_children)
+                for row in cursor.fetchall():
+                    record = KANJI_RECORDS.get(row[0])
+                    value = record(*row[2:len(record._fields) + 2]) if record \
+                            else row[2]
+                    getattr(character, row[0]).append(value)
+                characters.append((literal, character))
+        finally:
+            cursor.close()
+        return characters
+
+    def get(self, literal):
+        """The character with the given literal, or None."""
+        return self.cached([literal], self.load).get(literal)
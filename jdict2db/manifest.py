@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Change manifests between two JMdict builds, made from the content hash
+stored with each entry (see jmdict.entry_hash). Downstream caches and search
+indexes can use them to only invalidate the entries that changed.
+"""
+
+import sys
+import json
+import argparse
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from .jmdict import entry
+
+
+def entry_hashes(db_path):
+    """The content hash of every entry in a database, by ent_seq."""
+    conn = create_engine(db_path, echo=False).connect()
+    try:
+        hashes = {}
+        for ent_seq, content_hash in conn.execute(
+                select([entry.c.ent_seq, entry.c.content_hash])):
+            hashes[ent_seq] = content_hash
+        return hashes
+    finally:
+        conn.close()
+
+def diff_hashes(old, new):
+    """
+    Compare two {ent_seq: content hash} dicts. Returns a dict with the
+    sorted ent_seqs that were 'added', 'modified' and 'removed', in the same
+    form as jmdict.update_database().
+    """
+    return {'added': sorted(s for s in new if s not in old),
+            'modified': sorted(s for s in new
+                               if s in old and old[s] != new[s]),
+            'removed': sorted(s for s in old if s not in new)}
+
+def diff_databases(old_db_path, new_db_path):
+    """The changes between the entries of two JMdict databases."""
+    return diff_hashes(entry_hashes(old_db_path), entry_hashes(new_db_path))
+
+def write_manifest(changes, f):
+    """Write changes to the file object f as JSON."""
+    json.dump(changes, f, sort_keys=True)
+    f.write('\n')
+
+def read_manifest(f):
+    return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='List the JMdict entries that differ between two builds.')
+    parser.add_argument('old_db_url')
+    parser.add_argument('new_db_url')
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='write the manifest here instead of stdout')
+    args = parser.parse_args()
+
+    changes = diff_databases(args.old_db_url, args.new_db_url)
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_manifest(changes, f)
+    else:
+        write_manifest(changes, sys.stdout)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+Scores for the priority tags of JMdict's kanji and reading elements
+(ke_pri/re_pri), used to rank the words people are most likely to want.
+
+news1/2, ichi1/2, spec1/2 and gai1/2 mark common words from various word
+lists, the 1 variants being the more common half. nfXX is the band of 500
+words a word falls in by frequency in the news, nf01 being the most
+frequent.
+"""
+
+TAG_WEIGHTS = {'news1': 30, 'ichi1': 30, 'spec1': 25, 'gai1': 20,
+               'news2': 10, 'ichi2': 10, 'spec2': 10, 'gai2': 5}
+
+#nf01 to nf48
+N_FREQUENCY_BANDS = 48
+
+
+def score(tags):
+    """
+    The priority score of an element with the given tags, 0 if it has none.
+    Higher is more common.
+    """
+    total = 0
+    for tag in tags:
+        if tag in TAG_WEIGHTS:
+            total += TAG_WEIGHTS[tag]
+        elif tag.startswith('nf') and tag[2:].isdigit():
+            total += max(N_FREQUENCY_BANDS + 1 - int(tag[2:]), 0)
+    return total
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""
+A read-only snapshot of KANJIDIC2 in a file of its own, for services that
+look characters up without a database connection. It is read with mmap, so
+opening it costs nothing, and a character's fields are only decoded when
+they are read.
+
+Every value is a 32-bit cell: numbers as themselves, text as the id of a
+string in a pool, and NONE for missing values. The cells of a character
+are its literal, grade, freq and jlpt, then where each of its FIELDS starts
+and where the last one ends, then the values of the fields. A field is a
+list of items of as many cells as its table has value columns.
+
+All numbers are little-endian. The file is:
+
+  header    magic, version, number of characters, of cells and of strings
+  index     (codepoint, first cell) of every character, by codepoint
+  cells
+  strings   the offset of every string in the pool, and of its end
+  pool      the UTF-8 strings
+"""
+
+import os
+import mmap
+import struct
+from collections import defaultdict
+from sqlalchemy import Integer
+from . import bulk
+from . import kanjidic
+from .lookup import Character, KANJI_RECORDS
+
+MAGIC = b'JDKS'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+INDEX = struct.Struct('<II')
+CELL = struct.Struct('<I')
+
+NONE = 0xffffffff
+
+#The attributes of lookup.Character that hold lists, named after the tables
+#their values come from
+FIELDS = Character.__slots__[4:]
+SCALARS = ('grade', 'freq', 'jlpt')
+
+
+def value_columns(table):
+    """(name, whether it holds numbers) of the value columns of a table."""
+    return [(c, isinstance(table.c[c].type, Integer))
+            for c in bulk.insert_columns(table) if c != 'character_literal']
+
+#The value columns of each field
+COLUMNS = dict((name, value_columns(kanjidic.metadata.tables[name]))
+               for name in FIELDS)
+
+
+class Collector(object):
+    """
+    Gathers the rows of every character as kanjidic.py's parser queues
+    them, to write a snapshot of.
+    """
+
+    def __init__(self):
+        self.characters = {}
+        self.fields = defaultdict(list)
+
+    def add_rows(self, all_l):
+        """
+        Add the rows queued in the all_l of a kanjidic.Loader, leaving them
+        there.
+        """
+        for table_l, insert in all_l:
+            name = insert.table.name
+            if name == 'character':
+                for row in table_l:
+                    self.characters[row[0]] = row[1:]
+            else:
+                for row in table_l:
+                    self.fields[row[0], name].append(row[1:])
+
+
+class Strings(object):
+    """The string pool, each distinct string stored once."""
+
+    def __init__(self):
+        self.ids = {}
+        self.encoded = []
+
+    def id(self, s):
+        if s not in self.ids:
+            self.ids[s] = len(self.encoded)
+            self.encoded.append(s.encode('utf-8'))
+        return self.ids[s]
+
+
+def cell(value, strings, number):
+    if value is None:
+        return NONE
+    return int(value) if number else strings.id(value)
+
+def write_snapshot(path, collector):
+    """
+    Write a snapshot of the characters gathered by collector to path. The
+    file is only replaced once complete.
+    """
+    strings = Strings()
+    index = []
+    cells = []
+    for literal in sorted(collector.characters, key=ord):
+        index.append((ord(literal), len(cells)))
+        cells.append(strings.id(literal))
+        cells.extend(cell(v, strings, True)
+                     for v in collector.characters[literal])
+        starts = len(cells)
+        cells.extend([0] * (len(FIELDS) + 1))
+        for i, name in enumerate(FIELDS):
+            cells[starts + i] = len(cells)
+            for row in collector.fields.get((literal, name), ()):
+                cells.extend(cell(v, strings, number)
+                             for v, (c, number) in zip(row, COLUMNS[name]))
+        cells[starts + len(FIELDS)] = len(cells)
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(index), len(cells),
+                            len(strings.encoded)))
+        for codepoint, first in index:
+            f.write(INDEX.pack(codepoint, first))
+        f.write(struct.pack('<%dI' % len(cells), *cells))
+        offset = 0
+        for s in strings.encoded:
+            f.write(CELL.pack(offset))
+            offset += len(s)
+        f.write(CELL.pack(offset))
+        for s in strings.encoded:
+            f.write(s)
+    os.replace(path + '.tmp', path)
+
+
+class SnapshotCharacter(object):
+    """
+    A character of a snapshot, with the attributes of lookup.Character.
+    Each one is decoded from the file when it is read.
+    """
+    __slots__ = ('snapshot', 'first')
+
+    def __init__(self, snapshot, first):
+        self.snapshot = snapshot
+        self.first = first
+
+    def __getattr__(self, name):
+        snapshot = self.snapshot
+        if name == 'literal':
+            return snapshot.string(snapshot.cell(self.first))
+        if name in SCALARS:
+            value = snapshot.cell(self.first + 1 + SCALARS.index(name))
+            return None if value == NONE else value
+        if name in COLUMNS:
+            return snapshot.field(self.first, name)
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return '<Character %s>' % self.literal
+
+
+class Snapshot(object):
+    """Looks characters up in a file written by write_snapshot()."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_characters, n_cells, n_strings = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError('%s is not a KANJIDIC2 snapshot' % path)
+        self.view = memoryview(self.mm)
+        self.index_at = HEADER.size
+        self.cells_at = self.index_at + self.n_characters * INDEX.size
+        self.strings_at = self.cells_at + n_cells * CELL.size
+        self.pool_at = self.strings_at + (n_strings + 1) * CELL.size
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+
+    def __len__(self):
+        return self.n_characters
+
+    def cell(self, i):
+        return CELL.unpack_from(self.mm, self.cells_at + i * CELL.size)[0]
+
+    def string(self, i):
+        start, end = struct.unpack_from('<II', self.mm,
+                                        self.strings_at + i * CELL.size)
+        return str(self.view[self.pool_at + start:self.pool_at + end],
+                   'utf-8')
+
+    def field(self, first, name):
+        """The list of a character's values for one of FIELDS."""
+        at = first + 1 + len(SCALARS) + FIELDS.index(name)
+        start, end = struct.unpack_from('<II', self.mm,
+                                        self.cells_at + at * CELL.size)
+        cells = struct.unpack_from('<%dI' % (end - start), self.mm,
+                                   self.cells_at + start * CELL.size)
+        columns = COLUMNS[name]
+        values = [None if c == NONE else c if number else self.string(c)
+                  for c, (column, number) in
+                  zip(cells, columns * (len(cells) // len(columns)))]
+        record = KANJI_RECORDS.get(name)
+        if record is None:
+            return values
+        width = len(columns)
+        return [record(*values[i:i + width])
+                for i in range(0, len(values), width)]
+
+    def get(self, literal):
+        """The character with the given literal, or None."""
+        if len(literal) != 1:
+            return None
+        codepoint = ord(literal)
+        lo, hi = 0, self.n_characters
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, first = INDEX.unpack_from(self.mm,
+                                             self.index_at + mid * INDEX.size)
+            if found < codepoint:
+                lo = mid + 1
+            elif found > codepoint:
+                hi = mid
+            else:
+                return SnapshotCharacter(self, first)
+        return None
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""Streaming access to the dictionary XML files."""
+
+import os
+import gzip
+import shutil
+import tempfile
+import contextlib
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    #cElementTree is the default ElementTree implementation since Python 3.3
+    #and the module was removed in 3.9
+    from xml.etree.ElementTree import iterparse
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def is_gzipped(f):
+    """
+    Whether the binary file f starts with gzip data, without consuming any
+    of it. Files that can neither be peeked at nor seeked are assumed not to.
+    """
+    if hasattr(f, 'peek'):
+        return f.peek(2)[:2] == GZIP_MAGIC
+    if hasattr(f, 'seekable') and f.seekable():
+        position = f.tell()
+        magic = f.read(2)
+        f.seek(position)
+        return magic == GZIP_MAGIC
+    return False
+
+@contextlib.contextmanager
+def open_source(source):
+    """
+    Open a dictionary for parsing. source is a path or a binary file-like
+    object (e.g. an HTTP response). Gzipped data such as JMdict.gz is
+    decompressed as it is read, so no uncompressed copy is needed. File
+    objects passed in are left open.
+    """
+    if hasattr(source, 'read'):
+        if is_gzipped(source):
+            yield gzip.GzipFile(fileobj=source)
+        else:
+            yield source
+        return
+    with open(source, 'rb') as f:
+        if is_gzipped(f):
+            with gzip.GzipFile(fileobj=f) as gz:
+                yield gz
+        else:
+            yield f
+
+@contextlib.contextmanager
+def uncompressed_file(source):
+    """
+    The path of an uncompressed copy of source, for readers that seek
+    around in a plain file (see jmdict.split_chunks). The path of an
+    uncompressed file is used as it is. Anything else, gzipped or a file
+    object, is copied to a temporary file first, which is removed
+    afterwards.
+    """
+    if not hasattr(source, 'read'):
+        with open(source, 'rb') as f:
+            gzipped = is_gzipped(f)
+        if not gzipped:
+            yield source
+            return
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            with open_source(source) as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+        yield path
+    finally:
+        os.remove(path)
+
+def iter_elements(f, tag):
+    """
+    Yield each complete `tag` element of the XML file f.
+
+    Clearing an element only empties it; the root still holds on to it, so
+    memory grows with every element parsed. Once the caller moves on, each
+    element is also detached from the root, which keeps memory use constant
+    whatever the size of the file.
+    """
+    context = iterparse(f, events=('start', 'end'))
+    event, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == tag:
+            yield elem
+            elem.clear()
+            root.clear()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+"""Small dictionary files for the tests that don't need the real ones."""
+
+import os
+
+JMDICT = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE JMdict [
+<!ENTITY n "noun (common) (futsuumeishi)">
+]>
+<JMdict>
+%s</JMdict>
+'''
+
+ENTRIES = {
+    1000220: '''<entry><ent_seq>1000220</ent_seq>
+<k_ele><keb>明白</keb><ke_pri>ichi1</ke_pri></k_ele>
+<r_ele><reb>めいはく</reb></r_ele>
+<sense><pos>&n;</pos><gloss>obvious</gloss><gloss>clear</gloss></sense>
+</entry>
+''',
+    1000225: '''<entry><ent_seq>1000225</ent_seq>
+<k_ele><keb>明白</keb></k_ele>
+<r_ele><reb>あからさま</reb></r_ele>
+<sense><gloss>plain</gloss></sense>
+<sense><gloss>frank</gloss></sense>
+</entry>
+''',
+    1000230: '''<entry><ent_seq>1000230</ent_seq>
+<r_ele><reb>あかん</reb></r_ele>
+<sense><gloss>useless</gloss></sense>
+</entry>
+''',
+}
+
+#A few entries (based on real ones) covering most of the JMdict elements
+JMDICT_SAMPLE = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE JMdict [
+<!ELEMENT JMdict (entry*)>
+<!ENTITY n "noun (common) (futsuumeishi)">
+<!ENTITY io "irregular okurigana usage">
+<!ENTITY oK "word containing out-dated kanji">
+<!ENTITY v5s "Godan verb with `su' ending">
+<!ENTITY vt "transitive verb">
+<!ENTITY uk "word usually written using kana alone">
+]>
+<!-- JMdict created: 2011-06-01 -->
+<JMdict>
+<entry>
+<ent_seq>1170650</ent_seq>
+<k_ele>
+<keb>隠す</keb>
+<ke_pri>ichi1</ke_pri>
+<ke_pri>news1</ke_pri>
+<ke_pri>nf12</ke_pri>
+</k_ele>
+<k_ele>
+<keb>隠くす</keb>
+<ke_inf>&io;</ke_inf>
+</k_ele>
+<k_ele>
+<keb>匿す</keb>
+</k_ele>
+<k_ele>
+<keb>隱くす</keb>
+<ke_inf>&io;</ke_inf>
+<ke_inf>&oK;</ke_inf>
+</k_ele>
+<r_ele>
+<reb>かくす</reb>
+<re_pri>ichi1</re_pri>
+<re_pri>news1</re_pri>
+<re_pri>nf12</re_pri>
+</r_ele>
+<sense>
+<pos>&v5s;</pos>
+<pos>&vt;</pos>
+<gloss>to hide</gloss>
+<gloss>to conceal</gloss>
+<gloss xml:lang="fre">cacher</gloss>
+</sense>
+</entry>
+<entry>
+<ent_seq>1369900</ent_seq>
+<k_ele>
+<keb>塵</keb>
+</k_ele>
+<k_ele>
+<keb>芥</keb>
+</k_ele>
+<r_ele>
+<reb>ごみ</reb>
+<re_pri>ichi1</re_pri>
+<re_pri>news2</re_pri>
+<re_pri>nf36</re_pri>
+</r_ele>
+<r_ele>
+<reb>ゴミ</reb>
+<re_nokanji/>
+<re_pri>spec1</re_pri>
+</r_ele>
+<r_ele>
+<reb>あくた</reb>
+<re_restr>芥</re_restr>
+</r_ele>
+<sense>
+<pos>&n;</pos>
+<misc>&uk;</misc>
+<gloss>rubbish</gloss>
+<gloss>trash</gloss>
+</sense>
+<sense>
+<lsource xml:lang="fre" ls_type="part" ls_wasei="y">poubelle</lsource>
+<gloss>dust</gloss>
+</sense>
+</entry>
+<entry>
+<ent_seq>1061830</ent_seq>
+<r_ele>
+<reb>シャン</reb>
+<re_pri>gai1</re_pri>
+</r_ele>
+<r_ele>
+<reb>シヤン</reb>
+<re_inf>&io;</re_inf>
+</r_ele>
+<info>
+<audit>
+<upd_date>2010-01-01</upd_date>
+<upd_detl>Entry created</upd_detl>
+</audit>
+</info>
+<sense>
+<xref>美人</xref>
+<field>&n;</field>
+<s_inf>slang</s_inf>
+<dial>&n;</dial>
+<gloss>beautiful woman</gloss>
+</sense>
+</entry>
+</JMdict>
+'''
+
+#A few KANJIDIC2 characters
+KANJIDIC2_SAMPLE = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE kanjidic2 [
+<!ELEMENT kanjidic2 (header,character*)>
+]>
+<kanjidic2>
+<header><file_version>4</file_version></header>
+<character>
+<literal>今</literal>
+<codepoint><cp_value cp_type="ucs">4eca</cp_value><cp_value cp_type="jis208">1-26-3</cp_value></codepoint>
+<radical><rad_value rad_type="classical">9</rad_value></radical>
+<misc><grade>2</grade><stroke_count>4</stroke_count><freq>49</freq><jlpt>4</jlpt></misc>
+<dic_number><dic_ref dr_type="nelson_c">386</dic_ref><dic_ref dr_type="moro" m_vol="1" m_page="0604">422</dic_ref></dic_number>
+<query_code><q_code qc_type="skip">2-2-2</q_code><q_code qc_type="four_corner">8020.7</q_code></query_code>
+<reading_meaning><rmgroup><reading r_type="ja_on">コン</reading><reading r_type="ja_kun">いま</reading><meaning>now</meaning><meaning m_lang="fr">maintenant</meaning></rmgroup><nanori>な</nanori></reading_meaning>
+</character>
+<character>
+<literal>収</literal>
+<codepoint><cp_value cp_type="ucs">53ce</cp_value></codepoint>
+<radical><rad_value rad_type="classical">29</rad_value><rad_value rad_type="nelson_c">2</rad_value></radical>
+<misc><grade>6</grade><stroke_count>4</stroke_count><stroke_count>5</stroke_count><variant var_type="jis208">29-9</variant><freq>785</freq><jlpt>2</jlpt></misc>
+<query_code><q_code qc_type="skip">1-2-2</q_code></query_code>
+<reading_meaning><rmgroup><reading r_type="ja_on">シュウ</reading><reading r_type="ja_kun">おさ.める</reading><meaning>income</meaning></rmgroup></reading_meaning>
+</character>
+<character>
+<literal>隠</literal>
+<codepoint><cp_value cp_type="ucs">96a0</cp_value></codepoint>
+<radical><rad_value rad_type="classical">170</rad_value></radical>
+<misc><grade>8</grade><stroke_count>14</stroke_count><freq>1364</freq><jlpt>1</jlpt><rad_name>x</rad_name></misc>
+<query_code><q_code qc_type="skip">1-3-11</q_code></query_code>
+<reading_meaning><rmgroup><reading r_type="ja_on">イン</reading><reading r_type="ja_kun">かく.す</reading><meaning>conceal</meaning><meaning>hide</meaning></rmgroup></reading_meaning>
+</character>
+</kanjidic2>
+'''
+
+
+def write_jmdict(directory, name, entries):
+    """Write a JMdict file made of the given entries, returning its path."""
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(JMDICT % ''.join(entries))
+    return path
+
+def write_sample(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
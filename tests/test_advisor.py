@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import io
+import shutil
+import tempfile
+import unittest
+import contextlib
+from sqlalchemy import create_engine
+from jdict2db import advisor, jmdict, kanjidic
+from .samples import JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_sample
+
+
+class TestSchemaIndexes(unittest.TestCase):
+
+    def indexed(self, table):
+        return set(c.name for i in table.indexes for c in i.columns)
+
+    def test_foreign_keys(self):
+        for metadata in (jmdict.metadata, kanjidic.metadata):
+            for table in metadata.sorted_tables:
+                for fk in table.foreign_keys:
+                    self.assertTrue(fk.parent.name in self.indexed(table),
+                                    '%s.%s' % (table.name, fk.parent.name))
+
+    def test_lookup_columns(self):
+        self.assertTrue('gloss' in self.indexed(jmdict.gloss))
+        self.assertTrue('reading' in self.indexed(kanjidic.reading))
+        self.assertTrue('q_code' in self.indexed(kanjidic.query_code))
+
+
+class TestAdvisor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.jmdict_path = 'sqlite:///%s/jmdict.sqlite' % cls.dir
+        cls.kanjidic_path = 'sqlite:///%s/kanjidic.sqlite' % cls.dir
+        cls.docs_path = 'sqlite:///%s/docs.sqlite' % cls.dir
+        source = write_sample(cls.dir, 'JMdict', JMDICT_SAMPLE)
+        with contextlib.redirect_stdout(io.StringIO()):
+            jmdict.fill_database(cls.jmdict_path, source=source)
+            jmdict.fill_database(cls.docs_path, source=source, docs=True)
+            kanjidic.fill_database(cls.kanjidic_path, source=write_sample(
+                cls.dir, 'kanjidic2.xml', KANJIDIC2_SAMPLE))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def advise(self, db_path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return advisor.advise(db_path)
+
+    def test_no_scans(self):
+        for db_path in (self.jmdict_path, self.kanjidic_path):
+            self.assertEqual(self.advise(db_path),
+                             {'missing': [], 'scans': []})
+
+    def test_docs(self):
+        """The entry_doc statements of a --docs database are checked too."""
+        self.assertEqual(self.advise(self.docs_path),
+                         {'missing': [], 'scans': []})
+
+    def test_missing_index(self):
+        shutil.copy('%s/kanjidic.sqlite' % self.dir,
+                    '%s/dropped.sqlite' % self.dir)
+        db_path = 'sqlite:///%s/dropped.sqlite' % self.dir
+        conn = create_engine(db_path).connect()
+        conn.execute('DROP INDEX ix_reading_reading')
+        conn.close()
+        report = self.advise(db_path)
+        self.assertEqual(report['missing'], ['ix_reading_reading'])
+        self.assertEqual([name for name, detail in report['scans']],
+                         ['search reading'])
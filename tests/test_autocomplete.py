@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from jdict2db import autocomplete, jmdict, priority
+from jdict2db.autocomplete import Completion
+from .samples import ENTRIES, JMDICT_SAMPLE, write_jmdict, write_sample
+
+
+class TestPriority(unittest.TestCase):
+
+    def test_score(self):
+        self.assertEqual(priority.score([]), 0)
+        self.assertEqual(priority.score(['ichi1', 'news1', 'nf12']), 97)
+        self.assertEqual(priority.score(['nf01']), 48)
+        self.assertEqual(priority.score(['nf48']), 1)
+        self.assertTrue(priority.score(['ichi1']) >
+                        priority.score(['ichi2']))
+
+
+class TestAutocomplete(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'jmdict.complete')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_build(self):
+        db_path = 'sqlite:///%s/jmdict.sqlite' % self.dir
+        jmdict.fill_database(db_path, autocomplete_path=self.path,
+                             source=write_sample(self.dir, 'JMdict',
+                                                 JMDICT_SAMPLE))
+        completer = autocomplete.Completer(self.path)
+        self.assertEqual(completer.complete('隠'),
+                         [Completion('隠す', 1170650, 97),
+                          Completion('隠くす', 1170650, 0)])
+        self.assertEqual(completer.complete('ご'),
+                         [Completion('ごみ', 1369900, 53)])
+        self.assertEqual([c.text for c in completer.complete('シ')],
+                         ['シャン', 'シヤン'])
+        self.assertEqual(completer.complete('か', k=1),
+                         [Completion('かくす', 1170650, 97)])
+        self.assertEqual(completer.complete('x'), [])
+        self.assertEqual(len(completer.complete('')), 10)
+        completer.close()
+
+    def test_update(self):
+        db_path = 'sqlite:///%s/jmdict.sqlite' % self.dir
+        jmdict.fill_database(db_path, source=write_jmdict(
+            self.dir, 'old', [ENTRIES[1000220], ENTRIES[1000225]]))
+        jmdict.update_database(db_path, autocomplete_path=self.path,
+                               source=write_jmdict(
+                                   self.dir, 'new',
+                                   [ENTRIES[1000220], ENTRIES[1000230]]))
+        completer = autocomplete.Completer(self.path)
+        self.assertEqual(completer.complete('あ'),
+                         [Completion('あかん', 1000230, 0)])
+        self.assertEqual(completer.complete('明'),
+                         [Completion('明白', 1000220, 30)])
+        completer.close()
+
+    def test_dense_prefixes(self):
+        """Precomputed and scanned completions agree with a brute force."""
+        rng = random.Random(1)
+        kana = 'あいうえおかきくけこ'
+        records = []
+        for i in range(3000):
+            text = ''.join(rng.choice(kana)
+                           for j in range(rng.randint(1, 5)))
+            records.append((text, rng.choice([0, 0, 10, 30, 97]), i))
+        autocomplete.write_index(self.path, records)
+        completer = autocomplete.Completer(self.path)
+        self.assertTrue(completer.n_tops > 1)
+        for prefix in ['', 'あ', 'あい', 'かきく', 'こここここ', 'ん']:
+            for k in (1, 10, autocomplete.TOP_K + 5):
+                expected = sorted((r for r in set(records)
+                                   if r[0].startswith(prefix)),
+                                  key=autocomplete.rank)[:k]
+                self.assertEqual(completer.complete(prefix, k),
+                                 [Completion(t, e, s)
+                                  for t, s, e in expected])
+        completer.close()
+
+    def test_not_an_index(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        self.assertRaises(ValueError, autocomplete.Completer, self.path)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from jdict2db import bitmap, kanjidic
+from .samples import KANJIDIC2_SAMPLE, write_sample
+
+
+class TestKanjiIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        source = write_sample(cls.dir, 'kanjidic2.xml', KANJIDIC2_SAMPLE)
+        cls.conns = []
+        for name, bitmaps in (('stored', True), ('computed', False)):
+            db_path = 'sqlite:///%s/%s.sqlite' % (cls.dir, name)
+            kanjidic.fill_database(db_path, bitmaps=bitmaps, source=source)
+            cls.conns.append(create_engine(db_path).connect())
+
+    @classmethod
+    def tearDownClass(cls):
+        for conn in cls.conns:
+            conn.close()
+        shutil.rmtree(cls.dir)
+
+    def test_stored(self):
+        stored, computed = self.conns
+        self.assertTrue(stored.dialect.has_table(stored, 'kanji_bitmap'))
+        self.assertFalse(computed.dialect.has_table(computed,
+                                                    'kanji_bitmap'))
+
+    def test_search(self):
+        for conn in self.conns:
+            index = bitmap.KanjiIndex(conn)
+            self.assertEqual(index.search(), ['今', '収', '隠'])
+            self.assertEqual(index.search(strokes=4), ['今', '収'])
+            #miscounts don't count
+            self.assertEqual(index.search(strokes=5), [])
+            self.assertEqual(index.search(strokes=4, radical=29), ['収'])
+            self.assertEqual(index.search(nelson_radical=2), ['収'])
+            self.assertEqual(index.search(skip='1-3-11', jlpt=1), ['隠'])
+            self.assertEqual(index.search(skip=['1-2-2', '2-2-2']),
+                             ['今', '収'])
+            self.assertEqual(index.search(grade=range(1, 7)), ['今', '収'])
+            self.assertEqual(index.search(grade=2, jlpt=2), [])
+            self.assertEqual(index.count(strokes=range(4, 15)), 3)
+            self.assertEqual(sorted(index.values['jlpt']), ['1', '2', '4'])
+            self.assertRaises(ValueError, index.search, colour='red')
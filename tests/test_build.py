@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from sqlalchemy import create_engine
+from jdict2db import build, crossref, fts
+from jdict2db.lookup import Lookup, KanjiLookup
+from .samples import JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_sample
+
+
+class Crash(object):
+    """Stands in for a dictionary module whose build process dies."""
+
+    @staticmethod
+    def fill_database(db_url, **options):
+        os._exit(9)
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.jmdict_options = {'source': write_sample(self.dir, 'JMdict',
+                                                      JMDICT_SAMPLE)}
+        self.kanjidic_options = {'source': write_sample(
+            self.dir, 'kanjidic2.xml', KANJIDIC2_SAMPLE)}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def url(self, name):
+        return 'sqlite:///' + os.path.join(self.dir, name)
+
+    def test_separate(self):
+        times = build.build(self.url('jmdict.sqlite'),
+                            self.url('kanjidic.sqlite'), link=True,
+                            jmdict_options=self.jmdict_options,
+                            kanjidic_options=self.kanjidic_options)
+        self.assertEqual(sorted(times),
+                         ['jmdict', 'kanjidic', 'link', 'total'])
+        lookup = KanjiLookup(self.url('kanjidic.sqlite'))
+        self.assertEqual(lookup.get('隠').grade, 8)
+        lookup.close()
+        conn = create_engine(self.url('jmdict.sqlite')).connect()
+        self.assertEqual(crossref.words_with(conn, '隠'), [1170650])
+        conn.close()
+
+    def test_single(self):
+        db_url = self.url('jdict.sqlite')
+        self.kanjidic_options['bitmaps'] = True
+        times = build.build(single_db=db_url, link=True,
+                            jmdict_options=self.jmdict_options,
+                            kanjidic_options=self.kanjidic_options)
+        self.assertEqual(sorted(times),
+                         ['jmdict', 'kanjidic', 'link', 'merge', 'total'])
+        #the KANJIDIC2 database merged in is gone
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['JMdict', 'jdict.sqlite', 'kanjidic2.xml'])
+        lookup = Lookup(db_url)
+        self.assertEqual(lookup.get(1170650).k_ele[0].keb, '隠す')
+        lookup.close()
+        lookup = KanjiLookup(db_url)
+        self.assertEqual(lookup.get('収').stroke_count, [4, 5])
+        self.assertEqual(lookup.get('今').meaning[0].meaning, 'now')
+        lookup.close()
+        conn = create_engine(db_url).connect()
+        self.assertEqual(crossref.words_with(conn, '隠'), [1170650])
+        self.assertTrue(conn.dialect.has_table(conn, 'kanji_bitmap'))
+        #the merged tables are indexed
+        indexes = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND "
+            "tbl_name = 'reading'")]
+        self.assertTrue('ix_reading_reading' in indexes)
+        conn.close()
+
+    def test_single_full_text(self):
+        conn = create_engine('sqlite://').connect()
+        available = fts.available(conn)
+        conn.close()
+        if not available:
+            self.skipTest('SQLite lacks FTS5 or its trigram tokenizer')
+        db_url = self.url('jdict.sqlite')
+        self.kanjidic_options['full_text'] = True
+        build.build(single_db=db_url, jmdict_options=self.jmdict_options,
+                    kanjidic_options=self.kanjidic_options)
+        conn = create_engine(db_url).connect()
+        self.assertEqual(fts.search_meanings(conn, 'income'), ['収'])
+        conn.close()
+
+    def test_failure(self):
+        self.kanjidic_options['source'] = os.path.join(self.dir, 'missing')
+        self.assertRaises(RuntimeError, build.build,
+                          self.url('jmdict.sqlite'),
+                          self.url('kanjidic.sqlite'),
+                          jmdict_options=self.jmdict_options,
+                          kanjidic_options=self.kanjidic_options)
+
+    def test_worker_dies(self):
+        """A build process that dies without reporting doesn't hang us."""
+        if multiprocessing.get_start_method() != 'fork':
+            self.skipTest('the stand-in module only reaches forked workers')
+        build.MODULES['crash'] = Crash
+        try:
+            with self.assertRaises(RuntimeError) as raised:
+                build.build_parallel([
+                    ('crash', self.url('crash.sqlite'), {}),
+                    ('kanjidic', self.url('kanjidic.sqlite'),
+                     self.kanjidic_options)])
+        finally:
+            del build.MODULES['crash']
+        self.assertTrue('crash build exited with code 9' in
+                        str(raised.exception))
+        self.assertFalse('kanjidic' in str(raised.exception))
+
+    def test_single_needs_sqlite(self):
+        self.assertRaises(ValueError, build.build,
+                          single_db='postgresql://localhost/jdict')
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine, Table, Column, Integer, Unicode, \
+                       MetaData
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import select, func
+from jdict2db import bulk, jmdict, kanjidic
+from .samples import ENTRIES, JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_jmdict, \
+                     write_sample
+
+metadata = MetaData()
+word = Table('word', metadata,
+             Column('id', Integer, primary_key=True),
+             Column('word', Unicode, nullable=False))
+
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        db_path = 'sqlite:///' + os.path.join(self.dir, 'test.sqlite')
+        engine = create_engine(db_path,
+                               **bulk.engine_options(db_path, True))
+        self.conn = engine.connect()
+        bulk.create_tables(self.conn, metadata)
+        self.word_l = []
+        self.all_l = [[self.word_l, word.insert()]]
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def words(self):
+        return [row.word for row in self.conn.execute(select([word]))]
+
+    def fill(self, writer, words):
+        for w in words:
+            self.word_l.append((w,))
+            writer.flush(1)
+        writer.finish()
+
+    def test_writer(self):
+        for raw in (False, True):
+            self.fill(bulk.Writer(self.conn, self.all_l, raw), ['a', 'b'])
+        self.assertEqual(self.words(), ['a', 'b', 'a', 'b'])
+
+    def test_raw_statements(self):
+        """Each writer keeps the raw INSERT statements it built."""
+        writer = bulk.Writer(self.conn, self.all_l, raw=True)
+        self.fill(writer, ['a'])
+        key = ('sqlite', 'qmark', 'word')
+        self.assertEqual(writer.statements,
+                         {key: 'INSERT INTO word (word) VALUES (?)'})
+        other = bulk.Writer(self.conn, self.all_l, raw=True)
+        self.assertEqual(other.statements, {})
+        other.abort()
+        self.assertFalse(hasattr(bulk, '_raw_sql'))
+
+    def test_background_writer(self):
+        writer = bulk.BackgroundWriter(self.conn, self.all_l, max_pending=1)
+        self.fill(writer, [str(i) for i in range(100)])
+        self.assertEqual(self.words(), [str(i) for i in range(100)])
+        self.assertFalse(writer.thread.is_alive())
+
+    def test_background_writer_error(self):
+        """Errors on the writer thread are raised on the loader's thread."""
+        writer = bulk.BackgroundWriter(self.conn, self.all_l, max_pending=1)
+        self.word_l.append((None,))     #violates NOT NULL
+        writer.flush(1)
+        try:
+            self.assertRaises(Exception, self.fill, writer, ['a'] * 10)
+        finally:
+            writer.abort()
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual(self.words(), [])
+
+
+class SharedLoader(jmdict.Loader):
+    """
+    Builds through the connection of engine, a StaticPool one whose single
+    SQLite connection outlives the build, recording the PRAGMAs in force
+    while the rows were saved.
+    """
+
+    engine = None
+
+    def connect(self, db_path, background=False):
+        self.conn = self.engine.connect()
+
+    def collect(self):
+        self.during = pragmas(self.conn)
+        jmdict.Loader.collect(self)
+
+
+class IndexLoader(jmdict.Loader):
+    """Records the indexes the database had while the rows were saved."""
+
+    def collect(self):
+        self.during = indexes(self.conn)
+        jmdict.Loader.collect(self)
+
+
+def indexes(conn):
+    return set(row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT "
+        "NULL"))
+
+def pragmas(conn):
+    return dict((name, conn.execute('PRAGMA %s' % name).scalar())
+                for name in ('synchronous', 'journal_mode', 'cache_size'))
+
+
+class TestTransactions(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = 'sqlite:///' + os.path.join(self.dir, 'jmdict.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_restore_pragmas(self):
+        """The build PRAGMAs are put back once fill_database() is done."""
+        source = write_jmdict(self.dir, 'JMdict', ENTRIES.values())
+        for durability in sorted(bulk.DURABILITY_LEVELS):
+            engine = create_engine(self.db_path, poolclass=StaticPool)
+            conn = engine.connect()
+            before = pragmas(conn)
+            conn.close()
+            loader = SharedLoader()
+            loader.engine = engine
+            loader.fill(self.db_path, durability, source=source)
+            conn = engine.connect()
+            self.assertEqual(pragmas(conn), before)
+            conn.close()
+            engine.dispose()
+            os.remove(os.path.join(self.dir, 'jmdict.sqlite'))
+            self.assertEqual(loader.during['cache_size'], -200000)
+            if durability == 'off':
+                self.assertEqual(loader.during['synchronous'], 0)
+                self.assertEqual(loader.during['journal_mode'], 'off')
+            elif durability == 'normal':
+                self.assertEqual(loader.during['synchronous'], 1)
+                self.assertEqual(loader.during['journal_mode'], 'wal')
+
+    def count_entries(self):
+        conn = create_engine(self.db_path).connect()
+        n_entries = conn.execute(select([func.count()])
+                                 .select_from(jmdict.entry)).scalar()
+        conn.close()
+        return n_entries
+
+    def test_commit_every(self):
+        """
+        With commit_every, the batches saved before a build fails stay
+        committed; without it the whole build is rolled back.
+        """
+        #the last entry is cut short, which fails the build once the others
+        #were saved
+        source = write_jmdict(self.dir, 'JMdict', list(ENTRIES.values()) +
+                              ['<entry><ent_seq>9</ent_seq>'])
+        for commit_every, expect in ((1, 3), (0, 0)):
+            loader = jmdict.Loader(n_to_save=0)
+            self.assertRaises(SyntaxError, loader.fill, self.db_path,
+                              commit_every=commit_every, source=source)
+            self.assertEqual(self.count_entries(), expect)
+            os.remove(os.path.join(self.dir, 'jmdict.sqlite'))
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.source = write_jmdict(self.dir, 'JMdict', ENTRIES.values())
+        self.declared = set(index.name
+                            for table in jmdict.metadata.sorted_tables
+                            for index in table.indexes)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, build):
+        """Run build on a new database, whose indexes must come last."""
+        db_path = 'sqlite:///' + os.path.join(self.dir, 'jmdict.sqlite')
+        loader = IndexLoader()
+        build(loader, db_path)
+        self.assertEqual(loader.during, set())
+        conn = create_engine(db_path).connect()
+        self.assertEqual(indexes(conn), self.declared)
+        conn.close()
+        os.remove(os.path.join(self.dir, 'jmdict.sqlite'))
+
+    def test_fill(self):
+        self.check(lambda loader, db_path: loader.fill(db_path,
+                                                       source=self.source))
+
+    def test_update(self):
+        self.check(lambda loader, db_path: loader.update(db_path,
+                                                         source=self.source))
+
+
+class TestRawInsert(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def dump(self, module, db_path):
+        conn = create_engine(db_path).connect()
+        rows = dict((table.name, conn.execute(select([table])).fetchall())
+                    for table in module.metadata.sorted_tables
+                    if table is not module.build_info)
+        conn.close()
+        return rows
+
+    def test_same_rows(self):
+        """Inserting through the driver gives the same tables."""
+        for module, name, text in ((jmdict, 'JMdict', JMDICT_SAMPLE),
+                                   (kanjidic, 'kanjidic2.xml',
+                                    KANJIDIC2_SAMPLE)):
+            source = write_sample(self.dir, name, text)
+            dumps = []
+            for raw in (False, True):
+                db_path = 'sqlite:///%s/%s-%s.sqlite' % (self.dir, name, raw)
+                module.fill_database(db_path, raw=raw, source=source)
+                dumps.append(self.dump(module, db_path))
+            self.assertEqual(dumps[0], dumps[1])
+            self.assertTrue(sum(len(rows) for rows in dumps[0].values()) > 10)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from jdict2db import columnar, jmdict, kanjidic
+from .samples import JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_sample
+
+if columnar.available():
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+
+@unittest.skipUnless(columnar.available(), 'pyarrow is not installed')
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, path):
+        if path.endswith('.parquet'):
+            return pyarrow.parquet.read_table(path)
+        with pyarrow.memory_map(path) as source:
+            return pyarrow.ipc.open_file(source).read_all()
+
+    def check_tables(self, db_path, metadata, export_dir, extension):
+        """Every exported file holds the same rows as its table."""
+        conn = create_engine(db_path).connect()
+        for table in metadata.sorted_tables:
+            path = os.path.join(export_dir, table.name + extension)
+            if table.name == 'build_info':
+                self.assertFalse(os.path.exists(path))
+                continue
+            rows = [dict(r) for r in conn.execute(
+                select([table]).order_by(*table.primary_key.columns))]
+            #files are in document order
+            key = lambda row: [row[c.name] for c in table.primary_key]
+            self.assertEqual(sorted(self.read(path).to_pylist(), key=key),
+                             rows, table.name)
+        conn.close()
+
+    def test_jmdict(self):
+        source = write_sample(self.dir, 'JMdict', JMDICT_SAMPLE)
+        for format, extension in sorted(columnar.FORMATS.items()):
+            db_path = 'sqlite:///%s/%s.sqlite' % (self.dir, format)
+            export_dir = os.path.join(self.dir, format)
+            jmdict.fill_database(db_path, source=source, docs=True,
+                                 export_dir=export_dir, export_format=format)
+            self.check_tables(db_path, jmdict.metadata, export_dir, extension)
+            self.assertFalse(os.path.exists(
+                os.path.join(export_dir, 'entry_doc' + extension)))
+            pos = self.read(os.path.join(export_dir, 'pos' + extension))
+            self.assertTrue(pyarrow.types.is_dictionary(
+                pos.schema.field('pos').type))
+
+    def test_kanjidic(self):
+        db_path = 'sqlite:///%s/kanjidic.sqlite' % self.dir
+        export_dir = os.path.join(self.dir, 'export')
+        kanjidic.fill_database(db_path, export_dir=export_dir,
+                               source=write_sample(self.dir, 'kanjidic2.xml',
+                                                   KANJIDIC2_SAMPLE))
+        self.check_tables(db_path, kanjidic.metadata, export_dir, '.parquet')
+
+    def test_batches(self):
+        """Dictionaries carry over from one batch to the next."""
+        path = os.path.join(self.dir, 'pos.arrow')
+        table_file = columnar.TableFile(path, jmdict.pos, 'arrow')
+        table_file.write([(1, 'noun'), (1, 'verb')])
+        table_file.write([(2, 'adverb'), (2, 'noun'), (3, None)])
+        table_file.close()
+        self.assertEqual(self.read(path).to_pylist(),
+                         [{'id': 1, 'sense_id': 1, 'pos': 'noun'},
+                          {'id': 2, 'sense_id': 1, 'pos': 'verb'},
+                          {'id': 3, 'sense_id': 2, 'pos': 'adverb'},
+                          {'id': 4, 'sense_id': 2, 'pos': 'noun'},
+                          {'id': 5, 'sense_id': 3, 'pos': None}])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, columnar.Exporter, self.dir,
+                          jmdict.Loader().all_l, jmdict.metadata, 'csv')
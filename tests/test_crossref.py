@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from jdict2db import crossref, jmdict, kanjidic
+from jdict2db.crossref import kanji_entry
+from .samples import KANJIDIC2_SAMPLE, write_jmdict, write_sample
+
+ENTRIES = ['<entry><ent_seq>%d</ent_seq>%s<sense><gloss>x</gloss></sense>'
+           '</entry>\n' % (ent_seq, k_ele)
+           for ent_seq, k_ele in (
+               (1, '<k_ele><keb>隠れ</keb></k_ele>'),
+               (2, '<k_ele><keb>今隠</keb><ke_pri>news1</ke_pri></k_ele>'),
+               (3, '<k_ele><keb>収</keb></k_ele><k_ele><keb>今収</keb>'
+                   '</k_ele>'),
+               (4, '<r_ele><reb>かな</reb></r_ele>'))]
+
+
+class TestKanjiEntry(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.jmdict_source = write_jmdict(self.dir, 'JMdict', ENTRIES)
+        self.kanjidic_source = write_sample(self.dir, 'kanjidic2.xml',
+                                            KANJIDIC2_SAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self, name, kanjidic_name=None):
+        """Build the JMdict database name and the KANJIDIC2 one, urls."""
+        jmdict_db = 'sqlite:///%s/%s.sqlite' % (self.dir, name)
+        kanjidic_db = 'sqlite:///%s/%s.sqlite' % (self.dir,
+                                                  kanjidic_name or name)
+        jmdict.fill_database(jmdict_db, source=self.jmdict_source)
+        kanjidic.fill_database(kanjidic_db, source=self.kanjidic_source)
+        return jmdict_db, kanjidic_db
+
+    def rows(self, conn):
+        return conn.execute(select([kanji_entry.c.character_literal,
+                                    kanji_entry.c.ent_seq,
+                                    kanji_entry.c.k_ele_id,
+                                    kanji_entry.c.position])
+                            .order_by(kanji_entry.c.id)).fetchall()
+
+    def test_merged(self):
+        jmdict_db, kanjidic_db = self.build('both')
+        crossref.link_databases(jmdict_db)
+        conn = create_engine(jmdict_db).connect()
+        self.assertEqual(self.rows(conn), [('隠', 1, 1, 0), ('今', 2, 2, 0),
+                                           ('隠', 2, 2, 1), ('収', 3, 3, 0),
+                                           ('今', 3, 4, 0), ('収', 3, 4, 1)])
+        self.assertEqual(crossref.words_with(conn, '隠'), [2, 1])
+        self.assertEqual(crossref.words_with(conn, '今', limit=1), [2])
+        self.assertEqual(crossref.words_with(conn, '明'), [])
+        self.assertEqual(crossref.kanji_in(conn, 3), ['収', '今'])
+        self.assertEqual(crossref.kanji_in(conn, 4), [])
+        conn.close()
+
+        #building again starts over
+        crossref.link_databases(jmdict_db)
+        conn = create_engine(jmdict_db).connect()
+        self.assertEqual(len(self.rows(conn)), 6)
+        conn.close()
+
+    def test_separate(self):
+        jmdict_db, kanjidic_db = self.build('jmdict', 'kanjidic')
+        crossref.link_databases(jmdict_db, kanjidic_db)
+        conn = create_engine(jmdict_db).connect()
+        self.assertEqual(crossref.words_with(conn, '収'), [3])
+        self.assertEqual(len(self.rows(conn)), 6)
+        conn.close()
+
+    def test_attached(self):
+        jmdict_db, kanjidic_db = self.build('jmdict', 'kanjidic')
+        conn = create_engine(jmdict_db).connect()
+        conn.execute("ATTACH DATABASE '%s' AS kanjidic" %
+                     os.path.join(self.dir, 'kanjidic.sqlite'))
+        literals = crossref.character_literals(conn, 'kanjidic')
+        self.assertEqual(literals, set('今収隠'))
+        with conn.begin():
+            self.assertEqual(crossref.create_table(conn, literals), 6)
+        self.assertEqual(crossref.words_with(conn, '今'), [2, 3])
+        conn.close()
+
+    def test_attach(self):
+        jmdict_db, kanjidic_db = self.build('jmdict', 'kanjidic')
+        path = os.path.join(self.dir, 'kanjidic.sqlite')
+        crossref.link_databases(jmdict_db, attach=path)
+        conn = create_engine(jmdict_db).connect()
+        self.assertEqual(len(self.rows(conn)), 6)
+        conn.close()
+        self.assertRaises(ValueError, crossref.link_databases, jmdict_db,
+                          kanjidic_db, attach=path)
+
+    def test_attach_command(self):
+        jmdict_db, kanjidic_db = self.build('jmdict', 'kanjidic')
+        subprocess.check_output(
+            [sys.executable, '-m', 'jdict2db.crossref', jmdict_db, '--attach',
+             os.path.join(self.dir, 'kanjidic.sqlite'), '--schema', 'kd'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        conn = create_engine(jmdict_db).connect()
+        self.assertEqual(crossref.words_with(conn, '今'), [2, 3])
+        conn.close()
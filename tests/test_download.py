@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPException
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from jdict2db.download import fetch
+
+LAST_MODIFIED = 'Wed, 01 Jun 2011 00:00:00 GMT'
+
+
+class DictionaryHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.data with an ETag and Last-Modified, honouring conditional
+    and Range requests. If server.truncate is set, the next response is cut
+    off after that many bytes.
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        etag = '"v%d"' % server.version
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == etag:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                             (start, len(server.data) - 1, len(server.data)))
+        else:
+            self.send_response(200)
+        body = server.data[start:]
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.truncate is not None:
+            body = body[:server.truncate]
+            server.truncate = None
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), DictionaryHandler)
+        self.server.data = os.urandom(300 * 1024)
+        self.server.version = 1
+        self.server.truncate = None
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/JMdict.gz' % self.server.server_port
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'JMdict.gz')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.dir)
+
+    def saved(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_conditional(self):
+        self.assertTrue(fetch(self.url, self.path))
+        self.assertEqual(self.saved(), self.server.data)
+        #unchanged: one request that transfers nothing
+        self.assertFalse(fetch(self.url, self.path))
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.server.requests[-1]['If-Modified-Since'],
+                         LAST_MODIFIED)
+        #changed upstream
+        self.server.version = 2
+        self.server.data = os.urandom(1000)
+        self.assertTrue(fetch(self.url, self.path))
+        self.assertEqual(self.saved(), self.server.data)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_resume(self):
+        self.server.truncate = 100 * 1024
+        self.assertRaises(HTTPException, fetch, self.url, self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + '.part'), 100 * 1024)
+        self.assertTrue(fetch(self.url, self.path))
+        self.assertEqual(self.server.requests[-1]['Range'], 'bytes=102400-')
+        self.assertEqual(self.saved(), self.server.data)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_resume_changed(self):
+        """A file that changed since the interruption is downloaded whole."""
+        self.server.truncate = 100 * 1024
+        self.assertRaises(HTTPException, fetch, self.url, self.path)
+        self.server.version = 2
+        self.server.data = os.urandom(200 * 1024)
+        self.assertTrue(fetch(self.url, self.path))
+        self.assertEqual(self.saved(), self.server.data)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from jdict2db import fts, jmdict, kanjidic
+from .samples import ENTRIES, JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_jmdict, \
+                     write_sample
+
+def fts_available():
+    conn = create_engine('sqlite://').connect()
+    try:
+        return fts.available(conn)
+    finally:
+        conn.close()
+
+
+@unittest.skipUnless(fts_available(), 'SQLite lacks FTS5 or its trigram '
+                                      'tokenizer')
+class TestFullText(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        jmdict_path = 'sqlite:///%s/jmdict.sqlite' % cls.dir
+        kanjidic_path = 'sqlite:///%s/kanjidic.sqlite' % cls.dir
+        jmdict.fill_database(jmdict_path, full_text=True, source=write_sample(
+            cls.dir, 'JMdict', JMDICT_SAMPLE))
+        kanjidic.fill_database(kanjidic_path, full_text=True,
+                               source=write_sample(cls.dir, 'kanjidic2.xml',
+                                                   KANJIDIC2_SAMPLE))
+        cls.jmdict = create_engine(jmdict_path).connect()
+        cls.kanjidic = create_engine(kanjidic_path).connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.jmdict.close()
+        cls.kanjidic.close()
+        shutil.rmtree(cls.dir)
+
+    def test_glosses(self):
+        self.assertEqual(fts.search_glosses(self.jmdict, 'hiding'), [1170650])
+        self.assertEqual(fts.search_glosses(self.jmdict, 'to CONCEAL'),
+                         [1170650])
+        self.assertEqual(fts.search_glosses(self.jmdict, 'rubb'), [])
+        self.assertEqual(fts.search_glosses(self.jmdict, 'rubb', prefix=True),
+                         [1369900])
+        self.assertEqual(fts.search_glosses(self.jmdict, '"*'), [])
+
+    def test_ranking(self):
+        #'woman' is one word of two in 1061830's gloss, none in the others
+        self.assertEqual(fts.search_glosses(self.jmdict, 'woman'), [1061830])
+        self.assertEqual(fts.search_glosses(self.jmdict, 'to'), [1170650])
+
+    def test_japanese(self):
+        self.assertEqual(fts.search_readings(self.jmdict, 'かくす'),
+                         [1170650])
+        self.assertEqual(fts.search_readings(self.jmdict, 'くた'), [1369900])
+        self.assertEqual(fts.search_kanji(self.jmdict, '隠くす'), [1170650])
+        self.assertEqual(fts.search_kanji(self.jmdict, '100%'), [])
+        self.assertEqual(fts.prefix_readings(self.jmdict, 'ご'), [1369900])
+        self.assertEqual(fts.prefix_kanji(self.jmdict, '隠'), [1170650])
+        self.assertEqual(fts.prefix_kanji(self.jmdict, '隠', limit=0), [])
+
+    def test_meanings(self):
+        self.assertEqual(fts.search_meanings(self.kanjidic, 'hide'), ['隠'])
+        self.assertEqual(fts.search_meanings(self.kanjidic, 'inc',
+                                             prefix=True), ['収'])
+
+    def test_update(self):
+        db_path = 'sqlite:///%s/updated.sqlite' % self.dir
+        jmdict.fill_database(db_path, full_text=True, source=write_jmdict(
+            self.dir, 'old', [ENTRIES[1000220], ENTRIES[1000225]]))
+        changed = ENTRIES[1000220].replace('<gloss>clear</gloss>',
+                                           '<gloss>evident</gloss>')
+        jmdict.update_database(db_path, source=write_jmdict(
+            self.dir, 'new', [changed, ENTRIES[1000230]]))
+        conn = create_engine(db_path).connect()
+        self.assertEqual(fts.search_glosses(conn, 'clear'), [])
+        self.assertEqual(fts.search_glosses(conn, 'evident'), [1000220])
+        self.assertEqual(fts.search_glosses(conn, 'obvious'), [1000220])
+        self.assertEqual(fts.search_glosses(conn, 'frank'), [])
+        self.assertEqual(fts.search_glosses(conn, 'useless'), [1000230])
+        self.assertEqual(fts.search_readings(conn, 'あからさま'), [])
+        conn.close()
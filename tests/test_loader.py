@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from jdict2db import jmdict, kanjidic
+from .samples import JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_sample
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sources = {
+            jmdict: write_sample(self.dir, 'JMdict', JMDICT_SAMPLE),
+            kanjidic: write_sample(self.dir, 'kanjidic2.xml',
+                                   KANJIDIC2_SAMPLE)}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def url(self, name):
+        return 'sqlite:///' + os.path.join(self.dir, name + '.sqlite')
+
+    def dump(self, module, name):
+        """The rows of every table of a database, build_info left out."""
+        conn = create_engine(self.url(name)).connect()
+        rows = dict((table.name, conn.execute(select([table])).fetchall())
+                    for table in module.tables
+                    if conn.dialect.has_table(conn, table.name))
+        conn.close()
+        return rows
+
+    def test_threads(self):
+        """Loaders running at the same time don't see each other's rows."""
+        jmdict.fill_database(self.url('jmdict'), source=self.sources[jmdict])
+        kanjidic.fill_database(self.url('kanjidic'),
+                               source=self.sources[kanjidic])
+        #saving after every element interleaves the builds as much as can be
+        loaders = [(jmdict.Loader(n_to_save=0), jmdict, 'jmdict1'),
+                   (jmdict.Loader(raw=True, n_to_save=0), jmdict, 'jmdict2'),
+                   (kanjidic.Loader(n_to_save=0), kanjidic, 'kanjidic1'),
+                   (kanjidic.Loader(raw=True, n_to_save=0), kanjidic,
+                    'kanjidic2')]
+        errors = []
+        def fill(loader, module, name):
+            try:
+                loader.fill(self.url(name), source=self.sources[module])
+            except BaseException as e:
+                errors.append(e)
+        threads = [threading.Thread(target=fill, args=args)
+                   for args in loaders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        for loader, module, name in loaders:
+            self.assertEqual(self.dump(module, name),
+                             self.dump(module, module.__name__.split('.')[-1]))
+        self.assertEqual(loaders[0][0].metrics['elements'], 3)
+        self.assertEqual(loaders[0][0].metrics['rows']['k_ele'], 6)
+        self.assertEqual(loaders[2][0].metrics['rows']['character'], 3)
+
+    def test_reuse(self):
+        """A loader can build again, even after a build failed."""
+        loader = jmdict.Loader(docs=True)
+        loader.entry_l.append((1, 'stale', 0))
+        self.assertRaises(IOError, loader.fill, self.url('failed'),
+                          source=os.path.join(self.dir, 'missing'))
+        self.assertEqual(loader.entry_l, [])
+        self.assertEqual(loader.conn, None)
+        for name in ('first', 'second'):
+            loader.fill(self.url(name), source=self.sources[jmdict])
+        self.assertEqual(self.dump(jmdict, 'first'),
+                         self.dump(jmdict, 'second'))
+        self.assertEqual(len(self.dump(jmdict, 'first')['entry_doc']), 3)
+        self.assertEqual(loader.metrics['elements'], 6)
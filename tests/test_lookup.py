@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from jdict2db import bulk, fts, jmdict, kanjidic
+from jdict2db.cache import LRUCache, approximate_size
+from jdict2db.lookup import Lookup, KanjiLookup, Gloss, LSource, Audit, \
+                            Variant, DicRef, RadValue, Reading, Meaning
+from .samples import JMDICT_SAMPLE, KANJIDIC2_SAMPLE, write_jmdict, \
+                     write_sample
+
+
+class TestLookup(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.db_path = 'sqlite:///%s/jmdict.sqlite' % cls.dir
+        jmdict.fill_database(cls.db_path, source=write_sample(
+            cls.dir, 'JMdict', JMDICT_SAMPLE))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.lookup = Lookup(self.db_path)
+
+    def tearDown(self):
+        self.lookup.close()
+
+    def test_get(self):
+        e = self.lookup.get(1170650)
+        self.assertEqual(e.ent_seq, 1170650)
+        self.assertEqual([k.keb for k in e.k_ele],
+                         ['隠す', '隠くす', '匿す', '隱くす'])
+        self.assertEqual(e.k_ele[0].ke_pri, ['ichi1', 'news1', 'nf12'])
+        self.assertEqual(e.k_ele[3].ke_inf,
+                         ['irregular okurigana usage',
+                          'word containing out-dated kanji'])
+        self.assertEqual(e.sense[0].pos, ["Godan verb with `su' ending",
+                                          'transitive verb'])
+        self.assertEqual(e.sense[0].gloss,
+                         [Gloss('to hide', 'eng', None),
+                          Gloss('to conceal', 'eng', None),
+                          Gloss('cacher', 'fre', None)])
+        self.assertEqual(self.lookup.get(1), None)
+
+    def test_sub_elements(self):
+        e = self.lookup.get(1369900)
+        self.assertEqual([(r.reb, r.re_nokanji) for r in e.r_ele],
+                         [('ごみ', False), ('ゴミ', True), ('あくた', False)])
+        self.assertEqual(e.r_ele[2].re_restr, ['芥'])
+        self.assertEqual(e.sense[0].misc,
+                         ['word usually written using kana alone'])
+        self.assertEqual(e.sense[1].lsource,
+                         [LSource('poubelle', 'fre', 'part', True)])
+        e = self.lookup.get(1061830)
+        self.assertEqual(e.r_ele[1].re_inf, ['irregular okurigana usage'])
+        self.assertEqual(e.info[0].audit, [Audit('2010-01-01',
+                                                 'Entry created')])
+        self.assertEqual(e.sense[0].xref, ['美人'])
+        self.assertEqual(e.sense[0].s_inf, ['slang'])
+
+    def test_by_keb_and_reb(self):
+        self.assertEqual([e.ent_seq for e in self.lookup.by_keb('芥')],
+                         [1369900])
+        self.assertEqual([e.ent_seq for e in self.lookup.by_reb('かくす')],
+                         [1170650])
+        self.assertEqual(self.lookup.by_reb('ない'), [])
+
+    def test_priority(self):
+        e = self.lookup.get(1170650)
+        self.assertEqual(e.priority, 97)
+        self.assertEqual([k.priority for k in e.k_ele], [97, 0, 0, 0])
+        self.assertEqual([r.priority for r in e.r_ele], [97])
+        e = self.lookup.get(1369900)
+        self.assertEqual(e.priority, 53)
+        self.assertEqual([r.priority for r in e.r_ele], [53, 25, 0])
+
+    def test_get_many(self):
+        entries = self.lookup.get_many([1061830, 1, 1170650, 1369900])
+        self.assertEqual([e.ent_seq for e in entries],
+                         [1061830, 1170650, 1369900])
+        self.assertEqual([r.reb for r in entries[2].r_ele],
+                         ['ごみ', 'ゴミ', 'あくた'])
+        self.assertEqual(entries[1].sense[0].gloss[0].gloss, 'to hide')
+        #the temporary table is emptied between calls
+        entries = self.lookup.get_many([1170650])
+        self.assertEqual([e.ent_seq for e in entries], [1170650])
+        self.assertEqual(self.lookup.get_many([]), [])
+
+
+def dump(entry):
+    """Everything an entry holds, as nested lists that can be compared."""
+    def fields(obj):
+        return [(name, getattr(obj, name)) for name in obj.__slots__]
+    return [(name, [fields(o) for o in value] if name in jmdict.metadata.tables
+             else value) for name, value in fields(entry)]
+
+
+class TestDocLookup(TestLookup):
+    """The same lookups, reading entries from the entry_doc table."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.db_path = 'sqlite:///%s/jmdict.sqlite' % cls.dir
+        jmdict.fill_database(cls.db_path, docs=True, source=write_sample(
+            cls.dir, 'JMdict', JMDICT_SAMPLE))
+
+    def setUp(self):
+        TestLookup.setUp(self)
+        self.assertTrue(self.lookup.use_docs)
+
+    def test_same_entries(self):
+        rows = Lookup(self.db_path, use_docs=False)
+        ent_seqs = [1061830, 1170650, 1369900]
+        self.assertEqual([dump(e) for e in self.lookup.get_many(ent_seqs)],
+                         [dump(e) for e in rows.get_many(ent_seqs)])
+        rows.close()
+
+    def test_parallel(self):
+        """Documents are made the same way by the parsing processes."""
+        path = write_sample(self.dir, 'JMdict.xml', JMDICT_SAMPLE)
+        db_path = 'sqlite:///%s/parallel.sqlite' % self.dir
+        jmdict.fill_database(db_path, docs=True, processes=2, source=path)
+        conn = create_engine(db_path).connect()
+        docs = conn.execute('SELECT * FROM entry_doc ORDER BY 1').fetchall()
+        conn.close()
+        conn = create_engine(self.db_path).connect()
+        self.assertEqual(docs, conn.execute(
+            'SELECT * FROM entry_doc ORDER BY 1').fetchall())
+        conn.close()
+
+
+class TestPriorityOrder(unittest.TestCase):
+
+    def test_order(self):
+        directory = tempfile.mkdtemp()
+        try:
+            entries = ['<entry><ent_seq>%d</ent_seq><r_ele><reb>かくす</reb>'
+                       '%s</r_ele><sense><gloss>hide</gloss></sense>'
+                       '</entry>\n' % (ent_seq, pri)
+                       for ent_seq, pri in ((1, ''),
+                                            (2, '<re_pri>news1</re_pri>'),
+                                            (3, '<re_pri>nf20</re_pri>'))]
+            db_path = 'sqlite:///%s/jmdict.sqlite' % directory
+            jmdict.fill_database(db_path, source=write_jmdict(
+                directory, 'JMdict', entries))
+            lookup = Lookup(db_path)
+            self.assertEqual([e.ent_seq for e in lookup.by_reb('かくす')],
+                             [2, 3, 1])
+            self.assertEqual([e.ent_seq for e in
+                              lookup.get_many([1, 3, 2])], [1, 3, 2])
+            lookup.close()
+            conn = create_engine(db_path).connect()
+            self.assertEqual(fts.prefix_readings(conn, 'か'), [2, 3, 1])
+            self.assertEqual(fts.search_readings(conn, 'くす'), [2, 3, 1])
+            conn.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def build(self, name):
+        db_path = 'sqlite:///%s/%s.sqlite' % (self.dir, name)
+        jmdict.fill_database(db_path, source=write_sample(
+            self.dir, name, JMDICT_SAMPLE))
+        return db_path
+
+    def test_lru(self):
+        cache = LRUCache(max_items=2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        self.assertEqual(cache.get(1), 'a')
+        cache.put(3, 'c')
+        self.assertFalse(2 in cache)
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_max_bytes(self):
+        cache = LRUCache(max_items=None, max_bytes=3 * approximate_size('a'))
+        for i in range(10):
+            cache.put(i, 'a')
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 7)
+        self.assertTrue(cache.size <= cache.max_bytes)
+
+    def test_lookup(self):
+        cache = LRUCache()
+        lookup = Lookup(self.build('cached'), cache)
+        e = lookup.get(1170650)
+        self.assertTrue(lookup.get(1170650) is e)
+        self.assertEqual([e.ent_seq for e in
+                          lookup.get_many([1369900, 1170650, 1])],
+                         [1369900, 1170650])
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(len(cache), 2)
+        lookup.close()
+
+    def test_generation(self):
+        db_path = self.build('rebuilt')
+        cache = LRUCache()
+        lookup = Lookup(db_path, cache, check_every=0)
+        e = lookup.get(1170650)
+        generation = cache.generation
+        self.assertTrue(generation)
+        self.assertTrue(lookup.get(1170650) is e)
+
+        conn = create_engine(db_path).connect()
+        bulk.new_generation(conn, jmdict.build_info)
+        conn.close()
+        self.assertFalse(lookup.get(1170650) is e)
+        self.assertNotEqual(cache.generation, generation)
+        lookup.close()
+
+
+class TestKanjiLookup(unittest.TestCase):
+
+    def test_get(self):
+        directory = tempfile.mkdtemp()
+        try:
+            db_path = 'sqlite:///%s/kanjidic.sqlite' % directory
+            kanjidic.fill_database(db_path, source=write_sample(
+                directory, 'kanjidic2.xml', KANJIDIC2_SAMPLE))
+            lookup = KanjiLookup(db_path, LRUCache())
+            c = lookup.get('収')
+            self.assertEqual((c.literal, c.grade, c.freq, c.jlpt),
+                             ('収', 6, 785, 2))
+            self.assertEqual(c.stroke_count, [4, 5])
+            self.assertEqual(c.variant, [Variant('29-9', 'jis208')])
+            self.assertEqual(c.rad_value, [RadValue(29, 'classical'),
+                                           RadValue(2, 'nelson_c')])
+            self.assertEqual(c.reading[1],
+                             Reading('おさ.める', 'ja_kun', None, None))
+            self.assertEqual(c.meaning, [Meaning('income', 'en')])
+            c = lookup.get('今')
+            self.assertEqual(c.nanori, ['な'])
+            self.assertEqual(c.dic_ref[1],
+                             DicRef('422', 'moro', '1', '0604'))
+            self.assertTrue(lookup.get('今') is c)
+            self.assertEqual(lookup.get('x'), None)
+            lookup.close()
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from jdict2db import jmdict
+from .samples import write_jmdict
+
+
+def entry(i):
+    """
+    A made up entry whose number of elements depends on i, so the pks
+    every chunk starts from are all different.
+    """
+    parts = ['<entry><ent_seq>%d</ent_seq>' % (1000000 + i)]
+    for k in range(i % 3):
+        parts.append('<k_ele><keb>字%d_%d</keb><ke_pri>news%d</ke_pri>'
+                     '</k_ele>' % (i, k, k % 2 + 1))
+    for r in range(i % 2 + 1):
+        parts.append('<r_ele><reb>よみ%d_%d</reb><re_inf>ok</re_inf>'
+                     '</r_ele>' % (i, r))
+    if i % 5 == 0:
+        parts.append('<info><etym>etym %d</etym></info>' % i)
+    for s in range(i % 4 + 1):
+        parts.append('<sense><pos>n</pos><gloss>gloss %d %d</gloss>'
+                     '<gloss xml:lang="ger">Glosse %d</gloss></sense>'
+                     % (i, s, i))
+    parts.append('</entry>\n')
+    return ''.join(parts)
+
+
+class TestParallelParse(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.source = write_jmdict(cls.dir, 'JMdict',
+                                  [entry(i) for i in range(240)])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def dump(self, processes, source=None, name='jmdict'):
+        db_path = 'sqlite:///%s/%s%d.sqlite' % (self.dir, name, processes)
+        jmdict.fill_database(db_path, processes=processes,
+                             source=source or self.source, docs=True)
+        conn = create_engine(db_path).connect()
+        rows = dict((table.name, conn.execute(select([table])
+                                              .order_by(*table.primary_key))
+                     .fetchall())
+                    for table in jmdict.tables)
+        conn.close()
+        return rows
+
+    def test_chunks(self):
+        prolog, chunks = jmdict.split_chunks(self.source, 3 * 8)
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(sum(n for start, end, n, pks in chunks), 240)
+        #each chunk starts where the previous one ended, after its pks
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(previous[1], chunk[0])
+            for name in chunk[3]:
+                self.assertTrue(chunk[3][name] >= previous[3][name])
+        self.assertTrue(chunks[-1][3]['sense'] > 0)
+
+    def test_same_rows(self):
+        """Every table is the same whatever the number of processes."""
+        serial = self.dump(1)
+        self.assertEqual(len(serial['entry']), 240)
+        for processes in (2, 3):
+            parallel = self.dump(processes)
+            for name in serial:
+                self.assertEqual(parallel[name], serial[name], name)
+
+    def test_compressed(self):
+        """Gzipped files and file objects are parsed in parallel too."""
+        serial = self.dump(1, name='plain')
+        gz_path = self.source + '.gz'
+        with open(self.source, 'rb') as f:
+            data = f.read()
+        with gzip.open(gz_path, 'wb') as f:
+            f.write(data)
+        self.assertEqual(self.dump(2, gz_path, 'gz'), serial)
+        with open(gz_path, 'rb') as f:
+            self.assertEqual(self.dump(2, f, 'fileobj'), serial)
+
+    def test_no_doctype(self):
+        """Files without a DTD are split after their <JMdict> tag."""
+        path = os.path.join(self.dir, 'JMdict.nodtd')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<JMdict>\n%s'
+                    '</JMdict>\n' % ''.join(entry(i) for i in range(240)))
+        prolog, chunks = jmdict.split_chunks(path, 8)
+        self.assertTrue(prolog.endswith(b'<JMdict>\n'))
+        self.assertEqual(self.dump(2, path, 'nodtd'),
+                         self.dump(1, path, 'nodtd'))
+
+    def test_not_jmdict(self):
+        for text in ('<?xml version="1.0"?>\n<kanjidic2></kanjidic2>\n',
+                     '<JMdict>\n<entry><ent_seq>1</ent_seq></entry>\n',
+                     '<!DOCTYPE JMdict [\n]>\n<JMdict>\n</JMdict>\n'):
+            path = os.path.join(self.dir, 'broken')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.assertRaises(ValueError, jmdict.split_chunks, path, 8)
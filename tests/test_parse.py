@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import unittest
+from xml.etree.ElementTree import fromstring
+from jdict2db import bulk, jmdict, priority
+
+#An entry with every optional sub-element
+ENTRY = '''<entry><ent_seq>1000010</ent_seq>
+<k_ele><keb>明白</keb><ke_inf>ateji</ke_inf><ke_pri>news1</ke_pri></k_ele>
+<r_ele><reb>めいはく</reb><re_nokanji/><re_restr>明白</re_restr>
+<re_inf>ok</re_inf><re_pri>ichi1</re_pri></r_ele>
+<r_ele><reb>あからさま</reb></r_ele>
+<info><links><link_tag>wiki</link_tag><link_desc>Wikipedia</link_desc>
+<link_uri>http://example.org</link_uri></links>
+<bibl><bib_txt>a book</bib_txt></bibl><etym>old</etym>
+<audit><upd_date>2011-01-01</upd_date><upd_detl>Entry created</upd_detl></audit>
+</info>
+<sense><stagk>明白</stagk><stagr>めいはく</stagr><pos>adj-na</pos>
+<xref>明らか</xref><ant>曖昧</ant><field>math</field><misc>uk</misc>
+<s_inf>formal</s_inf>
+<lsource xml:lang="ger" ls_type="part" ls_wasei="y">Arbeit</lsource>
+<lsource/><dial>ksb</dial>
+<gloss xml:lang="fre" g_gend="fem">évidente</gloss><gloss>obvious</gloss>
+<example>明白な事実</example></sense>
+<sense><gloss>plain</gloss></sense>
+</entry>'''
+
+
+class TestParseEntry(unittest.TestCase):
+
+    def test_rows(self):
+        loader = jmdict.Loader()
+        elem = fromstring(ENTRY)
+        pks = jmdict.new_pks()
+        loader.parse_entry(elem, pks)
+        self.assertEqual(pks, {'k_ele': 1, 'r_ele': 2, 'info': 1,
+                               'sense': 2})
+        best = max(priority.score(['news1']), priority.score(['ichi1']))
+        expect = {
+            'entry': [('1000010', jmdict.entry_hash(elem), best)],
+            'k_ele': [('1000010', '明白', priority.score(['news1']))],
+            'ke_inf': [(1, 'ateji')],
+            'ke_pri': [(1, 'news1')],
+            'r_ele': [('1000010', 'めいはく', True,
+                       priority.score(['ichi1'])),
+                      ('1000010', 'あからさま', False, 0)],
+            're_restr': [(1, '明白')],
+            're_inf': [(1, 'ok')],
+            're_pri': [(1, 'ichi1')],
+            'info': [('1000010',)],
+            'links': [(1, 'wiki', 'Wikipedia', 'http://example.org')],
+            'bibl': [(1, None, 'a book')],
+            'etym': [(1, 'old')],
+            'audit': [(1, '2011-01-01', 'Entry created')],
+            'sense': [('1000010',), ('1000010',)],
+            'stagk': [(1, '明白')],
+            'stagr': [(1, 'めいはく')],
+            'pos': [(1, 'adj-na')],
+            'xref': [(1, '明らか')],
+            'ant': [(1, '曖昧')],
+            'field': [(1, 'math')],
+            'misc': [(1, 'uk')],
+            's_inf': [(1, 'formal')],
+            'lsource': [(1, 'Arbeit', 'ger', 'part', True),
+                        (1, None, 'eng', 'full', False)],
+            'dial': [(1, 'ksb')],
+            'gloss': [(1, 'évidente', 'fre', 'fem'),
+                      (1, 'obvious', 'eng', None),
+                      (2, 'plain', 'eng', None)],
+            'example': [(1, '明白な事実')],
+            'entry_doc': [],
+        }
+        for table_l, insert in loader.all_l:
+            table = insert.table
+            self.assertEqual(table_l, expect[table.name], table.name)
+            #one value per column the rows are inserted into
+            for row in table_l:
+                self.assertEqual(len(row), len(bulk.insert_columns(table)))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import os
+import shutil
+import tempfile
+import unittest
+from jdict2db import kanjidic, snapshot
+from jdict2db.lookup import Character, KanjiLookup, RadValue, Reading
+from .samples import KANJIDIC2_SAMPLE, write_sample
+
+
+class TestSnapshot(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.db_path = 'sqlite:///%s/kanjidic.sqlite' % cls.dir
+        cls.path = os.path.join(cls.dir, 'kanjidic.snapshot')
+        kanjidic.fill_database(cls.db_path, snapshot_path=cls.path,
+                               source=write_sample(cls.dir, 'kanjidic2.xml',
+                                                   KANJIDIC2_SAMPLE))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.snapshot = snapshot.Snapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+
+    def test_get(self):
+        c = self.snapshot.get('収')
+        self.assertEqual((c.literal, c.grade, c.freq, c.jlpt),
+                         ('収', 6, 785, 2))
+        self.assertEqual(c.stroke_count, [4, 5])
+        self.assertEqual(c.rad_value, [RadValue(29, 'classical'),
+                                       RadValue(2, 'nelson_c')])
+        self.assertEqual(c.reading[1],
+                         Reading('おさ.める', 'ja_kun', None, None))
+        self.assertEqual(self.snapshot.get('x'), None)
+        self.assertEqual(self.snapshot.get('収今'), None)
+        self.assertEqual(len(self.snapshot), 3)
+
+    def test_same_as_database(self):
+        lookup = KanjiLookup(self.db_path)
+        for literal in '今収隠':
+            expected = lookup.get(literal)
+            c = self.snapshot.get(literal)
+            for name in Character.__slots__:
+                self.assertEqual(getattr(c, name), getattr(expected, name),
+                                 (literal, name))
+        lookup.close()
+
+    def test_not_a_snapshot(self):
+        path = os.path.join(self.dir, 'empty')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 64)
+        self.assertRaises(ValueError, snapshot.Snapshot, path)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import tracemalloc
+from jdict2db.stream import iter_elements, open_source, uncompressed_file
+
+
+def make_jmdict(n_entries):
+    """A JMdict-like document with n_entries entries."""
+    entry = ('<entry><ent_seq>%d</ent_seq><k_ele><keb>隠す</keb>'
+             '<ke_pri>ichi1</ke_pri></k_ele><r_ele><reb>かくす</reb></r_ele>'
+             '<sense><pos>verb</pos><gloss>to hide</gloss>'
+             '<gloss>to conceal</gloss></sense></entry>\n')
+    body = ''.join(entry % (1000000 + i) for i in range(n_entries))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<JMdict>\n%s</JMdict>\n'
+            % body).encode('utf-8')
+
+def peak_memory(data, tag):
+    """Peak memory allocated while streaming through data."""
+    f = io.BytesIO(data)
+    tracemalloc.start()
+    try:
+        for elem in iter_elements(f, tag):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestIterElements(unittest.TestCase):
+
+    def test_elements(self):
+        f = io.BytesIO(make_jmdict(3))
+        seqs = []
+        for elem in iter_elements(f, 'entry'):
+            seqs.append(elem.find('ent_seq').text)
+            self.assertEqual(len(elem.findall('sense/gloss')), 2)
+        self.assertEqual(seqs, ['1000000', '1000001', '1000002'])
+
+    def test_constant_memory(self):
+        """Peak memory must not grow with the number of entries."""
+        small = make_jmdict(2000)
+        large = make_jmdict(16000)
+        small_peak = peak_memory(small, 'entry')
+        large_peak = peak_memory(large, 'entry')
+        self.assertTrue(large_peak < small_peak * 1.5,
+                        "Peak memory grew from %d to %d bytes" %
+                        (small_peak, large_peak))
+
+
+class TestOpenSource(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = make_jmdict(10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, source):
+        with open_source(source) as f:
+            self.assertEqual(len(list(iter_elements(f, 'entry'))), 10)
+
+    def test_paths(self):
+        path = os.path.join(self.dir, 'JMdict')
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        self.check(path)
+        with gzip.open(path + '.gz', 'wb') as f:
+            f.write(self.data)
+        self.check(path + '.gz')
+
+    def test_file_objects(self):
+        self.check(io.BytesIO(self.data))
+        compressed = io.BytesIO(gzip.compress(self.data))
+        self.check(compressed)
+        self.assertFalse(compressed.closed)
+        self.check(io.BufferedReader(io.BytesIO(gzip.compress(self.data))))
+
+    def test_uncompressed_file(self):
+        path = os.path.join(self.dir, 'JMdict')
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        with uncompressed_file(path) as copy:
+            self.assertEqual(copy, path)
+        with gzip.open(path + '.gz', 'wb') as f:
+            f.write(self.data)
+        for source in (path + '.gz', io.BytesIO(gzip.compress(self.data))):
+            with uncompressed_file(source) as copy:
+                with open(copy, 'rb') as f:
+                    self.assertEqual(f.read(), self.data)
+            self.assertFalse(os.path.exists(copy))
+        self.assertTrue(os.path.exists(path))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#Copyright (C) 2011 Houssam Salem <ntsp.gm@gmail.com>
+#License: GPLv3; http://www.gnu.org/licenses/gpl.txt
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+from jdict2db import jmdict, manifest
+from jdict2db.jmdict import entry, k_ele, r_ele, sense, gloss, build_info
+from jdict2db.lookup import Lookup
+from .samples import ENTRIES, write_jmdict
+
+class TestUpdateDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, entries):
+        return write_jmdict(self.dir, name, entries)
+
+    def contents(self, db_path):
+        """Every entry's kebs, rebs and glosses, independent of row ids."""
+        conn = create_engine(db_path).connect()
+        result = {}
+        for ent_seq, in conn.execute(select([entry.c.ent_seq])):
+            kebs = [r.keb for r in conn.execute(
+                select([k_ele], k_ele.c.entry_ent_seq==ent_seq)
+                .order_by(k_ele.c.id))]
+            rebs = [r.reb for r in conn.execute(
+                select([r_ele], r_ele.c.entry_ent_seq==ent_seq)
+                .order_by(r_ele.c.id))]
+            glosses = [r.gloss for r in conn.execute(
+                select([gloss], gloss.c.sense_id==sense.c.id)
+                .where(sense.c.entry_ent_seq==ent_seq)
+                .order_by(gloss.c.id))]
+            result[ent_seq] = (kebs, rebs, glosses)
+        conn.close()
+        return result
+
+    def generation(self, db_path):
+        conn = create_engine(db_path).connect()
+        generation = conn.execute(select([build_info.c.value])).scalar()
+        conn.close()
+        return generation
+
+    def test_update(self):
+        db_path = 'sqlite:///' + os.path.join(self.dir, 'jmdict.sqlite')
+        old = self.write('old', [ENTRIES[1000220], ENTRIES[1000225]])
+        jmdict.fill_database(db_path, source=old)
+        generation = self.generation(db_path)
+
+        changed = ENTRIES[1000220].replace('<gloss>clear</gloss>',
+                                           '<gloss>evident</gloss>')
+        new = self.write('new', [changed, ENTRIES[1000230]])
+        changes = jmdict.update_database(db_path, source=new)
+        self.assertEqual(changes, {'added': [1000230],
+                                   'modified': [1000220],
+                                   'removed': [1000225]})
+
+        fresh_path = 'sqlite:///' + os.path.join(self.dir, 'fresh.sqlite')
+        jmdict.fill_database(fresh_path, source=new)
+        self.assertEqual(self.contents(db_path), self.contents(fresh_path))
+        self.assertEqual(self.contents(db_path)[1000220][2],
+                         ['obvious', 'evident'])
+        self.assertNotEqual(self.generation(db_path), generation)
+
+        #nothing left to do the second time
+        generation = self.generation(db_path)
+        changes = jmdict.update_database(db_path, source=new)
+        self.assertEqual(changes, {'added': [], 'modified': [],
+                                   'removed': []})
+        self.assertEqual(self.generation(db_path), generation)
+
+    def test_docs(self):
+        """The entry_doc table is kept in step with the other tables."""
+        db_path = 'sqlite:///' + os.path.join(self.dir, 'jmdict.sqlite')
+        jmdict.fill_database(db_path, docs=True, source=self.write(
+            'old', [ENTRIES[1000220], ENTRIES[1000225]]))
+        changed = ENTRIES[1000220].replace('<gloss>clear</gloss>',
+                                           '<gloss>evident</gloss>')
+        jmdict.update_database(db_path, source=self.write(
+            'new', [changed, ENTRIES[1000230]]))
+        lookup = Lookup(db_path)
+        self.assertTrue(lookup.use_docs)
+        self.assertEqual(lookup.get(1000225), None)
+        self.assertEqual([g.gloss for g in lookup.get(1000220).sense[0].gloss],
+                         ['obvious', 'evident'])
+        self.assertEqual([r.reb for r in lookup.get(1000230).r_ele],
+                         ['あかん'])
+        lookup.close()
+
+    def test_manifest(self):
+        old_path = 'sqlite:///' + os.path.join(self.dir, 'old.sqlite')
+        new_path = 'sqlite:///' + os.path.join(self.dir, 'new.sqlite')
+        jmdict.fill_database(old_path, source=self.write(
+            'old', [ENTRIES[1000220], ENTRIES[1000225]]))
+        #only formatting changed in 1000225
+        jmdict.fill_database(new_path, source=self.write(
+            'new', [ENTRIES[1000225].replace('<sense>', '\n <sense>'),
+                    ENTRIES[1000230]]))
+        changes = manifest.diff_databases(old_path, new_path)
+        self.assertEqual(changes, {'added': [1000230], 'modified': [],
+                                   'removed': [1000220]})
+        f = io.StringIO()
+        manifest.write_manifest(changes, f)
+        f.seek(0)
+        self.assertEqual(manifest.read_manifest(f), changes)